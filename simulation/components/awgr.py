@@ -5,7 +5,8 @@ This file contains definitions for the AWGR Class
 used for the simulator
 """
 
-# from core.logger import logger
+import logging
+from core.logger import logger
 
 class AWGR:
     """Definition of the AWGR class which plays the role of a AWGR
@@ -41,6 +42,11 @@ class AWGR:
             # TODO: Throw exception
             pass
 
+    def reset(self):
+        """Clear all registered link failures
+        """
+        self.link_failure_ports.clear()
+
     def linkSpaceSwitches(self, spaceSwitches):
         """ Links the AWGR to its Space Switches
 
@@ -74,15 +80,18 @@ class AWGR:
             inPort (int): the port on which packet is being received
             pkt (Packet): the packet to be received
         """
-        logger.info(f"[Packet {pkt.pktId}] : Reached Stage {self.stage} AWGR with ID = {self.awgrId}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Packet %s] : Reached Stage %s AWGR with ID = %s", pkt.pktId, self.stage, self.awgrId)
         outPort = int((inPort + pkt.wavelength) % self.n)
 
         if self.link_status(outPort):
             self.sendPacket(outPort, pkt)
         else:
-            logger.info(f"[Packet {pkt.pktId}] : Being dropped at Stage {self.stage} AWGR with ID = {self.awgrId}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("[Packet %s] : Being dropped at Stage %s AWGR with ID = %s", pkt.pktId,
+                            self.stage, self.awgrId)
             self.network.linkDrop += 1
-            pass
+            self.network.counters.link_drops[self.stage // 3, self.awgrId, outPort] += 1
 
     def sendPacket(self, outPort, pkt):
         """Forward the packet to the its respective output 
@@ -5,9 +5,14 @@ This file contains definitions for the Space Switch Class
 used for the simulator
 """
 
+import logging
 import core.matcher as mtchr
+import components.event_generator as ev_gen
+import numpy as np
 import random
-from core.packet import generate_hello_packet
+from concurrent.futures import ProcessPoolExecutor
+from core.packet import Packet, generate_hello_packet
+from core.spillQueue import SpillQueue
 
 # Standard Logging
 from core.logger import logger
@@ -20,17 +25,77 @@ PREV_EXAMINE_SLOTS = 10
 
 RECEIVE_THRESHOLD = 10
 ANOMALY_THRESHOLD = 10
+# Fraction of AWGR pairs with requests above which the dense matcher is used. The
+# sparse matcher breaks ties differently, so it is opt-in, e.g. with 0.25, and -1
+# always uses the dense matcher
+DENSE_THRESHOLD = -1
 
-class LinkTracking:
-    """Sets of Space Switch Links used for Fault Tracking
+# Position of the Stage 1-2 and Stage 2-3 links in the link state matrices, which are
+# indexed [STAGE_ONE, awgr, spaceSwitch] and [STAGE_THREE, spaceSwitch, awgr]
+STAGE_ONE = 0
+STAGE_THREE = 1
+
+def link_index(link):
+    """ Returns the position of a link in the link state matrices
+
+    Args:
+        link (tuple): link of the form (1, awgr, spaceSwitch) or (3, spaceSwitch, awgr)
+
+    Returns:
+        (int, int, int) : the index of the link
+    """
+    stage, a, b = link
+    return (STAGE_ONE if stage == 1 else STAGE_THREE, int(a), int(b))
+
+def last_occurrences(keys):
+    """ Returns the positions of the last occurrence of every distinct key
+
+    Args:
+        keys (int[]): the keys
+
+    Returns:
+        int[] : positions into keys
+    """
+    values, first = np.unique(keys[::-1], return_index=True)
+    return len(keys) - 1 - first
+
+def solve_requests(n, requests, dense_threshold=DENSE_THRESHOLD):
+    """ Compute the best bipartite matching for the requests of a single Space Switch.
+    Sparse requests are matched over the requested AWGR pairs only, while the dense
+    request matrix is solved once its density crosses dense_threshold. Kept at module
+    level and given only the requests, so that little has to be shipped to worker
+    processes.
 
     Args:
         n (int): The n parameter of the network
+        requests (dict): requested connections of the form "(srcAWGR, destAWGR): count"
+        dense_threshold (float): density above which the dense matcher is used
+
+    Returns:
+        int[] : the matching, where matching[i] is the AWGR connected to AWGR i,
+            or -1 if AWGR i is not connected
     """
+    if len(requests) / (n * n) > dense_threshold:
+        reqMat = [[0] * n for i in range(n)]
+        for (gSrc, gDest), count in requests.items():
+            reqMat[gSrc][gDest] = count
+        val, matching = mtchr.Matcher(reqMat).solve()
+    else:
+        val, matching = mtchr.SparseMatcher(n, requests).solve()
+    return matching
+
+def solve_matching(data, dense_threshold=DENSE_THRESHOLD):
+    """ Compute the best bipartite matching for the slot data of a single Space Switch,
+    see solve_requests.
 
-    def __init__(self, n):
-        self.stageOneLinks = [set() for i in range(n)]
-        self.stageThreeLinks = [set() for i in range(n)]
+    Args:
+        data (StateData): the slot data of the Space Switch
+        dense_threshold (float): density above which the dense matcher is used
+
+    Returns:
+        int[] : the matching
+    """
+    return solve_requests(data.n, data.requests, dense_threshold)
 
 class Controller:
     """Definition for the main controller component of the network. Main jobs 
@@ -45,30 +110,77 @@ class Controller:
     def __init__(self, n, slot, hello_int, network=None):
         self.n = n
         self.slot = slot
+        self.hello_interval =  hello_int
+        # Records the efficiency of the matching of every slot, see SchedulerTelemetry
+        self.telemetry = None
+        # Max. no. of packets held in the queue of a Space Switch, None for no limit.
+        # Packets beyond it are refused with the "drop" policy, and kept in a SpillQueue
+        # on disk with the "spill" policy
+        self.queue_limit = None
+        self.queue_policy = "drop"
+        # Directory of the files of the spill queues, None for the temporary directory
+        self.spill_directory = None
+        self.spills = {}
+        self.reset()
+
+        # 0 - for ResiConnect and 1 - for NNT, set to ResiConnect by default
+        self.reroute_flag = 0
+        # Matching algorithm used to schedule the Space Switches, "hungarian" solves
+        # each switch separately, "batched" solves all of them in one pass and "islip"
+        # uses iterative round-robin matching instead of a maximum weight matching
+        self.scheduler = "hungarian"
+        # No. of iterations per slot of the "islip" scheduler
+        self.islip_iterations = 4
+        # Density of requests above which a Space Switch is matched with the dense matcher
+        self.dense_threshold = DENSE_THRESHOLD
+        # No. of worker processes solving the Space Switch matchings of a slot
+        # concurrently, 1 solves them serially. The matchers hold the GIL, so only
+        # processes on a multi-core host can gain anything
+        self.match_workers = 1
+        self.match_executor = None
+        if network is not None:
+            self.network = network
+
+    def reset(self):
+        """ Clear all scheduling and fault tracking state, returning the controller
+        to the state it was constructed in. Configuration such as the hello interval,
+        reroute flag and scheduler is kept.
+        """
+        n = self.n
         # Tracks the current time slot running
         self.current_slot = None
-        # Set of failed links of the form (1, awgr, spaceSwitch) or (3, spaceSwitch, awgr)
-        self.failed_links = set()
+        # Link state matrices, see STAGE_ONE and STAGE_THREE
+        # Links declared as failed
+        self.failed = np.zeros((2, n, n), dtype=bool)
+        # Routes over a failed link, indexed [srcAWGR, spaceSwitch, destAWGR]
+        self.failed_routes = np.zeros((n, n, n), dtype=bool)
+        # Incremented whenever a link failure is registered
+        self.failed_version = 0
+        # No. of anomalies (expired Hello Packets) per link since its last received Hello Packet
+        self.anomalies = np.zeros((2, n, n), dtype=np.int64)
+        # Interval in slots at which every link is probed by Hello Packets, 0 for failed links
+        self.hello_class = np.full((2, n, n), self.hello_interval, dtype=np.int64)
         # Used to track calculated ratios 
         self.alternate_routes = {}
         # List of pending Hello Packets yet to be received
         self.pending_hello_pkts = {}
-        # Tracks the number of anomalies per link, dictionary of the form "link: anomalyCount"
-        self.anomaly_count = {}
         # Counter to track no.of Hello Packets, and also assign them ids
         self.hello_ctr = 1
-        self.hello_interval =  hello_int
-        # Track links and their hello frequencies as the controller modifies them
-        self.fault_freq = {}
+        # Total no. of packets queued at the space switches, and the IDs of
+        # the space switches with a non-empty queue
+        self.backlog = 0
+        self.active_switches = set()
+        # Spill queues of the space switches, created when their queue first overflows
+        for spill in self.spills.values():
+            spill.close()
+        self.spills = {}
+        # iSLIP matchers of the space switches, holding their round-robin pointers
+        self.islip = {}
+        if self.telemetry is not None:
+            self.telemetry.reset()
         # Track what Stage 1-2 and Stage 2-3 link pairs were made and ensure they're not repeated 
         # consecutively
         self.previous_link_pair = []
-        for i in range(self.hello_interval + 1):
-            self.fault_freq[i] = LinkTracking(n)
-        init = self.fault_freq[self.hello_interval] 
-        for i in range(self.n):
-            init.stageOneLinks[i].update([i for i in range(n)])
-            init.stageThreeLinks[i].update([i for i in range(n)])
 
         # Initialize previous link pairs to -1, updates as the simulation goes
         for i in range(self.n):
@@ -77,12 +189,6 @@ class Controller:
                 x.append(-1)
             self.previous_link_pair.append(x)
 
-
-        # 0 - for ResiConnect and 1 - for NNT, set to ResiConnect by default
-        self.reroute_flag = 0
-        if network is not None:
-            self.network = network
-
     def event_trigger(self, ev):
         """ Response function to handle special trigger events. Initiates the proper
         response depending on the event.
@@ -90,21 +196,47 @@ class Controller:
         Args:
             ev(Event): the special trigger event
         """
-        if ev.category == "timeslot-end":
-            logger.info(f"[Timeslot {ev.slot_no}] : Timeslot ENDING....")
-            self.fault_tracking(self.current_slot)
-            self.allotSlots(ev.slot_no)
-            logger.info(f"[Timeslot {ev.slot_no}] : Timeslot ENDED, Next Timeslot STARTING...")
-        elif ev.category == "eventset-end":
-            self.clearQueue(self.current_slot)
+        if ev.kind == ev_gen.TIMESLOT_END:
+            self.timeslot_end(ev.slot_no)
+        elif ev.kind == ev_gen.EVENTSET_END:
+            self.eventset_end()
+
+    def timeslot_end(self, slot_no):
+        """ Track faults and schedule the queued packets at the end of a time slot
+
+        Args:
+            slot_no (int): the number of the time slot that has just ended
+        """
+        logger.info("[Timeslot %s] : Timeslot ENDING....", slot_no)
+        self.fault_tracking(self.current_slot)
+        self.allotSlots(slot_no)
+        logger.info("[Timeslot %s] : Timeslot ENDED, Next Timeslot STARTING...", slot_no)
+
+    def eventset_end(self):
+        """ Schedule all remaining packets once the arrivals have ended
+        """
+        self.clearQueue(self.current_slot)
+
+    @property
+    def failed_links(self):
+        """ The set of failed links of the form (1, awgr, spaceSwitch) or (3, spaceSwitch, awgr)
+        """
+        stageOne = np.argwhere(self.failed[STAGE_ONE]).tolist()
+        stageThree = np.argwhere(self.failed[STAGE_THREE]).tolist()
+        return set([(1, a, b) for a, b in stageOne] + [(3, a, b) for a, b in stageThree])
 
     def register_link_failure(self, link):
-        """ Add an entry to the set of failed links in the network
+        """ Mark a link of the network as failed
 
         Args:
-            link (tuple): tuple of the form (awgrId, failed_port) of the failed link
+            link (tuple): link of the form (1, awgr, spaceSwitch) or (3, spaceSwitch, awgr)
         """
-        self.failed_links.add(link)
+        index = link_index(link)
+        if not self.failed[index]:
+            self.failed[index] = True
+            self.failed_routes = (self.failed[STAGE_ONE][:, :, None]
+                                  | self.failed[STAGE_THREE][None, :, :])
+            self.failed_version += 1
 
     def compute_routes(self, awgr_id):
         """ Compute the Average activities for all transmitters linked to an AWGR
@@ -115,13 +247,14 @@ class Controller:
         Returns:
             int[] : average activity of all transmitters connected to awgr
         """
+        counts = self.network.transmitters.transmissionCounts(awgr_id * self.n,
+                    (awgr_id + 1) * self.n, self.current_slot, PREV_EXAMINE_SLOTS)
         ret = []
         for alt in range(self.n):
-            trnsmtr = self.network.transmitters[awgr_id * self.n + alt]
-            avg_usage = trnsmtr.transmissionCount(self.current_slot, PREV_EXAMINE_SLOTS) / PREV_EXAMINE_SLOTS
+            avg_usage = int(counts[alt]) / PREV_EXAMINE_SLOTS
             ret.append(MAX_TRANSMISSION_COUNT * self.n - avg_usage)
         self.alternate_routes[awgr_id] = {}
-        self.alternate_routes[awgr_id]["last_update"] = self.failed_links
+        self.alternate_routes[awgr_id]["last_update"] = self.failed_version
         self.alternate_routes[awgr_id]["routes"] = ret
 
         return ret
@@ -143,7 +276,7 @@ class Controller:
         if (pkt.src // self.n) in self.alternate_routes:
             last_upd = self.alternate_routes[(pkt.src // self.n)]["last_update"]
             alts = self.alternate_routes[(pkt.src // self.n)]["routes"]
-            if last_upd != self.failed_links:
+            if last_upd != self.failed_version:
                 alts = self.compute_routes((pkt.src // self.n))
         else:
             alts = self.compute_routes((pkt.src // self.n))
@@ -208,9 +341,8 @@ class Controller:
         """
         random.shuffle(a)
         random.shuffle(b)
-        n_arr = [i for i in range(self.n)]
-        a_choices = [i for i in n_arr if i not in list(self.fault_freq[0].stageOneLinks[sId])]
-        b_choices = [i for i in n_arr if i not in list(self.fault_freq[0].stageThreeLinks[sId])]
+        a_choices = np.flatnonzero(self.hello_class[STAGE_ONE, :, sId]).tolist()
+        b_choices = np.flatnonzero(self.hello_class[STAGE_THREE, sId]).tolist()
         while len(a) != len(b):
             if len(a) < len(b):
                 a.append(random.choice(a_choices))
@@ -241,61 +373,30 @@ class Controller:
         Args:
             current_slot (int): The value of the current time-slot.
         """
-        for pkt in list(self.pending_hello_pkts):
-            pkt_info = self.pending_hello_pkts[pkt]
-            freq = pkt_info["freq"]
-            fault_declared = False
-            pre_failed_link = False
-            # Check if Hello Packet expired
-            if current_slot > pkt_info["dispatch_slot"] + RECEIVE_THRESHOLD:
-                freqLinks = self.fault_freq[freq]
-                sId = pkt_info["space_switch_id"]
-                fault_links = [(1, pkt_info["in_link"], pkt_info["space_switch_id"]), (3, pkt_info["space_switch_id"], pkt_info["out_link"])]
-                # Check if this link has already been declared faulty
-                for link in fault_links:
-                    if link in self.failed_links:
-                        pre_failed_link = True
-                if not pre_failed_link:
-                    # Record as an anomaly
-                    for link in fault_links:
-                        if link in self.anomaly_count:
-                            self.anomaly_count[link] += 1
-                            # If above anomaly threshold, then mark as link fault
-                            if self.anomaly_count[link] >= ANOMALY_THRESHOLD:
-                                fault_decalred = True
-                                self.fault_found_at = self.slot * current_slot
-                                failedLinks = self.fault_freq[0]
-                                if link[0] == 1:
-                                    freqLinks.stageOneLinks[sId].discard(pkt_info["in_link"])
-                                    failedLinks.stageOneLinks[sId].add(pkt_info["in_link"])
-                                elif link[0] == 3:
-                                    freqLinks.stageThreeLinks[sId].discard(pkt_info["out_link"])
-                                    failedLinks.stageThreeLinks[sId].add(pkt_info["out_link"])
-                                self.register_link_failure(link)
-                                if len(self.failed_links) > self.network.event_generator.link_fail_count:
-                                    raise Exception("Detected additional link faults")
-                        else:
-                            self.anomaly_count[link] = 1
-                    if freq > 1 and not fault_declared:
-                        # If anomaly, but not above Anomaly Threshold, then 
-                        # increase freq of Hello Packets
-                        freqLinks.stageOneLinks[sId].discard(pkt_info["in_link"])
-                        freqLinks.stageThreeLinks[sId].discard(pkt_info["out_link"])
-                        incFreq = freq - 1
-                        incFreqLinks  = self.fault_freq[incFreq]
-                        incFreqLinks.stageOneLinks[sId].add(pkt_info["in_link"])
-                        incFreqLinks.stageThreeLinks[sId].add(pkt_info["out_link"])
-
-                del self.pending_hello_pkts[pkt]
+        expired = []
+        for hello_id, pkt_info in self.pending_hello_pkts.items():
+            # Hello Packets are pending in order of dispatch, so the expired ones come first
+            if current_slot <= pkt_info["dispatch_slot"] + RECEIVE_THRESHOLD:
+                break
+            expired.append(hello_id)
+        if expired:
+            self.record_anomalies([self.pending_hello_pkts.pop(hello_id) for hello_id in expired],
+                                  current_slot)
 
         # Schedule Hello Packets
-        for freq in self.fault_freq.keys():
-            if freq > 0 and current_slot % freq == 0:
-                links = self.fault_freq[freq]
+        for freq in range(1, self.hello_interval + 1):
+            if current_slot % freq == 0:
+                stageOne = self.hello_class[STAGE_ONE] == freq
+                stageThree = self.hello_class[STAGE_THREE] == freq
                 # At every space swtich, generate pairs of links and send a hello packet
                 # along that pair of links
                 for i in range(self.n):
-                    in_links, out_links = self.get_permutations(i, list(links.stageOneLinks[i]), list(links.stageThreeLinks[i]))
+                    in_links = np.flatnonzero(stageOne[:, i]).tolist()
+                    out_links = np.flatnonzero(stageThree[i]).tolist()
+                    if len(in_links) == 0 and len(out_links) == 0:
+                        # No links of this switch are probed at this frequency
+                        continue
+                    in_links, out_links = self.get_permutations(i, in_links, out_links)
                     for j in range(len(in_links)):
                         in_link = in_links[j]
                         out_link = out_links[j]
@@ -309,7 +410,79 @@ class Controller:
                         hpkt = generate_hello_packet(self.hello_ctr, src, wv, dest, self.slot * current_slot)
                         self.hello_ctr += 1
                         self.pending_hello_pkts[hpkt.pktId] = {"freq": freq, "space_switch_id": i, "in_link": in_link, "out_link": out_link, "dispatch_slot": current_slot}
-                        self.network.spaceSwitches[i].queue.insert(0, hpkt)
+                        self.network.counters.hellos_sent[i] += 1
+                        self.queue_packet(i, hpkt, front=True)
+
+    def record_anomalies(self, expired, current_slot):
+        """ Record an anomaly on both links of every expired Hello Packet, at once
+        for the whole slot. Links that are anomalous but not declared as failed
+        are probed more frequently.
+
+        Slots in which a link reaches the anomaly threshold are handled one Hello
+        Packet at a time by record_anomaly, as a fault declared by one Hello Packet
+        changes how the next ones are treated.
+
+        Args:
+            expired (dict[]): info of the expired Hello Packets, in order of dispatch
+            current_slot (int): The value of the current time-slot.
+        """
+        sIds = np.array([pkt_info["space_switch_id"] for pkt_info in expired])
+        in_links = np.array([pkt_info["in_link"] for pkt_info in expired])
+        out_links = np.array([pkt_info["out_link"] for pkt_info in expired])
+        freqs = np.array([pkt_info["freq"] for pkt_info in expired])
+        np.add.at(self.network.counters.hellos_expired, sIds, 1)
+        # Hello Packets over a link that has already been declared faulty are ignored
+        live = ~(self.failed[STAGE_ONE, in_links, sIds] | self.failed[STAGE_THREE, sIds, out_links])
+        hits = np.zeros_like(self.anomalies)
+        np.add.at(hits[STAGE_ONE], (in_links[live], sIds[live]), 1)
+        np.add.at(hits[STAGE_THREE], (sIds[live], out_links[live]), 1)
+        if np.any((hits > 0) & (self.anomalies + hits >= ANOMALY_THRESHOLD)):
+            for pkt_info in expired:
+                self.record_anomaly(pkt_info, current_slot)
+            return
+        self.anomalies += hits
+
+        # Increase the freq of Hello Packets, later Hello Packets of a link take precedence
+        step = np.flatnonzero(live & (freqs > 1))
+        for stage, a, b in ((STAGE_ONE, in_links[step], sIds[step]),
+                            (STAGE_THREE, sIds[step], out_links[step])):
+            last = last_occurrences(a * self.n + b)
+            self.hello_class[stage, a[last], b[last]] = freqs[step][last] - 1
+
+    def record_anomaly(self, pkt_info, current_slot):
+        """ Record an anomaly on both links of an expired Hello Packet. A link that
+        reaches the anomaly threshold is declared as failed, otherwise the links are
+        probed more frequently.
+
+        Args:
+            pkt_info (dict): info of the expired Hello Packet
+            current_slot (int): The value of the current time-slot.
+        """
+        freq = pkt_info["freq"]
+        sId = pkt_info["space_switch_id"]
+        in_link = pkt_info["in_link"]
+        out_link = pkt_info["out_link"]
+        fault_links = [(1, in_link, sId), (3, sId, out_link)]
+        # Check if this link has already been declared faulty
+        if any(self.failed[link_index(link)] for link in fault_links):
+            return
+        fault_declared = False
+        for link in fault_links:
+            index = link_index(link)
+            self.anomalies[index] += 1
+            # If above anomaly threshold, then mark as link fault
+            if self.anomalies[index] >= ANOMALY_THRESHOLD:
+                fault_declared = True
+                self.fault_found_at = self.slot * current_slot
+                self.hello_class[index] = 0
+                self.register_link_failure(link)
+                if np.count_nonzero(self.failed) > self.network.event_generator.link_fail_count:
+                    raise Exception("Detected additional link faults")
+        if freq > 1 and not fault_declared:
+            # If anomaly, but not above Anomaly Threshold, then 
+            # increase freq of Hello Packets
+            self.hello_class[STAGE_ONE, in_link, sId] = freq - 1
+            self.hello_class[STAGE_THREE, sId, out_link] = freq - 1
 
     def received_hello(self, hello_id):
         """ Registers the receival of a hello packet by one of the receivers.
@@ -318,30 +491,50 @@ class Controller:
         Args:
             hello_id (int): the id of the hello packet
         """
-        logger.debug(f"Received Hello Packet : {hello_id}")
-        if hello_id in list(self.pending_hello_pkts):
-            pkt_info = self.pending_hello_pkts[hello_id]
-            freq = pkt_info["freq"]
-            # if hello freq was increased, decrease it after anomalous behavior is no longer observed
-            if freq < self.hello_interval:
-                freqLinks = self.fault_freq[freq]
-                sId = pkt_info["space_switch_id"]
-                freqLinks.stageOneLinks[sId].discard(pkt_info["in_link"])
-                freqLinks.stageThreeLinks[sId].discard(pkt_info["out_link"])
-                decFreq = freq + 1
-                decFreqLinks  = self.fault_freq[decFreq]
-                decFreqLinks.stageOneLinks[sId].add(pkt_info["in_link"])
-                decFreqLinks.stageThreeLinks[sId].add(pkt_info["in_link"])
-            del self.pending_hello_pkts[hello_id]
-            fault_links = [(1, pkt_info["in_link"], pkt_info["space_switch_id"]), (3, pkt_info["space_switch_id"], pkt_info["out_link"])]
-            # Reset anomaly counter for the link
-            for link in fault_links:
-                if link in self.anomaly_count:
-                    del self.anomaly_count[link]
-        else:
-            logger.info(f"Past threshold arrival of Hello Packet : {hello_id}")
-            pass
+        logger.debug("Received Hello Packet : %s", hello_id)
+        pkt_info = self.pending_hello_pkts.pop(hello_id, None)
+        if pkt_info is None:
+            logger.info("Past threshold arrival of Hello Packet : %s", hello_id)
+            return
+        freq = pkt_info["freq"]
+        sId = pkt_info["space_switch_id"]
+        self.network.counters.hellos_received[sId] += 1
+        stageOne = (STAGE_ONE, pkt_info["in_link"], sId)
+        stageThree = (STAGE_THREE, sId, pkt_info["out_link"])
+        # if hello freq was increased, decrease it after anomalous behavior is no longer observed
+        if freq < self.hello_interval:
+            for index in (stageOne, stageThree):
+                if not self.failed[index]:
+                    self.hello_class[index] = freq + 1
+        # Reset anomaly counter for the link
+        self.anomalies[stageOne] = 0
+        self.anomalies[stageThree] = 0
+
+    def received_hellos(self, hello_ids):
+        """ Registers the receival of several hello packets at once, with the same
+        outcome as calling received_hello for each of them in order.
 
+        Args:
+            hello_ids (int[]): the ids of the hello packets
+        """
+        infos = [self.pending_hello_pkts.pop(hello_id, None) for hello_id in hello_ids]
+        infos = [pkt_info for pkt_info in infos if pkt_info is not None]
+        if len(infos) == 0:
+            return
+        sIds = np.array([pkt_info["space_switch_id"] for pkt_info in infos])
+        in_links = np.array([pkt_info["in_link"] for pkt_info in infos])
+        out_links = np.array([pkt_info["out_link"] for pkt_info in infos])
+        freqs = np.array([pkt_info["freq"] for pkt_info in infos])
+        np.add.at(self.network.counters.hellos_received, sIds, 1)
+        step = np.flatnonzero(freqs < self.hello_interval)
+        for stage, a, b in ((STAGE_ONE, in_links[step], sIds[step]),
+                            (STAGE_THREE, sIds[step], out_links[step])):
+            last = last_occurrences(a * self.n + b)
+            a, b, freq = a[last], b[last], freqs[step][last]
+            working = ~self.failed[stage, a, b]
+            self.hello_class[stage, a[working], b[working]] = freq[working] + 1
+        self.anomalies[STAGE_ONE, in_links, sIds] = 0
+        self.anomalies[STAGE_THREE, sIds, out_links] = 0
 
     def enqueue_scheduler(self, pkt):
         """Schedules the transmission of a packet by assinging a suitable
@@ -364,13 +557,13 @@ class Controller:
             pkt.wavelength = ((self.n + mDest - mSrc) / 2 ) % self.n
 
         if (mDest + mSrc) % 2 == 0:
-            sSwitchId = ((mDest + mSrc) / 2) % self.n
+            sSwitchId = ((mDest + mSrc) // 2) % self.n
         else:
-            sSwitchId = ((mDest + mSrc + self.n) / 2) % self.n
+            sSwitchId = ((mDest + mSrc + self.n) // 2) % self.n
 
-        sSwitch = self.network.spaceSwitches[int(sSwitchId)]
-        if tuple([1, (pkt.src // self.n), sSwitchId]) in self.failed_links or tuple([3, sSwitchId,(pkt.dest // self.n)]) in self.failed_links:
+        if self.failed_routes[pkt.src // self.n, sSwitchId, pkt.dest // self.n]:
             pkt.failed_transmitters.append(pkt.src)
+            self.network.counters.reroutes[pkt.src] += 1
             if self.reroute_flag == 0:
                 pkt.src = self.get_alternate_transmitter(pkt)
             elif self.reroute_flag == 1:
@@ -378,9 +571,145 @@ class Controller:
 
             pkt.miscDelay += 1200
             self.network.transmitters[pkt.src].receive(pkt)
-            logger.info(f"[Packet {pkt.pktId}] : Being re-routed through Transmitter {pkt.src}....")
+            logger.info("[Packet %s] : Being re-routed through Transmitter %s....", pkt.pktId, pkt.src)
+        else:
+            self.queue_packet(sSwitchId, pkt)
+
+    def queue_packet(self, sId, pkt, front=False):
+        """ Add a packet to the queue of a space switch, keeping track of the
+        backlog and of which space switches have work
+
+        Args:
+            sId (int): ID of the space switch
+            pkt (Packet): the packet to be queued
+            front (bool): queue the packet ahead of all others, defaults to False
+        """
+        sSwitch = self.network.spaceSwitches[sId]
+        if front:
+            sSwitch.queue.insert(0, pkt)
+        elif self.queue_limit is not None and (len(sSwitch.queue) >= self.queue_limit or sId in self.spills):
+            # Hello Packets are always queued, data packets beyond the limit overflow
+            if self.queue_policy == "spill":
+                self.spill_packet(sId, pkt)
+            else:
+                self.refuse_packet(sId, pkt)
+                return
         else:
             sSwitch.queue.append(pkt)
+        self.backlog += 1
+        self.active_switches.add(sId)
+
+    def refuse_packet(self, sId, pkt):
+        """ Refuse a packet for a full Space Switch queue. The switch pushes back
+        on the transmitter, which drops the packet and frees its buffer space,
+        so the drop is counted as an overflow drop of the transmitter.
+
+        Args:
+            sId (int): ID of the space switch
+            pkt (Packet): the refused packet
+        """
+        logger.info("[Packet %s] : Dropped, queue of Space Switch %s is full", pkt.pktId, sId)
+        network = self.network
+        network.transmitters.bufferCount[pkt.src] -= 1
+        network.overflowDrop += 1
+        network.counters.overflow_drops[pkt.src] += 1
+        network.counters.queue_drops[sId] += 1
+
+    def spill_packet(self, sId, pkt):
+        """ Add a packet to the spill queue of a Space Switch, behind all the
+        packets already spilled. Only the fields needed to schedule and deliver
+        the packet are kept, queued packets are never re-routed.
+
+        Args:
+            sId (int): ID of the space switch
+            pkt (Packet): the packet
+        """
+        if sId not in self.spills:
+            self.spills[sId] = SpillQueue(self.spill_directory)
+        self.spills[sId].push((pkt.pktId, pkt.src, pkt.dest, pkt.arrivalTime, pkt.miscDelay,
+                               pkt.wavelength))
+        self.network.counters.spilled[sId] += 1
+
+    def refill_queue(self, sId):
+        """ Move spilled packets back into the queue of a Space Switch, oldest
+        first, up to the queue limit. The spill queue is closed once empty.
+
+        Args:
+            sId (int): ID of the space switch
+        """
+        spill = self.spills[sId]
+        queue = self.network.spaceSwitches[sId].queue
+        for pktId, src, dest, arrivalTime, miscDelay, wavelength in spill.pop(self.queue_limit - len(queue)):
+            pkt = Packet(pktId, src, dest, arrivalTime)
+            pkt.miscDelay = miscDelay
+            pkt.wavelength = wavelength
+            queue.append(pkt)
+        if len(spill) == 0:
+            spill.close()
+            del self.spills[sId]
+
+    def queue_depths(self):
+        """ Returns the no. of packets queued at each Space Switch, in memory and spilled
+        """
+        depths = [len(sSwitch.queue) for sSwitch in self.network.spaceSwitches]
+        for sId, spill in self.spills.items():
+            depths[sId] += len(spill)
+        return depths
+
+    def get_match_executor(self):
+        """ Return the persistent process pool used to solve matchings concurrently,
+        creating it on first use.
+
+        Returns:
+            ProcessPoolExecutor : the pool
+        """
+        if self.match_executor is None:
+            self.match_executor = ProcessPoolExecutor(max_workers=self.match_workers)
+        return self.match_executor
+
+    def shutdown_matchers(self):
+        """ Shut down the matching pool, if one was started
+        """
+        if self.match_executor is not None:
+            self.match_executor.shutdown()
+            self.match_executor = None
+
+    def compute_matchings(self, slotData, switchIds=None):
+        """ Solve the matchings of several Space Switches for the same time slot.
+        The "batched" scheduler solves the whole stack of request matrices in one
+        vectorized pass, and the "islip" scheduler runs iSLIP with the round-robin
+        pointers of each switch. Otherwise the switches are solved separately, and with
+        match_workers > 1 concurrently in worker processes. Results are always returned
+        in the order of the slot data, which keeps the output identical to the serial mode.
+
+        Args:
+            slotData (StateData[]): slot data, one per Space Switch
+            switchIds (int[]): IDs of the Space Switches, defaults to None which
+                means all of them in order
+
+        Returns:
+            int[][] : the matchings, in the same order as slotData
+        """
+        if self.scheduler == "batched":
+            sums, matchings = mtchr.BatchMatcher([data.reqMat for data in slotData]).solve()
+            return matchings
+        if self.scheduler == "islip":
+            if switchIds is None:
+                switchIds = range(len(slotData))
+            matchings = []
+            for sId, data in zip(switchIds, slotData):
+                if sId not in self.islip:
+                    self.islip[sId] = mtchr.ISLIPMatcher(self.n, self.islip_iterations)
+                val, matching = self.islip[sId].solve(data.requestArray())
+                matchings.append(matching)
+            return matchings
+        if self.match_workers > 1 and len(slotData) > 1:
+            # Only the requests are sent, in one batch per worker per slot
+            count = len(slotData)
+            return list(self.get_match_executor().map(
+                solve_requests, [self.n] * count, [data.requests for data in slotData],
+                [self.dense_threshold] * count, chunksize=-(-count // self.match_workers)))
+        return [solve_matching(data, self.dense_threshold) for data in slotData]
 
     def allotSlots(self, slotNumber):
         """When a time slot expires, send dispatch messages for all 
@@ -390,19 +719,35 @@ class Controller:
             slotNumber (int): The time slot for which dispatching
                 is being done
         """
-        for i in range(self.n):
-            # for each space switch in the given slot
+        network = self.network
+        # Buffers and queues only shrink when packets are dispatched, they peak now
+        network.counters.sample_high_water(network.transmitters.bufferCount, self.queue_depths())
+        # generate a traffic matrix for each space switch in the given slot.
+        # Dispatching never modifies the queues, so all of them can be built up front
+        # Idle switches with empty queues have nothing to schedule and are skipped
+        active = sorted(self.active_switches)
+        slotData = []
+        for i in active:
             sSwitch = self.network.spaceSwitches[i]
             data = sSwitch.getSlotData(slotNumber)
-            finalQueue = sSwitch.queue
-
-            # generate a traffic matrix and get the best bipartite matching
             for pkt in sSwitch.queue:
-                gSrc = pkt.src // self.n
-                gDest = pkt.dest // self.n
-                data.reqMat[gSrc][gDest] += 1
-            val, matching = mtchr.Matcher(data.reqMat).solve()
+                data.addRequest(pkt.src // self.n, pkt.dest // self.n)
+            slotData.append(data)
+
+        # get the best bipartite matching for every space switch
+        matchings = self.compute_matchings(slotData, active)
+        # Checked once per slot, the per packet records are only built when enabled
+        debug = logger.isEnabledFor(logging.DEBUG)
+        telemetry = self.telemetry
+        if telemetry is not None:
+            row = telemetry.start_slot(slotNumber)
+
+        for i, data, matching in zip(active, slotData, matchings):
+            sSwitch = self.network.spaceSwitches[i]
             data.finalState = matching
+            finalQueue = sSwitch.queue
+            queued = len(finalQueue)
+            blocked = 0
 
             # for each packet in the queue, check if it can be scheduled
             for pkt in sSwitch.queue:
@@ -423,17 +768,29 @@ class Controller:
                         src = self.network.transmitters[pkt.src]
                         pkt.dispatchSlot = slotNumber
                         pkt.schedulingDelay = ((pkt.dispatchSlot + 1) * self.slot) - pkt.arrivalTime
-                        logger.debug(f"[Packet {pkt.pktId}] : Wavelength Assigned = {pkt.wavelength}")
-                        logger.debug(f"[Packet {pkt.pktId}] : Space Switch Assigned = {i}")
-                        logger.debug(f"[Packet {pkt.pktId}] : Time Slot Assigned = {slotNumber}")
+                        if debug:
+                            logger.debug("[Packet %s] : Wavelength Assigned = %s", pkt.pktId, pkt.wavelength)
+                            logger.debug("[Packet %s] : Space Switch Assigned = %s", pkt.pktId, i)
+                            logger.debug("[Packet %s] : Time Slot Assigned = %s", pkt.pktId, slotNumber)
                         data.transmissions[pkt.src][pkt.wavelength] += 1
                         data.transmissions[pkt.src]['count'] += 1
                         src.onSchedule(pkt)
                         finalQueue.remove(pkt)
+                        self.backlog -= 1
+                    else:
+                        blocked += 1
 
             # queue with after removing scheduled packets
             sSwitch.queue = finalQueue
-    
+            if telemetry is not None:
+                telemetry.record(row, i, data, matching, queued - len(finalQueue), blocked,
+                                 len(finalQueue))
+            if i in self.spills:
+                self.refill_queue(i)
+            if len(finalQueue) == 0:
+                self.active_switches.discard(i)
+
+
     def checkEmptyQueues(self):
         """Check if all the Queues at the space switches are empty
         and no packets are pending for scheduling.
@@ -441,22 +798,22 @@ class Controller:
         Returns:
             bool: if all the queues are empty or not
         """
-        ret = True
-        for i in range(self.n):
-            if len(self.network.spaceSwitches[i].queue) != 0:
-                ret = False
-                break
-        return ret
+        return self.backlog == 0
 
     def clearQueue(self, slotNumber):
         """ If end of packet set is reached, then continue scheduling
-        until all packets are scheduled.
+        until all packets are scheduled. Each slot only schedules the space
+        switches that still have work, and draining stops as soon as the
+        backlog reaches zero.
 
         Args:
             slotNumber (int): the slot number when end of packet
                 set is reached
         """
-        while not self.checkEmptyQueues():
+        progress = self.network.event_generator.progress
+        while self.backlog > 0:
             self.allotSlots(slotNumber)
+            if progress is not None:
+                progress.drain(slotNumber, self.network)
             slotNumber += 1
 
@@ -9,18 +9,34 @@ import core.packet as pkt
 import random as rand
 from core.logger import logger
 
+# Kinds of events, which index the handler table of the EventGenerator
+PACKET_ARRIVAL = 0
+TIMESLOT_END = 1
+EVENTSET_END = 2
+LINK_FAILURE = 3
+
+CATEGORIES = ("packet-arrival", "timeslot-end", "eventset-end", "link-failure")
+
 class Event:
-    """Base Event Class
+    """Base Event Class. Events only hold their fields in slots, their type is
+    given by the integer kind of their class.
 
     Args:
-        category (string): the type of event
         t (int): timestamp of the occurence of the event in nanoseconds
     """
 
-    def __init__(self, category, t):
-        self.category = category
+    __slots__ = ("t",)
+    kind = None
+
+    def __init__(self, t):
         self.t = t
 
+    @property
+    def category(self):
+        """ The type of the event, as a string
+        """
+        return CATEGORIES[self.kind]
+
 class PacketArrival(Event):
     """A Packet arrival event
 
@@ -28,8 +44,11 @@ class PacketArrival(Event):
         pkt (Packet): the arriving packet
     """
 
+    __slots__ = ("pkt",)
+    kind = PACKET_ARRIVAL
+
     def __init__(self, t, pkt):
-        Event.__init__(self, "packet-arrival", t)
+        self.t = t
         self.pkt = pkt
 
 class TimeSlotEnd(Event):
@@ -39,16 +58,22 @@ class TimeSlotEnd(Event):
         slot_no (int): the number of the time slot that has just ended
     """
 
+    __slots__ = ("slot_no",)
+    kind = TIMESLOT_END
+
     def __init__(self, t, slot_no):
-        Event.__init__(self, "timeslot-end", t)
+        self.t = t
         self.slot_no = slot_no
 
 class EventSetEnd(Event):
     """Event marking the end of simulation events
     """
 
+    __slots__ = ()
+    kind = EVENTSET_END
+
     def __init__(self):
-        Event.__init__(self, "eventset-end", -1)
+        self.t = -1
 
 class LinkFailure(Event):
     """Event marking the failure of a link.
@@ -58,11 +83,54 @@ class LinkFailure(Event):
         failed_port (int): the port id which the failed link is attached to
     """
 
+    __slots__ = ("awgr_id", "failed_port")
+    kind = LINK_FAILURE
+
     def __init__(self, t, awgr_id, failed_port):
-        Event.__init__(self, "link-failure", t)
+        self.t = t
         self.awgr_id = awgr_id
         self.failed_port = failed_port
 
+class PoissonSource:
+    """Built-in traffic source, with arrivals that follow the Poission Distribution
+    and uniformly random distinct source and destination transmitters.
+
+    A traffic source returns the time of the next arrival through next_time, and
+    the source and destination of that arrival through endpoints. Once the
+    arrivals of a run have ended, close releases what it holds.
+
+    Args:
+        n (int): the n parameter of the network
+        rate (int): arrival rate of packets (relative to nanoseconds)
+    """
+
+    def __init__(self, n, rate):
+        self.n = n
+        self.rate = rate
+        self.time_ctr = 0
+
+    def next_time(self):
+        """ Advance to the next arrival
+
+        Returns:
+            float : the arrival time in nanoseconds
+        """
+        self.time_ctr += rand.expovariate(1) / self.rate
+        return self.time_ctr
+
+    def endpoints(self):
+        """ Returns the source and destination of the current arrival
+
+        Returns:
+            int, int : the source and destination transmitter IDs
+        """
+        return rand.sample(range(self.n ** 2), 2)
+
+    def close(self):
+        """ Nothing is held, the arrivals are drawn one at a time
+        """
+        pass
+
 class EventGenerator:
     """Definition of the EventGenerator class which generates random
     traffic whose arrivals follow the Poission Distribution.
@@ -72,30 +140,75 @@ class EventGenerator:
         rate (int): arrival rate of packets (relative to nanoseconds)
         runtime (int): duration of the simulation (in nanoseconds)
         time_slot (int): duration of the time slot (in nanoseconds)
+        failures ((int, int, int)[]): link failures in the form of (time of fault,
+            awgr_id, spaceSwitch_id), defaults to None
+        source (TraceSource or PipelineSource): source of the packet arrivals, defaults to None which
+            generates Poisson traffic with the given rate
+        monitor (SteadyStateMonitor): ends the arrivals early once the metrics have
+            converged, the runtime is then the upper limit, defaults to None
+        profiler (MemoryProfiler): records the memory use over the run, defaults to None
+        progress (ProgressReporter): reports the progress of the run, defaults to None
     """
 
-    def __init__(self, n, rate, runtime, time_slot, network=None):
+    def __init__(self, n, rate, runtime, time_slot, network=None, failures=None, source=None,
+                 monitor=None, profiler=None, progress=None):
         self.n = n
         self.rate = rate
         self.runtime = runtime
         self.time_slot = time_slot
-        # Stores the list of all events
-        self.event_set = []
-        # Count of each type of event
-        self.event_count = {}
+        self.source = source
+        self.monitor = monitor
+        self.profiler = profiler
+        self.progress = progress
         # fault occurs at random time
         # self.fault_at = rand.randrange(runtime)
         # Link failures in the form of (time of fault, awgr_id, spaceSwitch_id)
-        self.link_failures = []
-        # self.link_failures = [(0, 0, 0)]
-        # self.link_failures = [(0, 0, 0), (0, 1, 1)]
-        # self.link_failures = [(0, 0, 0), (0, 1, 1), (0, 2, 2)]
-        # self.link_failures = [(self.fault_at, 0, 0)]
-        # self.link_failures = [(50000, 0, 0)]
-        self.link_fail_count = len(self.link_failures)
+        # e.g. [(0, 0, 0)], [(0, 0, 0), (0, 1, 1)], [(self.fault_at, 0, 0)] or [(50000, 0, 0)]
+        if failures is None:
+            failures = []
+        self.failures = list(failures)
+        # Handler of each kind of event
+        self.handlers = (self.handle_packet_arrival, self.handle_timeslot_end,
+                         self.handle_eventset_end, self.handle_link_failure)
+        self.reset()
         if network is not None:
             self.network = network
 
+    def reset(self, rate=None, failures=None):
+        """ Discard all generated events and restore the pending link failures,
+        optionally changing the arrival rate or the link failures.
+
+        Args:
+            rate (int): new arrival rate of packets, defaults to None which keeps the current one
+            failures ((int, int, int)[]): new link failures, defaults to None which keeps
+                the current ones
+        """
+        if rate is not None:
+            self.rate = rate
+        if failures is not None:
+            self.failures = list(failures)
+        # Stores the list of all events
+        self.event_set = []
+        # Count of each type of event
+        self.event_count = {}
+        self.link_failures = list(self.failures)
+        self.link_fail_count = len(self.link_failures)
+        if self.source is not None:
+            self.source.reset()
+        if self.monitor is not None:
+            self.monitor.reset()
+
+    def traffic_source(self):
+        """ Returns the source of packet arrivals for a run
+
+        Returns:
+            PoissonSource, TraceSource or PipelineSource : the user defined source, or a new
+                Poisson source
+        """
+        if self.source is not None:
+            return self.source
+        return PoissonSource(self.n, self.rate)
+
     def insert_event(self, ev):
         """ Inserts an event into the event_set and increments its related
         counter
@@ -103,10 +216,7 @@ class EventGenerator:
         Args:
             ev (Event): the event you wish to enter into the event_set
         """
-        if ev.category not in self.event_count.keys():
-            self.event_count[ev.category] = 1
-        else:
-            self.event_count[ev.category] += 1
+        self.event_count[ev.category] = self.event_count.get(ev.category, 0) + 1
         self.event_set.append(ev)
 
     def generate_event_set(self, override=False):
@@ -120,27 +230,25 @@ class EventGenerator:
             Packet[]: Populates the packetSet
         """
         if len(self.event_set) == 0 or override:
-            time_ctr = rand.expovariate(1) / self.rate
+            source = self.traffic_source()
+            time_ctr = source.next_time()
             idCtr = 1
             slot_ctr = time_ctr // self.time_slot
-            fail_ev = self.link_failures.pop(0)
+            fail_ev = self.get_next_failure()
             while time_ctr < self.runtime:
                 eo = self.earliest_occurence(time_ctr, (slot_ctr + 1) * self.time_slot, fail_ev[0])
                 if eo == 1:
-                    src, dest = rand.sample(range(self.n ** 2), 2)
+                    src, dest = source.endpoints()
                     p = pkt.Packet(idCtr, src, dest, time_ctr)
                     self.insert_event(PacketArrival(time_ctr, p))
-                    time_ctr += rand.expovariate(1) / self.rate
+                    time_ctr = source.next_time()
                     idCtr += 1
                 elif eo == 2:
                     self.insert_event(TimeSlotEnd((slot_ctr + 1) * self.time_slot, slot_ctr))
                     slot_ctr = time_ctr // self.time_slot
                 elif eo == 3:
                     self.insert_event(LinkFailure(fail_ev[0], fail_ev[1], fail_ev[2]))
-                    if len(self.link_failures) > 0:
-                        fail_ev = self.link_failures.pop(0)
-                    else:
-                        fail_ev = (None, None, None)
+                    fail_ev = self.get_next_failure()
             self.insert_event(EventSetEnd())
 
     def on_demand_dispatch(self, override=False):
@@ -152,33 +260,67 @@ class EventGenerator:
             to False
         """
         if len(self.event_set) == 0 or override:
-            time_ctr = rand.expovariate(1) / self.rate
+            if self.profiler is not None:
+                self.profiler.start()
+            progress = self.progress
+            # Events are counted, and the progress is only checked every check_every events
+            events = 0
+            check_at = float("inf")
+            if progress is not None:
+                progress.start(self.network)
+                check_at = progress.check_every
+            source = self.traffic_source()
+            # Arrivals and slot ends are handled directly, without creating events.
+            # Transmitter views are stateless and made once for the run
+            transmitters = list(self.network.transmitters)
+            controller = self.network.controller
+            generated = self.network.counters.generated
+            time_slot = self.time_slot
+            runtime = self.runtime
+            time_ctr = source.next_time()
             idCtr = 1
-            slot_ctr = time_ctr // self.time_slot
+            slot_ctr = time_ctr // time_slot
             fail_ev = self.get_next_failure()
-            while time_ctr < self.runtime:
-                eo = self.earliest_occurence(time_ctr, (slot_ctr + 1) * self.time_slot, fail_ev[0])
-                if eo == 1:
-                    src, dest = rand.sample(range(self.n ** 2), 2)
+            while time_ctr < runtime:
+                events += 1
+                if events >= check_at:
+                    progress.update(events, time_ctr, slot_ctr, self.network)
+                    check_at += progress.check_every
+                slot_end = (slot_ctr + 1) * time_slot
+                fail_time = fail_ev[0]
+                # Ties go to the arrival, then to the end of the slot, see earliest_occurence
+                if time_ctr <= slot_end and (fail_time is None or time_ctr <= fail_time):
+                    src, dest = source.endpoints()
                     # Use in case generating biased traffic for N = 11
                     # src = rand.choice(range(self.n ** 2))
                     # if src == 5:
                     #     dest = rand.choice(range(self.n)) * self.n + 6 (For N = 5, change to self.n + 3)
                     # else:
                     #     dest = rand.choice(range(self.n ** 2))
-                    p = pkt.Packet(idCtr, src, dest, time_ctr)
-                    self.dispatch_event(PacketArrival(time_ctr, p))
-                    time_ctr += rand.expovariate(1) / self.rate
+                    transmitters[src].receive(pkt.Packet(idCtr, src, dest, time_ctr))
+                    time_ctr = source.next_time()
                     idCtr += 1
                     self.network.generatedPkts += 1
-                elif eo == 2:
-                    self.dispatch_event(TimeSlotEnd((slot_ctr + 1) * self.time_slot, slot_ctr))
-                    slot_ctr = time_ctr // self.time_slot
-                elif eo == 3:
+                    generated[src] += 1
+                elif fail_time is None or slot_end <= fail_time:
+                    controller.timeslot_end(slot_ctr)
+                    if self.profiler is not None:
+                        self.profiler.observe(slot_ctr, self.network)
+                    if self.monitor is not None and self.monitor.observe(slot_ctr, self.network):
+                        logger.info(f"Steady state estimates converged at slot {slot_ctr}.")
+                        break
+                    # Fast forward over idle slots, straight to the slot of the next arrival
+                    slot_ctr = time_ctr // time_slot
+                else:
                     self.dispatch_event(LinkFailure(fail_ev[0], fail_ev[1], fail_ev[2]))
                     logger.info(f"Failure at {fail_ev[0]}.")
                     fail_ev = self.get_next_failure()
-            self.dispatch_event(EventSetEnd())
+            source.close()
+            controller.eventset_end()
+            if self.profiler is not None:
+                self.profiler.finish(self.network)
+            if progress is not None:
+                progress.finish(self.network)
 
     def get_next_failure(self):
         """ Utility function that fetches the next link failure event
@@ -193,28 +335,36 @@ class EventGenerator:
 
     def earliest_occurence(self, pkt_arrival, slot_end, link_failure):
         """ Utility function which determines which event among packet_arrival,
-        time slot end, and link failure occurs first
+        time slot end, and link failure occurs first, ties go to the earlier argument
+
+        Returns:
+            int : 1, 2 or 3 for the packet arrival, slot end or link failure
         """
-        if link_failure is not None:
-            r = [pkt_arrival, slot_end, link_failure]
-        else: 
-            r = [pkt_arrival, slot_end]
-        return (r.index(min(r)) + 1)
+        if pkt_arrival <= slot_end and (link_failure is None or pkt_arrival <= link_failure):
+            return 1
+        if link_failure is None or slot_end <= link_failure:
+            return 2
+        return 3
+
+    def handle_packet_arrival(self, ev):
+        self.network.transmitters[ev.pkt.src].receive(ev.pkt)
+
+    def handle_timeslot_end(self, ev):
+        self.network.controller.timeslot_end(ev.slot_no)
+
+    def handle_eventset_end(self, ev):
+        self.network.controller.eventset_end()
+
+    def handle_link_failure(self, ev):
+        self.network.stageOneAWGRs[ev.awgr_id].link_failure(ev)
 
     def dispatch_event(self, ev):
-        """ Dispatches generated events according to the next action to be taken.
-        
+        """ Dispatches an event to the handler of its kind
+
         Args:
             ev (event): the event to be dispatched.
         """
-        if ev.category == "packet-arrival":
-            src = self.network.transmitters[ev.pkt.src]
-            src.receive(ev.pkt)
-        elif ev.category == "timeslot-end" or ev.category == "eventset-end":
-            self.network.controller.event_trigger(ev)
-        elif ev.category == "link-failure":
-            awgr = self.network.stageOneAWGRs[ev.awgr_id]
-            awgr.link_failure(ev)
+        self.handlers[ev.kind](ev)
 
     def dispatch_events(self):
         """ Dispatch all events in the generated event set
@@ -0,0 +1,231 @@
+"""
+pipelineSource.py
+
+This file contains definitions for the PipelineSource Class, which generates
+the packet arrivals of a run in a separate process, overlapping traffic
+generation with the simulation.
+"""
+
+import math
+import multiprocessing as mp
+import traceback
+import weakref
+import numpy as np
+
+# Length of a ring slot marking the end of the arrivals, or a failed producer
+END = -1
+FAILED = -2
+
+def ring_views(ring, slots, capacity):
+    """ Returns NumPy views of the shared arrays of a ring
+
+    Args:
+        ring (RawArray[]): shared arrays of the arrival times, sources and destinations
+        slots (int): no. of blocks the ring holds
+        capacity (int): no. of arrivals per block
+
+    Returns:
+        float[][], int[][], int[][] : the times, sources and destinations, one row per block
+    """
+    times, srcs, dests = ring
+    return (np.frombuffer(times, dtype=np.float64).reshape(slots, capacity),
+            np.frombuffer(srcs, dtype=np.int64).reshape(slots, capacity),
+            np.frombuffer(dests, dtype=np.int64).reshape(slots, capacity))
+
+def produce(producer, ring, lengths, free, filled, errors, slots, capacity):
+    """ Write the blocks of a producer into the ring, run in the producer process.
+    Blocks larger than the capacity of a ring slot are split. Waits for a free
+    slot before every block, so at most slots blocks are ever held.
+
+    Args:
+        producer (object): source of the arrivals, with a blocks method
+        ring (RawArray[]): shared arrays of the ring
+        lengths (RawArray): no. of arrivals in each slot, or END or FAILED
+        free (Semaphore): counts the free slots
+        filled (Semaphore): counts the filled slots
+        errors (SimpleQueue): receives the traceback if the producer fails
+        slots (int): no. of blocks the ring holds
+        capacity (int): no. of arrivals per block
+    """
+    times, srcs, dests = ring_views(ring, slots, capacity)
+    k = 0
+    end = END
+    try:
+        for blockTimes, blockSrcs, blockDests in producer.blocks():
+            for start in range(0, len(blockTimes), capacity):
+                size = min(capacity, len(blockTimes) - start)
+                free.acquire()
+                i = k % slots
+                times[i, :size] = blockTimes[start:start + size]
+                srcs[i, :size] = blockSrcs[start:start + size]
+                dests[i, :size] = blockDests[start:start + size]
+                lengths[i] = size
+                filled.release()
+                k += 1
+    except Exception:
+        errors.put(traceback.format_exc())
+        end = FAILED
+    free.acquire()
+    lengths[k % slots] = end
+    filled.release()
+
+def stop_process(process):
+    """ Stop a producer process, if it is still running
+    """
+    if process.is_alive():
+        process.terminate()
+    process.join()
+
+class PipelineSource:
+    """Traffic source that takes the blocks of arrivals of another source, such
+    as a PoissonBatchSource or a TraceSource, and generates them in a separate
+    process. The producer writes the blocks into a ring of shared memory
+    buffers while the simulation consumes them, so that on two cores traffic
+    generation and simulation overlap. The ring holds at most ring_slots
+    blocks, the producer waits while it is full, which bounds the memory.
+
+    The arrivals are exactly the blocks of the wrapped source, so runs are
+    identical with and without the producer process. With pipelined False
+    the blocks are generated in the simulation process instead.
+
+    It can be set as the source of the EventGenerator, or the SlotEngine can
+    wrap its own traffic in it. The built-in Poisson source of the
+    EventGenerator draws from the random module, which is shared with the
+    Controller, and can therefore not be generated ahead in another process,
+    wrap a PoissonBatchSource with its own NumPy generator instead.
+
+    The producer starts from the state of the wrapped source at the start of
+    every run, and is stopped at the end of the arrivals, by reset or close.
+
+    Args:
+        producer (object): source of the arrivals, with a blocks method
+        pipelined (bool): generate the blocks in a separate process, defaults to True
+        ring_slots (int): no. of blocks the ring holds, defaults to 4
+        block_size (int): no. of arrivals per block of the ring, defaults to 65536
+    """
+
+    def __init__(self, producer, pipelined=True, ring_slots=4, block_size=65536):
+        self.producer = producer
+        self.pipelined = pipelined
+        self.ring_slots = ring_slots
+        self.block_size = block_size
+        self.process = None
+        self.chunks = None
+        self.reset()
+
+    def reset(self):
+        """ Stop the producer and rewind to the first arrival
+        """
+        self.close()
+        self.times = []
+        self.srcs = []
+        self.dests = []
+        self.pos = -1
+
+    def close(self):
+        """ Stop the producer, if one is running
+        """
+        if self.chunks is not None:
+            self.chunks.close()
+            self.chunks = None
+        if self.process is not None:
+            self.finalizer()
+            self.process = None
+
+    def start(self):
+        """ Start the producer process with an empty ring
+        """
+        slots, capacity = self.ring_slots, self.block_size
+        self.ring = [mp.RawArray("d", slots * capacity), mp.RawArray("q", slots * capacity),
+                     mp.RawArray("q", slots * capacity)]
+        self.lengths = mp.RawArray("q", slots)
+        self.free = mp.Semaphore(slots)
+        self.filled = mp.Semaphore(0)
+        self.errors = mp.SimpleQueue()
+        self.process = mp.Process(target=produce, daemon=True,
+                                  args=(self.producer, self.ring, self.lengths, self.free, self.filled,
+                                        self.errors, slots, capacity))
+        self.process.start()
+        # The producer is also stopped if the source is discarded while it runs
+        self.finalizer = weakref.finalize(self, stop_process, self.process)
+
+    def wait_block(self):
+        """ Wait until the producer has filled the next slot
+
+        Raises:
+            RuntimeError : if the producer process has exited without ending the arrivals
+        """
+        while not self.filled.acquire(timeout=1.0):
+            if not self.process.is_alive():
+                raise RuntimeError("The traffic producer exited unexpectedly")
+
+    def blocks(self):
+        """ Generate the arrivals block by block, from the start
+
+        Returns:
+            generator : yields arrays of arrival times, sources and destinations
+
+        Raises:
+            RuntimeError : if the producer fails
+        """
+        if not self.pipelined:
+            yield from self.producer.blocks()
+            return
+        self.start()
+        try:
+            times, srcs, dests = ring_views(self.ring, self.ring_slots, self.block_size)
+            k = 0
+            while True:
+                self.wait_block()
+                i = k % self.ring_slots
+                size = self.lengths[i]
+                if size == FAILED:
+                    raise RuntimeError("The traffic producer failed :\n" + self.errors.get())
+                if size == END:
+                    return
+                # The slot is reused once released, so the block is copied out first
+                block = times[i, :size].copy(), srcs[i, :size].copy(), dests[i, :size].copy()
+                self.free.release()
+                k += 1
+                yield block
+        finally:
+            self.finalizer()
+            self.process = None
+
+    def load_block(self):
+        """ Load the next non-empty block
+
+        Returns:
+            bool : False if the end of the arrivals was reached
+        """
+        if self.chunks is None:
+            self.chunks = self.blocks()
+        for times, srcs, dests in self.chunks:
+            if len(times) > 0:
+                # Lists are faster than arrays to read one arrival at a time
+                self.times = times.tolist()
+                self.srcs = srcs.tolist()
+                self.dests = dests.tolist()
+                self.pos = 0
+                return True
+        return False
+
+    def next_time(self):
+        """ Advance to the next arrival
+
+        Returns:
+            float : the arrival time in nanoseconds, infinite once the arrivals have ended
+        """
+        self.pos += 1
+        if self.pos >= len(self.times) and not self.load_block():
+            self.pos = len(self.times)
+            return math.inf
+        return self.times[self.pos]
+
+    def endpoints(self):
+        """ Returns the source and destination of the current arrival
+
+        Returns:
+            int, int : the source and destination transmitter IDs
+        """
+        return self.srcs[self.pos], self.dests[self.pos]
@@ -1,40 +1,55 @@
 """
 receiver.py
 
-This file contains definitions for the Receiver Class
-used for the simulator
+This file contains definitions for the Receiver and ReceiverBank
+Classes used for the simulator
 """
 
+import logging
+from components.transceiverBank import TransceiverBank
 from core.logger import logger, latency_logger, receive_logger
 
+class ReceiverBank(TransceiverBank):
+    """Holds all the receivers in the network. Receivers keep no state of
+    their own, indexing the bank returns a Receiver.
+
+    Args:
+        n (int): the n parameter of the network
+        awgrs (AWGR[]): the Stage 3 AWGRs the receivers are connected to
+    """
+
+    def __init__(self, n, awgrs, network=None):
+        TransceiverBank.__init__(self, n, awgrs, Receiver, network=network)
+
 class Receiver:
     """Definition of the Receiver class which plays the role of a ToR
     receiver in the network. It communicates with the controller for
     scheduling and also the AWGR for forwarding.
 
+    Receivers are lightweight views of a single entry of the ReceiverBank.
+
     Args:
+        bank (ReceiverBank): the bank holding the receiver
         receiverId (int): the ID of the receiver
-        parentAWGR (AWGR): the parent AWGR to which transmitter is connected to,
-           defaults to None
-        port (int): the port of the AWGR it is connected to, defaults to None
     """
 
-    def __init__(self, receiverId, parentAWGR=None, port=None, network=None):
+    __slots__ = ("bank", "receiverId")
+
+    def __init__(self, bank, receiverId):
+        self.bank = bank
         self.receiverId = receiverId
-        self.parentAWGR = parentAWGR
-        self.awgrPort = port
-        if network is not None:
-            self.network = network
 
-    def linkAWGR(self, parentAWGR, port):
-        """Links the Receiver to its parent AWGR
+    @property
+    def network(self):
+        return self.bank.network
 
-        Args:
-            parentAWGR (AWGR): the parent AWGR to which transmitter is connected to
-            port (int): the port of the AWGR it is connected to
-        """
-        self.parentAWGR = parentAWGR
-        self.awgrPort = port
+    @property
+    def parentAWGR(self):
+        return self.bank.awgrs[self.receiverId // self.bank.n]
+
+    @property
+    def awgrPort(self):
+        return self.receiverId % self.bank.n
 
     def receive(self, pkt):
         """Recieve packets from the AWGR and process them further
@@ -42,11 +57,15 @@ class Receiver:
         pkt (Packet): the received packet
         """
         pkt.received = True
-        logger.info(f"[Packet {pkt.pktId}] : Received at Receiver {self.receiverId}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Packet %s] : Received at Receiver %s", pkt.pktId, self.receiverId)
         if isinstance(pkt.pktId, str):
-            self.network.controller.received_hello(pkt.pktId)
+            self.bank.network.counters.hellos_delivered[self.receiverId] += 1
+            self.bank.network.controller.received_hello(pkt.pktId)
         else:
-            self.network.receivedPkts += 1
+            self.bank.network.receivedPkts += 1
+            self.bank.network.counters.received[self.receiverId] += 1
+            self.bank.network.totalDelay += pkt.totalDelay()
             # Enable these loggers if needed. Latency logger generates an additional '--Latency.log' containing
             # packet id and the latency for the packet
             # receive_logger creates addition '--Throughput.log' showing packet and the timeslot in which it was received
@@ -0,0 +1,529 @@
+"""
+slotEngine.py
+
+This file contains definitions for the SlotEngine Class, a time-stepped
+alternative to the event driven EventGenerator that advances the
+simulation one time slot at a time.
+"""
+
+import copy
+import numpy as np
+from core.packet import Packet
+from components.controller import MAX_TRANSMISSION_COUNT
+from components.pipelineSource import PipelineSource
+from core.logger import logger
+
+# Propagation delay of a packet through both AWGR hops, in nanoseconds
+PROPAGATION_DELAY = 1200.0
+
+class PoissonBatchSource:
+    """Traffic source generating the same Poisson traffic as the built-in
+    source of the EventGenerator, but in blocks of arrays drawn from a NumPy
+    random generator.
+
+    Args:
+        n (int): the n parameter of the network
+        rate (int): arrival rate of packets (relative to nanoseconds)
+        rng (Generator): the NumPy random generator to draw from
+        block_size (int): no. of arrivals generated at a time, defaults to 65536
+    """
+
+    def __init__(self, n, rate, rng, block_size=65536):
+        self.n = n
+        self.rate = rate
+        self.rng = rng
+        self.block_size = block_size
+
+    def blocks(self):
+        """ Generate arrivals block by block, without end. Every call draws from a
+        copy of the generator in the state it was given in, and therefore
+        generates the same arrivals
+
+        Returns:
+            generator : yields arrays of arrival times, sources and destinations
+        """
+        rng = copy.deepcopy(self.rng)
+        size = self.n * self.n
+        time_ctr = 0.0
+        while True:
+            times = time_ctr + np.cumsum(rng.exponential(1 / self.rate, self.block_size))
+            time_ctr = times[-1]
+            srcs = rng.integers(0, size, self.block_size)
+            # Destinations are uniform over every transmitter other than the source
+            dests = (srcs + rng.integers(1, size, self.block_size)) % size
+            yield times, srcs, dests
+
+class SlotQueue:
+    """Queue of a Space Switch held by the SlotEngine, with one array per
+    packet field in order of the queue.
+
+    Data packets are identified by their packet ID, Hello Packets by a
+    negative key into the Hello Packets held by the engine.
+    """
+
+    FIELDS = (("key", np.int64), ("src", np.int64), ("dest", np.int64),
+              ("arrival", np.float64), ("misc", np.float64))
+
+    def __init__(self):
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.empty((0,), dtype=dtype))
+
+    def __len__(self):
+        return len(self.key)
+
+    def add(self, columns, front=False):
+        """ Add packets to the queue
+
+        Args:
+            columns (array[]): the packet fields, in the order of FIELDS
+            front (bool): queue the packets ahead of all others, defaults to False
+        """
+        for (name, dtype), column in zip(self.FIELDS, columns):
+            column = np.asarray(column, dtype=dtype)
+            old = getattr(self, name)
+            setattr(self, name, np.concatenate((column, old) if front else (old, column)))
+
+    def keep(self, mask):
+        """ Keep only the packets selected by a mask, in order
+
+        Args:
+            mask (bool[]): the packets to keep
+        """
+        for name, dtype in self.FIELDS:
+            setattr(self, name, getattr(self, name)[mask])
+
+def first_dispatches(positions, groups, sent):
+    """ Select the packets a Space Switch dispatches in a slot, replicating
+    the order in which Controller.allotSlots walks its queue. Candidates are
+    dispatched in queue order while their group, a transmitter and wavelength,
+    has sent fewer than MAX_TRANSMISSION_COUNT packets, except that the packet
+    right behind a dispatched packet is passed over, as allotSlots removes
+    packets from the queue it is iterating over. Candidates whose group has
+    reached the limit are blocked.
+
+    Args:
+        positions (int[]): queue positions of the candidate packets, ascending
+        groups (int[]): transmission group of each candidate
+        sent (dict): no. of packets each group has sent in this slot, updated in place
+
+    Returns:
+        int[], int : queue positions of the dispatched packets, ascending, and
+            the no. of blocked candidates
+    """
+    chosen = []
+    blocked = 0
+    last = -2
+    for pos, group in zip(positions.tolist(), groups.tolist()):
+        if pos == last + 1:
+            continue
+        count = sent.get(group, 0)
+        if count < MAX_TRANSMISSION_COUNT:
+            sent[group] = count + 1
+            chosen.append(pos)
+            last = pos
+        else:
+            blocked += 1
+    return chosen, blocked
+
+class SlotEngine:
+    """Time-stepped simulation engine. Instead of dispatching one event per
+    packet, every time slot takes the whole batch of its arrivals as arrays,
+    admits them into the transmitter buffers, routes them to the Space
+    Switches and then schedules the slot, all vectorized with NumPy.
+
+    The engine follows the semantics of EventGenerator.on_demand_dispatch,
+    packets arrive in slot arrivalTime // slot, every slot with arrivals but
+    the last one is ended with fault tracking and scheduling, and link
+    failures take effect in the same order. Fault tracking and matching are
+    left to the Controller. Slots in which a packet hits a failed link are
+    processed packet by packet through the Transmitters, so that re-routing
+    is exact. Per packet log records are not written.
+
+    Packets queued at the Space Switches are held by the engine, the queues
+    of the SpaceSwitch objects are only used to pass on Hello Packets and
+    re-routed packets.
+
+    Traffic is taken from the trace source of the EventGenerator if one is
+    set, and is otherwise generated as Poisson traffic with NumPy. The
+    arrivals therefore differ from those of the event engine for the same
+    seed, but follow the same distribution. The steady state monitor, the
+    memory profiler and the progress reporter of the EventGenerator, if set,
+    are used as in its runs. Every arrival and every slot counts as an event
+    for the progress reporter.
+
+    With pipeline set, the traffic is generated in a separate process by a
+    PipelineSource, overlapping with the simulation, with identical results.
+
+    The queues of the engine are compact arrays, bounded queues with a
+    Controller.queue_limit are not supported.
+
+    Args:
+        network (ASA): the network to simulate, using the rate, runtime, slot
+            duration, link failures and traffic source of its EventGenerator
+        seed (int): seed of the NumPy random generator, defaults to None
+        block_size (int): no. of arrivals generated at a time, defaults to 65536
+        pipeline (bool): generate the traffic in a separate process, defaults to False
+    """
+
+    def __init__(self, network, seed=None, block_size=65536, pipeline=False):
+        self.network = network
+        self.seed = seed
+        self.block_size = block_size
+        self.pipeline = pipeline
+        self.reset()
+
+    def reset(self):
+        """ Discard all queued packets
+        """
+        self.n = self.network.n
+        self.queues = [SlotQueue() for i in range(self.n)]
+        # Hello Packets queued at the Space Switches, by their negative key
+        self.hellos = {}
+        self.hello_key = 0
+
+    def arrival_blocks(self):
+        """ Returns the blocks of packet arrivals for a run
+
+        Returns:
+            generator : yields arrays of arrival times, sources and destinations
+        """
+        gen = self.network.event_generator
+        source = gen.source
+        if source is None:
+            rng = np.random.default_rng(self.seed)
+            source = PoissonBatchSource(self.n, gen.rate, rng, self.block_size)
+        if self.pipeline and not isinstance(source, PipelineSource):
+            source = PipelineSource(source, block_size=self.block_size)
+        return source.blocks()
+
+    def slot_batches(self):
+        """ Split the arrivals before the end of the runtime by time slot
+
+        Returns:
+            generator : yields the slot number along with the arrival times, sources
+                and destinations of every slot with at least one arrival
+        """
+        gen = self.network.event_generator
+        carry = None
+        for times, srcs, dests in self.arrival_blocks():
+            stop = int(np.searchsorted(times, gen.runtime, side="left"))
+            done = stop < len(times)
+            block = [np.asarray(times[:stop], dtype=np.float64),
+                     np.asarray(srcs[:stop], dtype=np.int64),
+                     np.asarray(dests[:stop], dtype=np.int64)]
+            if carry is not None:
+                block = [np.concatenate((old, new)) for old, new in zip(carry, block)]
+                carry = None
+            if len(block[0]) > 0:
+                slots = block[0] // gen.time_slot
+                bounds = [0] + (np.flatnonzero(np.diff(slots)) + 1).tolist() + [len(slots)]
+                # The last slot of a block may continue in the next one
+                last = len(bounds) - 1 if done else len(bounds) - 2
+                for k in range(last):
+                    yield (float(slots[bounds[k]]),) + tuple(col[bounds[k]:bounds[k + 1]] for col in block)
+                if not done:
+                    carry = [col[bounds[-2]:] for col in block]
+            if done:
+                return
+        if carry is not None:
+            yield (float(carry[0][0] // gen.time_slot),) + tuple(carry)
+
+    def run(self):
+        """ Run the simulation, ending with the drain of all queued packets
+        """
+        gen = self.network.event_generator
+        controller = self.network.controller
+        if controller.queue_limit is not None:
+            raise ValueError("Queue limits of the Space Switches are only supported by the EventGenerator")
+        self.reset()
+        if gen.profiler is not None:
+            gen.profiler.start()
+        progress = gen.progress
+        events = 0
+        check_at = float("inf")
+        if progress is not None:
+            progress.start(self.network)
+            check_at = progress.check_every
+        # Pending link failures, taken in order like the EventGenerator
+        self.link_failures = list(gen.link_failures)
+        nextId = 1
+        previous = None
+        for batch in self.slot_batches():
+            if previous is not None:
+                self.apply_link_failures((previous + 1) * gen.time_slot)
+                self.end_slot(previous)
+                if gen.profiler is not None:
+                    gen.profiler.observe(previous, self.network)
+                if gen.monitor is not None and gen.monitor.observe(previous, self.network):
+                    logger.info(f"Steady state estimates converged at slot {previous}.")
+                    previous = None
+                    break
+            slot, times, srcs, dests = batch
+            self.arrive(slot, times, srcs, dests, nextId)
+            nextId += len(times)
+            previous = slot
+            lastArrival = times[-1]
+            events += len(times) + 1
+            if events >= check_at:
+                progress.update(events, lastArrival, slot, self.network)
+                check_at = events + progress.check_every
+        if previous is not None:
+            self.apply_link_failures(lastArrival)
+        # Drain the queues like Controller.clearQueue
+        slotNumber = controller.current_slot
+        while controller.backlog > 0:
+            self.allot(slotNumber)
+            if progress is not None:
+                progress.drain(slotNumber, self.network)
+            slotNumber += 1
+        if gen.profiler is not None:
+            gen.profiler.finish(self.network)
+        if progress is not None:
+            progress.finish(self.network)
+
+    def apply_link_failures(self, until):
+        """ Register the pending link failures that occur before a given time
+
+        Args:
+            until (float): the time in nanoseconds
+        """
+        while len(self.link_failures) > 0 and self.link_failures[0][0] < until:
+            t, awgr_id, failed_port = self.link_failures.pop(0)
+            self.network.stageOneAWGRs[awgr_id].link_failure_ports.add(failed_port)
+            logger.info(f"Failure at {t}.")
+
+    def end_slot(self, slot):
+        """ End a time slot, with fault tracking followed by scheduling
+
+        Args:
+            slot (float): the number of the time slot
+        """
+        controller = self.network.controller
+        logger.info("[Timeslot %s] : Timeslot ENDING....", slot)
+        controller.fault_tracking(controller.current_slot)
+        self.collect_switch_queues(front=True)
+        self.allot(slot)
+        logger.info("[Timeslot %s] : Timeslot ENDED, Next Timeslot STARTING...", slot)
+
+    def switch_ids(self, srcs, dests):
+        """ Returns the Space Switch of each packet, as in Controller.enqueue_scheduler
+        """
+        n = self.n
+        total = srcs % n + dests % n
+        return np.where(total % 2 == 0, total // 2, (total + n) // 2) % n
+
+    def wavelengths(self, srcs, dests):
+        """ Returns the wavelength of each packet, as in Controller.enqueue_scheduler
+        """
+        n = self.n
+        diff = dests % n - srcs % n
+        return np.where(diff % 2 == 0, diff / 2, (n + diff) / 2) % n
+
+    def arrive(self, slot, times, srcs, dests, firstId):
+        """ Admit the arrivals of a time slot into the transmitter buffers and
+        queue them at their Space Switches
+
+        Args:
+            slot (float): the number of the time slot
+            times (float[]): arrival times, ascending
+            srcs (int[]): source transmitters
+            dests (int[]): destination transmitters
+            firstId (int): ID of the first packet
+        """
+        network = self.network
+        controller = network.controller
+        bank = network.transmitters
+        count = len(times)
+        network.generatedPkts += count
+        network.counters.generated += np.bincount(srcs, minlength=bank.size)
+        switches = self.switch_ids(srcs, dests)
+        if controller.failed_version and controller.failed_routes[srcs // self.n, switches,
+                                                                  dests // self.n].any():
+            # Re-routed packets compete for buffers in order of arrival
+            for k in range(count):
+                p = Packet(firstId + k, int(srcs[k]), int(dests[k]), float(times[k]))
+                network.transmitters[p.src].receive(p)
+            self.collect_switch_queues(front=False)
+            return
+
+        # Admit the packets of each transmitter in order of arrival, up to its free buffer space
+        order = np.argsort(srcs, kind="stable")
+        sortedSrcs = srcs[order]
+        starts = np.flatnonzero(np.r_[True, sortedSrcs[1:] != sortedSrcs[:-1]])
+        rank = np.arange(count) - np.repeat(starts, np.diff(np.r_[starts, count]))
+        admitted = np.empty((count,), dtype=bool)
+        admitted[order] = rank < bank.buffer_MAX - bank.bufferCount[sortedSrcs]
+        bank.bufferCount += np.bincount(srcs[admitted], minlength=bank.size)
+        accepted = int(np.count_nonzero(admitted))
+        network.overflowDrop += count - accepted
+        network.counters.overflow_drops += np.bincount(srcs[~admitted], minlength=bank.size)
+        if accepted == 0:
+            return
+
+        controller.current_slot = slot
+        ids = np.arange(firstId, firstId + count)
+        for sId in np.unique(switches[admitted]).tolist():
+            mask = admitted & (switches == sId)
+            self.queues[sId].add((ids[mask], srcs[mask], dests[mask], times[mask],
+                                  np.zeros((int(np.count_nonzero(mask)),))))
+            controller.active_switches.add(sId)
+        controller.backlog += accepted
+
+    def collect_switch_queues(self, front):
+        """ Move the packets the Controller has queued at the SpaceSwitch objects
+        into the queues of the engine. The Controller has already counted them
+        in its backlog.
+
+        Args:
+            front (bool): queue the packets ahead of all others
+        """
+        for sId, sSwitch in enumerate(self.network.spaceSwitches):
+            if len(sSwitch.queue) == 0:
+                continue
+            keys = []
+            for pkt in sSwitch.queue:
+                if isinstance(pkt.pktId, str):
+                    self.hello_key -= 1
+                    self.hellos[self.hello_key] = pkt
+                    keys.append(self.hello_key)
+                else:
+                    keys.append(pkt.pktId)
+            self.queues[sId].add((keys, [pkt.src for pkt in sSwitch.queue],
+                                  [pkt.dest for pkt in sSwitch.queue],
+                                  [pkt.arrivalTime for pkt in sSwitch.queue],
+                                  [pkt.miscDelay for pkt in sSwitch.queue]), front=front)
+            sSwitch.queue = []
+
+    def allot(self, slotNumber):
+        """ Schedule a time slot, like Controller.allotSlots, and deliver the
+        dispatched packets
+
+        Args:
+            slotNumber (float): the number of the time slot
+        """
+        network = self.network
+        controller = network.controller
+        n = self.n
+        network.counters.sample_high_water(network.transmitters.bufferCount,
+                                           [len(queue) for queue in self.queues])
+        active = sorted(controller.active_switches)
+        slotData = []
+        pairs = []
+        for i in active:
+            queue = self.queues[i]
+            data = network.spaceSwitches[i].getSlotData(slotNumber)
+            pair = (queue.src // n) * n + queue.dest // n
+            # Requests are registered in order of their first packet in the queue
+            counts = np.bincount(pair, minlength=n * n)
+            first = np.full((n * n,), len(pair))
+            np.minimum.at(first, pair, np.arange(len(pair)))
+            values = np.flatnonzero(counts)
+            values = values[np.argsort(first[values])]
+            keys = zip((values // n).tolist(), (values % n).tolist())
+            if data.requests:
+                for key, c in zip(keys, counts[values].tolist()):
+                    data.requests[key] = data.requests.get(key, 0) + c
+            else:
+                data.requests.update(zip(keys, counts[values].tolist()))
+            slotData.append(data)
+            pairs.append(pair)
+
+        matchings = controller.compute_matchings(slotData, active)
+        telemetry = controller.telemetry
+        if telemetry is not None:
+            row = telemetry.start_slot(slotNumber)
+
+        sent = []
+        for i, data, matching, pair in zip(active, slotData, matchings, pairs):
+            queue = self.queues[i]
+            data.finalState = matching
+            target = np.asarray(matching)[pair // n]
+            candidates = np.flatnonzero(pair % n == target)
+            if len(candidates) == 0:
+                if telemetry is not None:
+                    telemetry.record(row, i, data, matching, 0, 0, len(queue))
+                continue
+            srcs = queue.src[candidates]
+            waves = self.wavelengths(srcs, queue.dest[candidates])
+            for k in np.flatnonzero(queue.key[candidates] < 0).tolist():
+                # Hello Packets carry the wavelength of the link they probe
+                waves[k] = self.hellos[int(queue.key[candidates[k]])].wavelength
+            # Transmissions are limited per transmitter and wavelength, a wavelength
+            # is either whole or half way between two, see wavelengths
+            groups = srcs * (2 * n) + np.rint(2 * waves).astype(np.int64)
+            groupCounts = {src * (2 * n) + int(round(2 * wave)): count
+                           for src, entry in data.transmissions.items()
+                           for wave, count in entry.items() if wave != 'count'}
+            chosen, blocked = first_dispatches(candidates, groups, groupCounts)
+            chosen = np.asarray(chosen, dtype=np.int64)
+            chosenSrcs = queue.src[chosen]
+            for src, wave in zip(chosenSrcs.tolist(), waves[np.searchsorted(candidates, chosen)].tolist()):
+                entry = data.transmissions.setdefault(src, {'count': 0})
+                entry[wave] = entry.get(wave, 0) + 1
+                entry['count'] += 1
+            sent.append((np.full((len(chosen),), i), queue.key[chosen], chosenSrcs,
+                         queue.dest[chosen], queue.arrival[chosen], queue.misc[chosen]))
+            keep = np.ones((len(queue),), dtype=bool)
+            keep[chosen] = False
+            queue.keep(keep)
+            controller.backlog -= len(chosen)
+            if telemetry is not None:
+                telemetry.record(row, i, data, matching, len(chosen), blocked, len(queue))
+            if len(queue) == 0:
+                controller.active_switches.discard(i)
+
+        if sent:
+            self.deliver(slotNumber, *[np.concatenate(col) for col in zip(*sent)])
+
+    def deliver(self, slotNumber, switches, keys, srcs, dests, arrivals, misc):
+        """ Send the packets dispatched in a slot through the network. Packets
+        are dropped at a failed AWGR port, data packets are counted as received
+        and Hello Packets are reported to the Controller.
+
+        Args:
+            slotNumber (float): the number of the time slot
+            switches (int[]): Space Switch of each packet
+            keys (int[]): packet ID or Hello Packet key of each packet
+            srcs (int[]): source transmitters
+            dests (int[]): destination transmitters
+            arrivals (float[]): arrival times
+            misc (float[]): miscellaneous delays
+        """
+        network = self.network
+        controller = network.controller
+        bank = network.transmitters
+        n = self.n
+        bank.recordTransmissions(srcs, slotNumber)
+        counts = np.bincount(srcs, minlength=bank.size)
+        bank.dispatch_count += counts
+        bank.bufferCount = np.maximum(bank.bufferCount - counts, 0)
+
+        dropped = np.zeros((len(srcs),), dtype=bool)
+        for stage, (awgrs, ports, awgrIds) in enumerate(((network.stageOneAWGRs, switches, srcs // n),
+                                                         (network.stageThreeAWGRs, dests % n, dests // n))):
+            for awgr in awgrs:
+                if awgr.link_failure_ports:
+                    # Packets dropped at Stage 1 never reach Stage 3
+                    hit = ~dropped & (awgrIds == awgr.awgrId) & np.isin(ports, list(awgr.link_failure_ports))
+                    np.add.at(network.counters.link_drops[stage], (awgrIds[hit], ports[hit]), 1)
+                    dropped |= hit
+        network.linkDrop += int(np.count_nonzero(dropped))
+
+        isHello = keys < 0
+        received = ~dropped & ~isHello
+        network.receivedPkts += int(np.count_nonzero(received))
+        network.counters.received += np.bincount(dests[received], minlength=bank.size)
+        network.counters.hellos_delivered += np.bincount(dests[isHello & ~dropped], minlength=bank.size)
+        schedulingDelay = (slotNumber + 1) * controller.slot - arrivals[received]
+        network.totalDelay += float(np.sum(schedulingDelay + PROPAGATION_DELAY + misc[received]))
+
+        receivedHellos = []
+        for key, drop in zip(keys[isHello].tolist(), dropped[isHello].tolist()):
+            hpkt = self.hellos.pop(key)
+            hpkt.dispatchSlot = slotNumber
+            hpkt.schedulingDelay = ((slotNumber + 1) * controller.slot) - hpkt.arrivalTime
+            if not drop:
+                hpkt.propagationDelay = PROPAGATION_DELAY
+                hpkt.received = True
+                receivedHellos.append(hpkt.pktId)
+        controller.received_hellos(receivedHellos)
@@ -5,22 +5,61 @@ This file contains definitions for the Space Switch Class
 used for the simulator
 """
 
+import logging
+import numpy as np
 from core.logger import logger
 
 class StateData:
     """StateData holds the data regarding the state of a space switch
     in a given time slot.
 
+    Requests are stored sparsely, only the AWGR pairs with at least one
+    request are kept.
+
     Args:
         n (int): The n parameter of the network.
     """
 
     def __init__(self, n):
         self.n = n
-        self.reqMat = [[0 for i in range(self.n)] for j in range(self.n)]
+        # Requested connections of the form "(srcAWGR, destAWGR): count"
+        self.requests = {}
         self.finalState = None
         self.transmissions = {}
 
+    def addRequest(self, gSrc, gDest):
+        """Register a requested connection between two AWGRs
+
+        Args:
+            gSrc (int): the source AWGR
+            gDest (int): the destination AWGR
+        """
+        key = (gSrc, gDest)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def density(self):
+        """Returns the fraction of AWGR pairs with at least one request
+        """
+        return len(self.requests) / (self.n * self.n)
+
+    def requestArray(self):
+        """Returns the dense request matrix as an n x n NumPy array
+        """
+        mat = np.zeros((self.n, self.n), dtype=np.int64)
+        for (gSrc, gDest), count in self.requests.items():
+            mat[gSrc, gDest] = count
+        return mat
+
+    @property
+    def reqMat(self):
+        """The dense request matrix, where the element (i, j) is the no. of
+        requested connections between AWGR i and AWGR j
+        """
+        mat = [[0 for i in range(self.n)] for j in range(self.n)]
+        for (gSrc, gDest), count in self.requests.items():
+            mat[gSrc][gDest] = count
+        return mat
+
 class SpaceSwitch:
     """Definition for the space switches in the network. These contain
     information regarding the space switch state in each timeslot.
@@ -34,11 +73,16 @@ class SpaceSwitch:
         self.n =  n
         self.spaceSwitchId = spaceSwitchId
         self.slot = slot
-        self.queue = []
-        self.state = {}
+        self.reset()
         if network is not None:
             self.network = network
 
+    def reset(self):
+        """Clear the queue and the per slot state of the space switch
+        """
+        self.queue = []
+        self.state = {}
+
     def getSlotData(self, slot):
         """Returns the state data for a specific time slot.
 
@@ -47,11 +91,16 @@ class SpaceSwitch:
         and AWGR j. It also contains the final state of the Space Switch
         for that slot, if decided.
 
+        Packets are delivered within the slot they are dispatched in, so the
+        data of earlier slots is never used again and is discarded when a new
+        slot starts, which keeps the memory of long runs flat.
+
         Args:
             slot (int): The starting time of the slot in nanoseconds.
         """
         slot = str(slot)
         if slot not in self.state.keys():
+            self.state.clear()
             self.state[slot] = StateData(self.n)
         ret = self.state[slot]
         return ret
@@ -64,7 +113,8 @@ class SpaceSwitch:
             inPort (int): the port on which packet is being received
             pkt (Packet): the packet to be received
         """
-        logger.info(f"[Packet {pkt.pktId}] : Reached Space Switch {self.spaceSwitchId}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Packet %s] : Reached Space Switch %s", pkt.pktId, self.spaceSwitchId)
         slotData = self.getSlotData(pkt.dispatchSlot)
         outPort = slotData.finalState[inPort]
         self.sendPacket(outPort, pkt)
@@ -76,6 +126,7 @@ class SpaceSwitch:
             outPort (int): the output port packet is being sent through
             pkt (Packet): the packet to be forwarded
         """
-        logger.info(f"[Packet {pkt.pktId}] : Sent from Space Switch {self.spaceSwitchId}")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Packet %s] : Sent from Space Switch %s", pkt.pktId, self.spaceSwitchId)
         outSwitch = self.network.stageThreeAWGRs[outPort]
         outSwitch.receive(self.spaceSwitchId, pkt)
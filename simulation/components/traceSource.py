@@ -0,0 +1,157 @@
+"""
+traceSource.py
+
+This file contains definitions for the TraceSource Class, which drives
+the EventGenerator with a captured packet trace.
+
+Trace format:
+    A CSV file with a header row holding (at least) the columns
+
+    * ``time`` -- arrival time of the packet in nanoseconds
+    * ``src``  -- ID of the source host
+    * ``dest`` -- ID of the destination host
+
+    Records must be sorted by time, other columns are ignored. Traces can
+    also be stored as a ``.npy`` file of a structured array with the same
+    three fields, which is memory-mapped instead of parsed.
+
+Only one chunk of the trace is held in memory at any time.
+"""
+
+import math
+import numpy as np
+import pandas as pd
+
+TRACE_COLUMNS = ["time", "src", "dest"]
+
+class TraceSource:
+    """Traffic source that streams the arrivals of a packet trace into the
+    event loop, reading the trace in chunks of bounded size.
+
+    Host IDs are mapped onto the n * n transmitters of the network, either
+    through host_map or by taking them modulo n * n. Records whose source and
+    destination map to the same transmitter are skipped.
+
+    Args:
+        path (str): path of the trace, a ".csv" or ".npy" file
+        n (int): the n parameter of the network
+        host_map (int[]): transmitter ID of each host ID, defaults to None
+        chunk_size (int): no. of records read at a time, defaults to 65536
+        time_offset (float): subtracted from every arrival time, defaults to 0
+    """
+
+    def __init__(self, path, n, host_map=None, chunk_size=65536, time_offset=0):
+        self.path = path
+        self.n = n
+        self.host_map = None if host_map is None else np.asarray(host_map, dtype=np.int64)
+        self.chunk_size = chunk_size
+        self.time_offset = time_offset
+        self.reset()
+
+    def reset(self):
+        """ Rewind the trace to its first record
+        """
+        # Chunks are only opened on the first read
+        self.chunks = None
+        self.times = np.empty((0,), dtype=np.float64)
+        self.srcs = np.empty((0,), dtype=np.int64)
+        self.dests = np.empty((0,), dtype=np.int64)
+        self.pos = -1
+        self.last_time = -math.inf
+        # No. of records skipped because source and destination were the same
+        self.skipped = 0
+
+    def read_chunks(self):
+        """ Read the trace chunk by chunk
+
+        Returns:
+            generator : yields arrays of times, source hosts and destination hosts
+        """
+        if self.path.endswith(".npy"):
+            records = np.load(self.path, mmap_mode="r")
+            for start in range(0, len(records), self.chunk_size):
+                chunk = records[start:start + self.chunk_size]
+                yield chunk["time"], chunk["src"], chunk["dest"]
+        else:
+            reader = pd.read_csv(self.path, usecols=TRACE_COLUMNS, chunksize=self.chunk_size,
+                                 dtype={"time": np.float64, "src": np.int64, "dest": np.int64})
+            for frame in reader:
+                yield (frame["time"].to_numpy(), frame["src"].to_numpy(),
+                       frame["dest"].to_numpy())
+
+    def map_hosts(self, hosts):
+        """ Map host IDs onto transmitter IDs
+
+        Args:
+            hosts (int[]): the host IDs
+
+        Returns:
+            int[] : the transmitter IDs
+        """
+        hosts = np.asarray(hosts, dtype=np.int64)
+        if self.host_map is not None:
+            return self.host_map[hosts]
+        return hosts % (self.n * self.n)
+
+    def load_chunk(self):
+        """ Load the next chunk holding at least one usable record
+
+        Returns:
+            bool : False if the end of the trace was reached
+        """
+        if self.chunks is None:
+            self.chunks = self.read_chunks()
+        for times, srcs, dests in self.chunks:
+            times = np.asarray(times, dtype=np.float64) - self.time_offset
+            if len(times) > 0 and (times[0] < self.last_time or np.any(np.diff(times) < 0)):
+                raise ValueError(f"Trace {self.path} is not sorted by time")
+            srcs = self.map_hosts(srcs)
+            dests = self.map_hosts(dests)
+            keep = srcs != dests
+            self.skipped += len(keep) - int(np.count_nonzero(keep))
+            if len(times) > 0:
+                self.last_time = times[-1]
+            if np.any(keep):
+                self.times = times[keep]
+                self.srcs = srcs[keep]
+                self.dests = dests[keep]
+                self.pos = 0
+                return True
+        return False
+
+    def blocks(self):
+        """ Read the usable records of the trace from its start, chunk by chunk
+
+        Returns:
+            generator : yields arrays of arrival times, sources and destinations
+        """
+        self.reset()
+        while self.load_chunk():
+            yield self.times, self.srcs, self.dests
+
+    def close(self):
+        """ Close the trace, a later read starts again from its first chunk
+        """
+        if self.chunks is not None:
+            self.chunks.close()
+        self.reset()
+
+    def next_time(self):
+        """ Advance to the next arrival
+
+        Returns:
+            float : the arrival time in nanoseconds, infinite once the trace has ended
+        """
+        self.pos += 1
+        if self.pos >= len(self.times) and not self.load_chunk():
+            self.pos = len(self.times)
+            return math.inf
+        return float(self.times[self.pos])
+
+    def endpoints(self):
+        """ Returns the source and destination of the current arrival
+
+        Returns:
+            int, int : the source and destination transmitter IDs
+        """
+        return int(self.srcs[self.pos]), int(self.dests[self.pos])
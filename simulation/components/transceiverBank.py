@@ -0,0 +1,79 @@
+"""
+transceiverBank.py
+
+This file contains the base class for the banks that hold the state
+of all Transmitters/Receivers of the network
+"""
+
+class TransceiverBank:
+    """Base class for a bank of transceivers. The state of every transceiver
+    is kept by the bank in arrays indexed by the global transceiver ID, and
+    transceiver objects are only created as lightweight proxies when they
+    are accessed.
+
+    Args:
+        n (int): the n parameter of the network
+        awgrs (AWGR[]): the AWGRs the transceivers are connected to, transceiver i
+            is connected to port i % n of AWGR i // n
+        proxy (class): the proxy class created for a single transceiver
+    """
+
+    def __init__(self, n, awgrs, proxy, network=None):
+        self.n = n
+        self.size = n * n
+        self.awgrs = awgrs
+        self.proxy = proxy
+        if network is not None:
+            self.network = network
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, transceiverId):
+        if transceiverId < 0:
+            transceiverId += self.size
+        if not 0 <= transceiverId < self.size:
+            raise IndexError("transceiver ID out of range")
+        return self.proxy(self, transceiverId)
+
+    def __iter__(self):
+        for transceiverId in range(self.size):
+            yield self.proxy(self, transceiverId)
+
+    def group(self, awgrId):
+        """Returns the transceivers connected to an AWGR, in order of port
+
+        Args:
+            awgrId (int): the ID of the AWGR
+
+        Returns:
+            BankGroup : the transceivers connected to the AWGR
+        """
+        return BankGroup(self, awgrId * self.n, self.n)
+
+class BankGroup:
+    """The transceivers of a bank connected to a single AWGR, indexed by
+    the port of the AWGR.
+
+    Args:
+        bank (TransceiverBank): the bank holding the transceivers
+        start (int): the global ID of the transceiver on port 0
+        size (int): the no. of transceivers in the group
+    """
+
+    def __init__(self, bank, start, size):
+        self.bank = bank
+        self.start = start
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, port):
+        if not 0 <= port < self.size:
+            raise IndexError("port out of range")
+        return self.bank.proxy(self.bank, self.start + port)
+
+    def __iter__(self):
+        for port in range(self.size):
+            yield self.bank.proxy(self.bank, self.start + port)
@@ -1,57 +1,153 @@
 """
 transmitter.py
 
-This file contains definitions for the Transmitter Class
-used for the simulator
+This file contains definitions for the Transmitter and TransmitterBank
+Classes used for the simulator
 """
 
+import logging
+import numpy as np
+from components.transceiverBank import TransceiverBank
 from core.logger import logger
 
+class TransmitterBank(TransceiverBank):
+    """Holds the state of all the transmitters in the network in arrays
+    indexed by the transmitter ID. Indexing the bank returns a Transmitter.
+
+    The transmission history only covers the latest window slots, which
+    has to be larger than the no. of slots examined by the controller.
+
+    Args:
+        n (int): the n parameter of the network
+        awgrs (AWGR[]): the Stage 1 AWGRs the transmitters are connected to
+        window (int): the no. of latest time slots of transmission history kept
+        buffer_MAX (int): the buffer size of each transmitter, defaults to 5000
+    """
+
+    def __init__(self, n, awgrs, window, buffer_MAX=5000, network=None):
+        TransceiverBank.__init__(self, n, awgrs, Transmitter, network=network)
+        self.window = window
+        self.buffer_MAX = buffer_MAX
+        self.reset()
+
+    def reset(self):
+        """Clear the buffers and the transmission history of all transmitters
+        """
+        self.bufferCount = np.zeros((self.size,), dtype=np.int64)
+        self.dispatch_count = np.zeros((self.size,), dtype=np.int64)
+        # Transmissions per slot, stored in column slot % window along with the slot
+        self.windowSlots = np.full((self.size, self.window), -self.window - 1, dtype=np.int64)
+        self.windowCounts = np.zeros((self.size, self.window), dtype=np.int64)
+
+    def recordTransmission(self, transmitterId, slot):
+        """Count a transmission by a transmitter in a time slot
+
+        Args:
+            transmitterId (int): the ID of the transmitter
+            slot (int): the time slot of the transmission
+        """
+        slot = int(slot)
+        col = slot % self.window
+        if self.windowSlots[transmitterId, col] != slot:
+            self.windowSlots[transmitterId, col] = slot
+            self.windowCounts[transmitterId, col] = 0
+        self.windowCounts[transmitterId, col] += 1
+
+    def recordTransmissions(self, transmitterIds, slot):
+        """Count the transmissions of several transmitters in a time slot,
+        a transmitter may appear more than once
+
+        Args:
+            transmitterIds (int[]): the IDs of the transmitters
+            slot (int): the time slot of the transmissions
+        """
+        slot = int(slot)
+        col = slot % self.window
+        counts = np.bincount(transmitterIds, minlength=self.size)
+        stale = (counts > 0) & (self.windowSlots[:, col] != slot)
+        self.windowSlots[stale, col] = slot
+        self.windowCounts[stale, col] = 0
+        self.windowCounts[:, col] += counts
+
+    def transmissionCounts(self, first, last, current_slot, k):
+        """ Return the count of packets transmitted in the last k timeslots
+        by each transmitter with an ID in [first, last).
+
+        Args:
+            first (int): ID of the first transmitter
+            last (int): ID after the last transmitter
+            current_slot (int): the current timeslot that is running
+            k (int): the number of latest timeslots to examine, less than window
+
+        Returns:
+            int[] : transmission count of each transmitter
+        """
+        slots = self.windowSlots[first:last]
+        valid = slots >= current_slot - k
+        # At most k slots are examined, leaving out the oldest one
+        extra = np.count_nonzero(valid, axis=1) > k
+        if extra.any():
+            oldest = np.argmin(np.where(valid, slots, np.iinfo(np.int64).max), axis=1)
+            valid[extra, oldest[extra]] = False
+        return np.sum(self.windowCounts[first:last] * valid, axis=1)
+
 class Transmitter:
     """Definition of the Transmitter class which plays the role of a ToR
     transmitter in the network. It communicates with the controller for
     scheduling and also the AWGR for forwarding.
 
+    Transmitters are lightweight views of a single entry of the
+    TransmitterBank, which holds their state.
+
     Args:
+        bank (TransmitterBank): the bank holding the transmitter state
         transmitterId (int): the ID of the transmitter
-        parentAWGR (AWGR): the parent AWGR to which transmitter is connected to,
-            defaults to None
-        port (int): the port of the AWGR it is connected to, defaults to None
     """
 
-    def __init__(self, transmitterId, parentAWGR=None, port=None, network=None):
+    __slots__ = ("bank", "transmitterId")
+
+    def __init__(self, bank, transmitterId):
+        self.bank = bank
         self.transmitterId = transmitterId
-        self.parentAWGR = parentAWGR
-        self.awgrPort = port
-        self.transmissions = {}
-        self.bufferCount = 0
-        self.buffer_MAX = 5000
-        self.dispatch_count = 0
-        if network is not None:
-            self.network = network
-
-    def linkAWGR(self, parentAWGR, port):
-        """Links the Transmitter to its parent AWGR
 
-        Args:
-            parentAWGR (AWGR): the parent AWGR to which transmitter is connected to
-            port (int): the port of the AWGR it is connected to
-        """
-        self.parentAWGR = parentAWGR
-        self.awgrPort = port
+    @property
+    def network(self):
+        return self.bank.network
+
+    @property
+    def parentAWGR(self):
+        return self.bank.awgrs[self.transmitterId // self.bank.n]
+
+    @property
+    def awgrPort(self):
+        return self.transmitterId % self.bank.n
+
+    @property
+    def buffer_MAX(self):
+        return self.bank.buffer_MAX
+
+    @property
+    def bufferCount(self):
+        return int(self.bank.bufferCount[self.transmitterId])
+
+    @property
+    def dispatch_count(self):
+        return int(self.bank.dispatch_count[self.transmitterId])
 
     def receive(self, pkt):
-        """Recieve scheduled packets from the PacketGenerator and do further 
+        """Recieve scheduled packets from the PacketGenerator and do further
         processing
 
         Args:
             pkt (Packet): the incoming packet
         """
-        if self.bufferCount < self.buffer_MAX:
-            self.bufferCount += 1
+        bank = self.bank
+        if bank.bufferCount[self.transmitterId] < bank.buffer_MAX:
+            bank.bufferCount[self.transmitterId] += 1
             self.onPacketArrival(pkt)
         else:
-            self.network.overflowDrop += 1
+            bank.network.overflowDrop += 1
+            bank.network.counters.overflow_drops[self.transmitterId] += 1
 
     def onPacketArrival(self, pkt):
         """Communicate with the controller and schedule the packet
@@ -59,35 +155,36 @@ class Transmitter:
         Args:
             pkt (Packet): the incoming packet
         """
-        logger.info(f"[Packet {pkt.pktId}] : Arrived at Transmitter {self.transmitterId}")
-        self.network.controller.enqueue_scheduler(pkt)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Packet %s] : Arrived at Transmitter %s", pkt.pktId, self.transmitterId)
+        self.bank.network.controller.enqueue_scheduler(pkt)
 
     def onSchedule(self, pkt):
-        """Recieve scheduled packets from the Controller and do further 
+        """Recieve scheduled packets from the Controller and do further
         processing
 
         Args:
             pkt (Packet): the incoming packet
         """
-        logger.info(f"[Packet {pkt.pktId}] : Scheduled for dispatch from Transmitter {self.transmitterId}")
-        if pkt.dispatchSlot in self.transmissions.keys():
-            self.transmissions[pkt.dispatchSlot] += 1
-        else:
-            self.transmissions[pkt.dispatchSlot] = 1
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("[Packet %s] : Scheduled for dispatch from Transmitter %s", pkt.pktId,
+                        self.transmitterId)
+        self.bank.recordTransmission(self.transmitterId, pkt.dispatchSlot)
         self.sendPacket(pkt)
 
     def sendPacket(self, pkt):
         """Forward the packet to the parent AWGR
-        
+
         Args:
             pkt (Packet): the incoming packet
         """
+        bank = self.bank
         self.parentAWGR.receive(self.awgrPort, pkt)
-        self.dispatch_count += 1
-        if self.bufferCount > 0:
-            self.bufferCount -= 1
+        bank.dispatch_count[self.transmitterId] += 1
+        if bank.bufferCount[self.transmitterId] > 0:
+            bank.bufferCount[self.transmitterId] -= 1
         else:
-            self.bufferCount = 0
+            bank.bufferCount[self.transmitterId] = 0
 
     def transmissionCount(self, current_slot, k):
         """ Return the count of packets transmitted in the last k
@@ -97,14 +194,5 @@ class Transmitter:
             current_slot (int): the current timeslot that is running
             k (int): the number of latest timeslots to examine
         """
-        iter_ctr = 0
-        ret = 0
-        for slot in reversed(self.transmissions.keys()):
-            if slot < current_slot - k:
-                break
-            ret += self.transmissions[slot]
-            iter_ctr += 1
-            if iter_ctr == k:
-                break
-
-        return ret
+        tId = self.transmitterId
+        return int(self.bank.transmissionCounts(tId, tId + 1, current_slot, k)[0])
@@ -0,0 +1,97 @@
+"""
+counters.py
+
+This file contains the CounterRegistry, which holds the counters of every
+component of the network in preallocated arrays.
+"""
+
+import os
+import numpy as np
+
+# Counters of each group of components. A group holds one row per counter
+# over all its components, see CounterRegistry. Names are unique over all groups
+TRANSMITTER_COUNTERS = ("generated", "overflow_drops", "reroutes", "buffer_high_water")
+# Ports of the AWGRs, indexed [stage, awgr, port] with stage 0 for Stage 1
+# and 1 for Stage 3, as the outgoing port of a packet
+AWGR_PORT_COUNTERS = ("link_drops",)
+# Hello Packets are counted at the Space Switch whose links they probe, and
+# at the receiver they are delivered to. Queues of bounded length refuse or
+# spill packets, see Controller.queue_limit, and their high-water marks
+# include the spilled packets
+SPACE_SWITCH_COUNTERS = ("hellos_sent", "hellos_received", "hellos_expired", "queue_high_water",
+                         "queue_drops", "spilled")
+RECEIVER_COUNTERS = ("received", "hellos_delivered")
+
+class CounterRegistry:
+    """Holds the counters of the transmitters, AWGR ports, Space Switches and
+    receivers of a network. Every group of components is one int64 array with
+    a row per counter, allocated once, and every counter is an attribute that
+    is a view of its row, so that components count with a plain index
+    increment, e.g. counters.overflow_drops[transmitterId] += 1, and engines
+    with whole arrays, e.g. counters.received += np.bincount(dests, minlength=n * n).
+
+    The high-water marks of the transmitter buffers and Space Switch queues
+    are sampled once per slot, before the slot is scheduled, which is when
+    they are largest as packets only leave them when scheduled.
+
+    The scalar counters of the network are kept as they are, these counters
+    break them down by component.
+
+    Args:
+        n (int): the n parameter of the network
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.groups = {
+            "transmitter": (TRANSMITTER_COUNTERS, np.zeros((len(TRANSMITTER_COUNTERS), n * n), dtype=np.int64)),
+            "awgr_port": (AWGR_PORT_COUNTERS, np.zeros((len(AWGR_PORT_COUNTERS), 2, n, n), dtype=np.int64)),
+            "space_switch": (SPACE_SWITCH_COUNTERS, np.zeros((len(SPACE_SWITCH_COUNTERS), n), dtype=np.int64)),
+            "receiver": (RECEIVER_COUNTERS, np.zeros((len(RECEIVER_COUNTERS), n * n), dtype=np.int64)),
+        }
+        for names, array in self.groups.values():
+            for name, row in zip(names, array):
+                setattr(self, name, row)
+
+    def reset(self):
+        """ Zero all counters, in place so that the views stay valid
+        """
+        for names, array in self.groups.values():
+            array.fill(0)
+
+    def sample_high_water(self, bufferCounts, queueLengths):
+        """ Raise the high-water marks to the current occupancy
+
+        Args:
+            bufferCounts (int[]): no. of packets buffered at each transmitter
+            queueLengths (int[]): no. of packets queued at each Space Switch
+        """
+        np.maximum(self.buffer_high_water, bufferCounts, out=self.buffer_high_water)
+        np.maximum(self.queue_high_water, queueLengths, out=self.queue_high_water)
+
+    def arrays(self):
+        """ Returns every counter by its name prefixed with its group, e.g.
+        "transmitter.overflow_drops"
+        """
+        return {f"{group}.{name}": row for group, (names, array) in self.groups.items()
+                for name, row in zip(names, array)}
+
+    def totals(self):
+        """ Returns the network-wide total of every counter, or the maximum for
+        high-water marks
+        """
+        ret = {}
+        for key, row in self.arrays().items():
+            ret[key] = int(row.max() if key.endswith("high_water") else row.sum())
+        return ret
+
+    def dump(self, path):
+        """ Write all counters to a single .npz file, read them back with np.load
+
+        Args:
+            path (str): path of the file, created along with its directory
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, n=self.n, **self.arrays())
@@ -0,0 +1,195 @@
+"""
+estimate.py
+
+This file contains an analytical model of the ASA network, which estimates
+the demand, throughput and latency of a run from its topology and arrival
+rate without simulating it, and the comparison of its estimates with the
+results of full simulations.
+"""
+
+import numpy as np
+
+# Propagation delay of a packet through both AWGR hops, in nanoseconds
+PROPAGATION_DELAY = 1200.0
+
+# Load factors up to LIGHT_LOAD and from SATURATED_LOAD are estimated with
+# confidence, runs in between have to be simulated
+LIGHT_LOAD = 0.6
+SATURATED_LOAD = 1.2
+
+LIGHT = "light"
+UNCERTAIN = "uncertain"
+SATURATED = "saturated"
+
+def pair_rate(network):
+    """ Expected arrivals per slot of every pair of a source and a distinct
+    destination transmitter. Sources are uniform over all transmitters and
+    destinations uniform over the others, as generated by both engines.
+    """
+    size = network.n * network.n
+    return network.rate * network.slot / (size * (size - 1))
+
+def port_routes(network):
+    """ Routing of the ports of the AWGRs. The Space Switch of a packet only
+    depends on the ports of its source and destination transmitter within
+    their AWGRs, as routed by Controller.enqueue_scheduler, so every AWGR
+    routes alike and the flows follow from n x n tables.
+
+    A flow is the packets of one transmitter to one destination AWGR through
+    one Space Switch. The wavelength of a transmitter is fixed by the Space
+    Switch, so the limit of one transmission per wavelength and slot allows
+    one packet per flow and slot.
+
+    Args:
+        network (ASA): the network
+
+    Returns:
+        int[][], int[][] : the no. of destination ports that each source port
+            reaches through each Space Switch, and 1 where a source port
+            reaches its own port, the only destination excluded within its own
+            AWGR, through the switch, both indexed [spaceSwitch, port]
+    """
+    n = network.n
+    ports, destPorts = np.divmod(np.arange(n * n), n)
+    switches = network.slot_engine.switch_ids(ports, destPorts)
+    counts = np.zeros((n, n), dtype=np.int64)
+    np.add.at(counts, (switches, ports), 1)
+    own = np.zeros((n, n), dtype=np.int64)
+    own[network.slot_engine.switch_ids(np.arange(n), np.arange(n)), np.arange(n)] = 1
+    return counts, own
+
+def load_factors(network):
+    """ Load factor of every Space Switch. A switch connects each input AWGR to
+    one output AWGR per slot, and a connection carries one packet of every
+    flow between the two AWGRs. Each connection (a, b) is therefore needed in
+    at least the fraction of slots of the largest flow rate between a and b,
+    and a switch can keep up if these fractions add up to at most 1 for every
+    input and output AWGR. All AWGRs route alike, so every input and output
+    AWGR needs n - 1 connections to other AWGRs and one to its own.
+
+    Args:
+        network (ASA): the network
+
+    Returns:
+        float[] : the load factor of each Space Switch
+    """
+    counts, own = port_routes(network)
+    other = counts.max(axis=1)
+    same = (counts - own).max(axis=1)
+    return pair_rate(network) * ((network.n - 1) * other + same)
+
+def estimate(network, failures=()):
+    """ Estimate the results of a run of a network
+
+    Below saturation, a flow waits for its connection while the input AWGR
+    serves the other output AWGRs, like a queue of a polling system with n
+    queues, on average (n + 1) / 2 slots at light load, increased by a factor
+    1 / (1 - load factor). Above saturation, the queues grow over the whole
+    arrival phase, every packet is delivered during the drain, and the
+    latency grows with the runtime. Hello Packets are left out.
+
+    Args:
+        network (ASA): the network, with the rate, slot duration and runtime of the run
+        failures ((int, int, int)[]): link failures of the run, defaults to ()
+
+    Returns:
+        dict : the load factor, the regime (LIGHT, UNCERTAIN or SATURATED),
+            whether it is confident, the demand of every Space Switch and the
+            throughput in packets per slot, the delivered fraction and the
+            expected overflow drops, and the latency in ns and in ms
+    """
+    n = network.n
+    slot = network.slot
+    slots = network.runtime / slot
+    factors = load_factors(network)
+    rho = float(factors.max())
+    # Every source port reaches its counts of ports of all n AWGRs, less its own
+    # port within its own AWGR, from all n AWGRs
+    counts, own = port_routes(network)
+    demand = pair_rate(network) * n * (n * counts.sum(axis=1) - own.sum(axis=1))
+    arrivals = float(demand.sum())
+    base = slot / 2 + PROPAGATION_DELAY
+
+    if rho < 1:
+        queueing = (n + 1) / 2 / (1 - rho)
+        throughput = arrivals
+        drops = 0.0
+    else:
+        # Packets wait for the backlog built up since the start of the run
+        queueing = (n + 1) / 2 + slots * (rho - 1) / 2
+        throughput = arrivals / rho
+        # Buffers fill with the excess arrivals of their transmitter until they overflow
+        excess = arrivals * (1 - 1 / rho) / (n * n)
+        full = network.transmitters.buffer_MAX / excess
+        drops = max(0.0, slots - full) * excess * n * n
+    latency = base + queueing * slot
+
+    if rho <= LIGHT_LOAD:
+        regime = LIGHT
+    elif rho >= SATURATED_LOAD:
+        regime = SATURATED
+    else:
+        regime = UNCERTAIN
+    return {"load_factor": rho,
+            "regime": regime,
+            # Link failures re-route packets, which the model does not cover
+            "confident": regime != UNCERTAIN and len(failures) == 0,
+            "switch_demand": demand.tolist(),
+            "throughput": throughput,
+            "delivered": 1 - drops / (arrivals * slots) if arrivals > 0 else 1.0,
+            "overflow_drops": drops,
+            "latency": latency,
+            "latency_ms": latency / 1e6}
+
+def compare(estimates, metrics):
+    """ Compare an estimate with the results of a full simulation
+
+    Args:
+        estimates (dict): the estimate, from estimate
+        metrics (dict): the results of the simulation, by the names in
+            core.resultStore.METRIC_FIELDS
+
+    Returns:
+        dict : the load factor, regime and the estimated and simulated latency
+            and delivered fraction
+    """
+    latency = metrics["latency"]
+    delivered = metrics["received"] / metrics["generated"] if metrics["generated"] else None
+    return {"load_factor": estimates["load_factor"],
+            "regime": estimates["regime"],
+            "estimated_latency": estimates["latency"],
+            "latency": latency,
+            "estimated_delivered": estimates["delivered"],
+            "delivered": delivered}
+
+def format_validation(rows):
+    """ Returns the comparisons of a validation as a table
+
+    Args:
+        rows ((str, dict[])[]): a label and the comparisons of every point, e.g.
+            one per network size over its seeds, from compare
+
+    Returns:
+        str : the table, with the mean over the comparisons of every label
+    """
+    lines = ["%-12s %7s %-10s %12s %12s %8s %9s %9s" % ("point", "load", "regime", "est lat ms",
+                                                       "sim lat ms", "error", "est deliv", "sim deliv")]
+    errors = []
+    for label, comparisons in rows:
+        simulated = [c for c in comparisons if c["latency"] is not None]
+        if not simulated:
+            continue
+        first = simulated[0]
+        latency = float(np.mean([c["latency"] for c in simulated]))
+        error = (first["estimated_latency"] - latency) / latency
+        errors.append((first["regime"], abs(error)))
+        lines.append("%-12s %7.3f %-10s %12.4f %12.4f %+7.1f%% %9.4f %9.4f"
+                     % (label, first["load_factor"], first["regime"], first["estimated_latency"] / 1e6,
+                        latency / 1e6, 100 * error, first["estimated_delivered"],
+                        float(np.mean([c["delivered"] for c in simulated]))))
+    for regime in (LIGHT, UNCERTAIN, SATURATED):
+        regimeErrors = [error for r, error in errors if r == regime]
+        if regimeErrors:
+            lines.append(f"{regime} : mean absolute latency error {100 * np.mean(regimeErrors):.1f}%"
+                         f" over {len(regimeErrors)} points")
+    return "\n".join(lines)
@@ -0,0 +1,427 @@
+"""
+logIngest.py
+
+This file contains the log ingestion, which turns the text logs written
+through core/logger.py into columnar files in a single pass.
+
+Outputs, written to the output directory:
+
+    * ``latency.npy``    -- (packet, latency) of every packet in --Latency.log
+    * ``throughput.npy`` -- (slot, received) per time slot, from --Throughput.log
+    * ``dispatch.npy``   -- (slot, data, hello) packets assigned to every time slot,
+      from --ASA.log
+    * ``reroutes.npy``   -- (transmitter, reroutes) from --ASA.log
+    * ``drops.npy``      -- (stage, awgr, data, hello) link drops from --ASA.log
+    * ``summary.json``   -- totals of all of the above, the link failures and the
+      end of run counters of --ASA.log
+
+The ``.npy`` files hold structured arrays, like the traces of TraceSource, and
+can be memory-mapped with ``np.load(path, mmap_mode="r")``.
+"""
+
+import gzip
+import json
+import multiprocessing as mp
+import os
+import re
+import struct
+from collections import Counter
+import numpy as np
+
+from core.logger import CHANNELS
+
+# Bytes read at a time, every chunk is cut at its last complete line
+CHUNK_SIZE = 64 << 20
+
+# Size of the .npy headers, which are rewritten with the final record count
+HEADER_SIZE = 256
+
+# Records present on most lines are extracted with findall over a whole chunk
+# A latency record is matched as a whole line, so that its packet ID and value stay paired
+LATENCY_RECORD = re.compile(rb"\[Packet (\d+)\], ([-+.\deE]+|nan|inf)$", re.MULTILINE)
+THROUGHPUT_RECORD = re.compile(rb"^\d+, ([^\n]+)", re.MULTILINE)
+ASSIGNED = re.compile(rb"Time Slot Assigned = ([^\n]+)")
+HELLO_ASSIGNED = re.compile(rb"hello-\d+\] : Time Slot Assigned = ([^\n]+)")
+
+# Rare records are located by a marker, see scan_lines, and matched on their line
+REROUTED_OR_DROPPED = (b"] : Being ", re.compile(rb"\[Packet ([^\]]+)\] : Being (?:re-routed through Transmitter (\d+)"
+                                                 rb"|dropped at Stage (\d) AWGR with ID = (\d+))"))
+FAILURE = (b"] : Failure at ", re.compile(rb"Failure at ([^\n]+)\.$"))
+TOTALS = [(name + b" ", re.compile(rb"\] : (" + name + rb") ([^\n]+)"))
+          for name in (b"Generated Packets", b"Received Packets", b"Overflow Drops", b"Link Drops",
+                       b"Average Latency")]
+LATE_HELLO = b"Past threshold arrival of Hello Packet"
+
+# The end of run counters are only searched for in the last bytes of a log
+TAIL_SIZE = 1 << 20
+
+def read_chunks(path, chunk_size=CHUNK_SIZE):
+    """ Read a log file in chunks of whole lines, gzip compressed logs included
+
+    Args:
+        path (str): path of the log file
+        chunk_size (int): no. of bytes read at a time, defaults to CHUNK_SIZE
+
+    Returns:
+        generator : yields chunks of bytes, each ending with a newline
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as log:
+        while True:
+            data = log.read(chunk_size)
+            if not data:
+                break
+            if not data.endswith(b"\n"):
+                # Complete the last line, the last line of the log may lack its newline
+                data += log.readline()
+                if not data.endswith(b"\n"):
+                    data += b"\n"
+            yield data
+
+def chunk_ranges(path, chunk_size=CHUNK_SIZE):
+    """ Split an uncompressed log file into byte ranges of whole lines
+
+    Args:
+        path (str): path of the log file
+        chunk_size (int): approximate no. of bytes per range, defaults to CHUNK_SIZE
+
+    Returns:
+        (int, int)[] : the start and end offsets of every range
+    """
+    size = os.path.getsize(path)
+    bounds = [0]
+    with open(path, "rb") as log:
+        while bounds[-1] + chunk_size < size:
+            log.seek(bounds[-1] + chunk_size)
+            log.readline()
+            bounds.append(log.tell())
+    if bounds[-1] < size:
+        bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def read_range(path, start, end):
+    """ Read a byte range of an uncompressed log file, ending with a newline
+    """
+    with open(path, "rb") as log:
+        log.seek(start)
+        data = log.read(end - start)
+    if data and not data.endswith(b"\n"):
+        data += b"\n"
+    return data
+
+def parse_range(job):
+    """ Read a byte range of a log file and parse it, run in a worker process
+
+    Args:
+        job ((function, str, int, int)): the chunk parser, the path of the log
+            file and the start and end offsets of the range
+
+    Returns:
+        the result of the chunk parser
+    """
+    parser, path, start, end = job
+    return parser(read_range(path, start, end))
+
+def scan_lines(chunk, record):
+    """ Match a pattern on every line of a chunk that holds a marker. The lines
+    are located with bytes.find, which skips through a chunk much faster than
+    a regular expression search does.
+
+    Args:
+        chunk (bytes): the chunk, ending with a newline
+        record ((bytes, Pattern)): the marker and the pattern
+
+    Returns:
+        tuple[] : the groups of every match
+    """
+    marker, pattern = record
+    records = []
+    pos = chunk.find(marker)
+    while pos >= 0:
+        start = chunk.rfind(b"\n", 0, pos) + 1
+        end = chunk.find(b"\n", pos)
+        match = pattern.search(chunk, start, end)
+        if match is not None:
+            records.append(match.groups())
+        pos = chunk.find(marker, end)
+    return records
+
+def to_array(values, dtype):
+    """ Convert the matched byte strings of a pattern to numbers
+    """
+    convert = int if np.dtype(dtype).kind == "i" else float
+    return np.array(list(map(convert, values)), dtype=dtype)
+
+def count_indices(indices, weights=None):
+    """ Returns the no. of occurrences of every index, optionally weighted
+    """
+    if len(indices) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    return np.rint(np.bincount(indices, weights=weights)).astype(np.int64)
+
+def count_slots(values):
+    """ Returns the no. of occurrences of every slot in values. Slots repeat for
+    all the packets of a slot, so only the distinct values are converted.
+
+    Args:
+        values (bytes[]): the matched slot numbers
+
+    Returns:
+        int[] : counts by slot
+    """
+    occurrences = Counter(values)
+    slots = np.array([float(value) for value in occurrences], dtype=np.float64).astype(np.int64)
+    return count_indices(slots, np.array(list(occurrences.values()), dtype=np.float64))
+
+def pad(counts, size):
+    """ Returns counts extended with zeros to the given size
+    """
+    return np.concatenate((counts, np.zeros((size - len(counts),), dtype=counts.dtype)))
+
+def parse_latency(chunk):
+    """ Parse a chunk of a --Latency.log
+
+    Returns:
+        int[], float[] : the packet IDs and their latencies
+    """
+    records = LATENCY_RECORD.findall(chunk)
+    return (to_array([pktId for pktId, value in records], np.int64),
+            to_array([value for pktId, value in records], np.float64))
+
+def parse_throughput(chunk):
+    """ Parse a chunk of a --Throughput.log
+
+    Returns:
+        int[] : the no. of packets received in every slot
+    """
+    slots = to_array(THROUGHPUT_RECORD.findall(chunk), np.float64).astype(np.int64)
+    return count_indices(slots)
+
+def parse_asa(chunk):
+    """ Parse a chunk of an --ASA.log
+
+    Returns:
+        dict : the no. of packets and of Hello Packets assigned to every slot,
+            the no. of re-routes of every transmitter, the link drops of data and
+            Hello Packets by (stage, awgr_id), the times of link failures and the
+            no. of Hello Packets that arrived past the threshold
+    """
+    ret = {"assigned": count_slots(ASSIGNED.findall(chunk)),
+           "hello_assigned": count_slots(HELLO_ASSIGNED.findall(chunk)),
+           "drops": {}}
+    transmitters = []
+    for pktId, transmitterId, stage, awgrId in scan_lines(chunk, REROUTED_OR_DROPPED):
+        if transmitterId:
+            transmitters.append(transmitterId)
+        else:
+            ret["drops"].setdefault((int(stage), int(awgrId)), [0, 0])[pktId.startswith(b"hello-")] += 1
+    ret["reroutes"] = count_indices(to_array(transmitters, np.int64))
+    ret["failures"] = [float(t) for t, in scan_lines(chunk, FAILURE)]
+    ret["late_hellos"] = chunk.count(LATE_HELLO)
+    return ret
+
+def merge_counts(counts, new):
+    """ Add two count arrays of possibly different lengths
+    """
+    size = max(len(counts), len(new))
+    return pad(counts, size) + pad(new, size)
+
+class ColumnWriter:
+    """Writes a structured .npy file record block by record block, without
+    holding the records in memory. The header reserves room for the record
+    count, which is filled in on close.
+
+    Args:
+        path (str): path of the .npy file
+        dtype (dtype): the structured dtype of the records
+    """
+
+    def __init__(self, path, dtype):
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.file = open(path, "wb")
+        self.write_header()
+
+    def write_header(self):
+        header = "{'descr': %r, 'fortran_order': False, 'shape': (%d,), }" % (
+            np.lib.format.dtype_to_descr(self.dtype), self.count)
+        header = header.ljust(HEADER_SIZE - 11) + "\n"
+        self.file.seek(0)
+        self.file.write(b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1"))
+
+    def append(self, **columns):
+        """ Append records, given as one array per field
+        """
+        size = len(next(iter(columns.values())))
+        block = np.empty((size,), dtype=self.dtype)
+        for name, values in columns.items():
+            block[name] = values
+        self.file.write(block.tobytes())
+        self.count += size
+
+    def close(self):
+        self.write_header()
+        self.file.close()
+
+def write_columns(path, **columns):
+    """ Write whole columns to a structured .npy file
+    """
+    dtype = [(name, np.asarray(values).dtype) for name, values in columns.items()]
+    records = np.empty((len(next(iter(columns.values()))),), dtype=dtype)
+    for name, values in columns.items():
+        records[name] = values
+    np.save(path, records)
+
+class LogIngest:
+    """Parses the logs of a run in large chunks, extracting the records of
+    every chunk with compiled regular expressions and converting them to
+    arrays at once, instead of handling the logs line by line. Per packet
+    records are streamed to disk and per slot records are kept as counts, so
+    memory stays bounded by the chunk size and the no. of slots.
+
+    Per slot throughput is taken from --Throughput.log, which holds the slot
+    at which each packet was received. --ASA.log only holds the slot each
+    packet was assigned, which is recorded as dispatch.npy.
+
+    Args:
+        output_dir (str): directory of the columnar files, created if missing
+        chunk_size (int): no. of bytes read at a time, defaults to CHUNK_SIZE
+    """
+
+    def __init__(self, output_dir, chunk_size=CHUNK_SIZE, workers=1):
+        self.output_dir = output_dir
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.pool = None
+        os.makedirs(output_dir, exist_ok=True)
+        self.summary = {}
+        # Last bytes of the log being parsed
+        self.tail = b""
+
+    def output(self, name):
+        return os.path.join(self.output_dir, name)
+
+    def parsed_chunks(self, path, parser):
+        """ Parse a log file chunk by chunk, on the worker processes if there are
+        any. Compressed logs are always parsed sequentially.
+
+        Args:
+            path (str): path of the log file
+            parser (function): the chunk parser
+
+        Returns:
+            generator : yields the result of the parser for every chunk, in order
+        """
+        self.tail = b""
+        if self.pool is None or path.endswith(".gz"):
+            for chunk in read_chunks(path, self.chunk_size):
+                self.tail = (self.tail + chunk[-TAIL_SIZE:])[-TAIL_SIZE:]
+                yield parser(chunk)
+        else:
+            jobs = [(parser, path, start, end) for start, end in chunk_ranges(path, self.chunk_size)]
+            yield from self.pool.imap(parse_range, jobs)
+            size = os.path.getsize(path)
+            self.tail = read_range(path, max(size - TAIL_SIZE, 0), size)
+
+    def ingest_latency(self, path):
+        """ Stream the per packet latencies of a --Latency.log to latency.npy
+        """
+        writer = ColumnWriter(self.output("latency.npy"), [("packet", np.int64), ("latency", np.float64)])
+        total = 0.0
+        maximum = 0.0
+        try:
+            for packets, latencies in self.parsed_chunks(path, parse_latency):
+                if len(latencies) == 0:
+                    continue
+                writer.append(packet=packets, latency=latencies)
+                total += float(latencies.sum())
+                maximum = max(maximum, float(latencies.max()))
+        finally:
+            writer.close()
+        self.summary["latency"] = {"packets": writer.count,
+                                   "mean": total / writer.count if writer.count > 0 else None,
+                                   "max": maximum}
+
+    def ingest_throughput(self, path):
+        """ Count the packets received in every slot of a --Throughput.log
+        """
+        received = np.zeros((0,), dtype=np.int64)
+        for counts in self.parsed_chunks(path, parse_throughput):
+            received = merge_counts(received, counts)
+        write_columns(self.output("throughput.npy"), slot=np.arange(len(received)), received=received)
+        self.summary["throughput"] = {"received": int(received.sum()), "slots": len(received)}
+
+    def ingest_asa(self, path):
+        """ Extract the slot assignments, re-routes, drops, failures and end of
+        run counters of an --ASA.log
+        """
+        assigned = np.zeros((0,), dtype=np.int64)
+        helloAssigned = np.zeros((0,), dtype=np.int64)
+        reroutes = np.zeros((0,), dtype=np.int64)
+        # Link drops by stage (1 or 3) and AWGR, of data packets and of Hello Packets
+        drops = {}
+        failures = []
+        lateHellos = 0
+        for parsed in self.parsed_chunks(path, parse_asa):
+            assigned = merge_counts(assigned, parsed["assigned"])
+            helloAssigned = merge_counts(helloAssigned, parsed["hello_assigned"])
+            reroutes = merge_counts(reroutes, parsed["reroutes"])
+            for key, (data, hello) in parsed["drops"].items():
+                count = drops.setdefault(key, [0, 0])
+                count[0] += data
+                count[1] += hello
+            failures += parsed["failures"]
+            lateHellos += parsed["late_hellos"]
+        totals = {}
+        for record in TOTALS:
+            for name, value in scan_lines(self.tail, record):
+                totals[name.decode()] = int(value) if value.isdigit() else float(value)
+
+        size = max(len(assigned), len(helloAssigned))
+        assigned = pad(assigned, size)
+        helloAssigned = pad(helloAssigned, size)
+        write_columns(self.output("dispatch.npy"), slot=np.arange(size), data=assigned - helloAssigned,
+                      hello=helloAssigned)
+        write_columns(self.output("reroutes.npy"), transmitter=np.arange(len(reroutes)), reroutes=reroutes)
+        keys = sorted(drops)
+        write_columns(self.output("drops.npy"),
+                      stage=np.array([key[0] for key in keys], dtype=np.int64),
+                      awgr=np.array([key[1] for key in keys], dtype=np.int64),
+                      data=np.array([drops[key][0] for key in keys], dtype=np.int64),
+                      hello=np.array([drops[key][1] for key in keys], dtype=np.int64))
+        self.summary["asa"] = {"dispatched": int(assigned.sum() - helloAssigned.sum()),
+                               "hellos_dispatched": int(helloAssigned.sum()),
+                               "reroutes": int(reroutes.sum()),
+                               "link_drops": sum(count[0] for count in drops.values()),
+                               "hello_drops": sum(count[1] for count in drops.values()),
+                               "late_hellos": lateHellos,
+                               "failures": failures,
+                               "totals": totals}
+
+    def ingest(self, prefix):
+        """ Ingest every log of a run that exists
+
+        Args:
+            prefix (str): path of the logs without their suffixes, e.g.
+                "results/2021-03-01 10:00:00.000000"
+
+        Returns:
+            dict : the summary, also written to summary.json
+        """
+        parsers = {"asa": self.ingest_asa, "latency": self.ingest_latency,
+                   "receive": self.ingest_throughput}
+        if self.workers > 1:
+            self.pool = mp.Pool(self.workers)
+        try:
+            for channel, (suffix, fmt) in CHANNELS.items():
+                for path in (prefix + suffix, prefix + suffix + ".gz"):
+                    if os.path.exists(path):
+                        parsers[channel](path)
+                        break
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+        with open(self.output("summary.json"), "w") as summary:
+            json.dump(self.summary, summary, indent=2)
+        return self.summary
@@ -1,33 +1,290 @@
+"""
+logger.py
+
+This file contains the loggers used across the simulator. Importing it
+installs no handlers, logging is set up explicitly at the start of a run
+through configure_logging.
+"""
+
+import atexit
+import collections.abc
+import gzip
 import logging
+import os
+import queue
+import threading
+import time
 from datetime import datetime
 
-prefix = datetime.today().isoformat(sep=' ')
+# Log channels, with the suffix of their log file and their record format
+CHANNELS = {
+    "asa": ("--ASA.log", '[%(levelname)s] : %(message)s'),
+    "latency": ("--Latency.log", '[%(levelname)s] : %(message)s'),
+    "receive": ("--Throughput.log", '%(message)s'),
+}
 
-logger = logging.getLogger('asa')
-logger.setLevel(logging.DEBUG)
+DEFAULT_LEVELS = {
+    "asa": logging.DEBUG,
+    "latency": logging.INFO,
+    "receive": logging.INFO,
+}
 
-file_handler = logging.FileHandler("results/" + prefix + "--ASA.log")
-formatter = logging.Formatter('[%(levelname)s] : %(message)s')
-file_handler.setFormatter(formatter)
+# Level above every standard level, a logger set to it discards all records
+# before they are created
+SILENT = logging.CRITICAL + 1
 
-logger.addHandler(file_handler)
+# Module flags of logging that make every LogRecord look up its thread and
+# process. The background writer never uses them, so they are switched off
+# while it runs, along with logging._srcfile, which walks the stack of the
+# caller to find its source line
+RECORD_FLAGS = ("logThreads", "logProcesses", "logMultiprocessing")
 
-latency_logger = logging.getLogger('latency')
-latency_logger.setLevel(logging.INFO)
+class QueuedRecord(logging.LogRecord):
+    """Record factory installed while the background writer runs. It sets the
+    same attributes as a LogRecord, but leaves out the source file, time
+    fractions, thread and process, which the writer never uses. That saves
+    most of the cost of creating a record on the simulation thread.
+    """
+
+    def __init__(self, name, level, pathname, lineno, msg, args, exc_info,
+                 func=None, sinfo=None, **kwargs):
+        self.name = name
+        self.msg = msg
+        if args and len(args) == 1 and isinstance(args[0], collections.abc.Mapping) and args[0]:
+            args = args[0]
+        self.args = args
+        self.levelname = logging.getLevelName(level)
+        self.levelno = level
+        self.pathname = self.filename = pathname
+        self.module = "Unknown module"
+        self.exc_info = exc_info
+        self.exc_text = None
+        self.stack_info = sinfo
+        self.lineno = lineno
+        self.funcName = func
+        self.created = time.time()
+        self.msecs = 0.0
+        self.relativeCreated = 0.0
+        self.thread = self.threadName = None
+        self.process = self.processName = None
+
+class QueueingHandler(logging.Handler):
+    """Handler of a channel while a background writer is attached. It hands
+    every record to the queue of the writer, so the calling thread never
+    writes a record, and the message is only formatted by the writer when the
+    record was logged with lazy % arguments.
+
+    The queue is thread safe, so records are handed over without taking the
+    lock of the handler. Handler filters are not applied.
+
+    Args:
+        writer (BackgroundWriter): the writer of the records
+    """
+
+    def __init__(self, writer):
+        logging.Handler.__init__(self)
+        self.writer = writer
+
+    def handle(self, record):
+        self.writer.records.put(record)
+        return True
+
+    def emit(self, record):
+        self.writer.records.put(record)
+
+class BufferedFileHandler(logging.FileHandler):
+    """File handler that writes through a large buffer, optionally gzip
+    compressed, instead of flushing after every record. The buffer is written
+    out by flush, which the background writer calls after every batch. The
+    file is only created when the first record is written.
+
+    Args:
+        filename (str): path of the log file, ".gz" is appended when compressed
+        compress (bool): gzip the log file, defaults to False
+        buffer_size (int): size of the write buffer in bytes, defaults to 1 MiB
+    """
+
+    def __init__(self, filename, compress=False, buffer_size=1 << 20):
+        self.compress = compress
+        self.buffer_size = buffer_size
+        if compress:
+            filename += ".gz"
+        logging.FileHandler.__init__(self, filename, delay=True)
+
+    def _open(self):
+        if self.compress:
+            return gzip.open(self.baseFilename, "at", encoding=self.encoding)
+        return open(self.baseFilename, self.mode, buffering=self.buffer_size,
+                    encoding=self.encoding)
+
+class BackgroundWriter(threading.Thread):
+    """Thread that drains the queued records of all channels in batches,
+    formats and writes them through the file handler of their channel, and
+    flushes the files after every batch.
+
+    Records without exception or stack information are formatted straight
+    from the channel format, without going through a Formatter.
 
-f = logging.FileHandler("results/" + prefix + "--Latency.log")
-frmt = logging.Formatter('[%(levelname)s] : %(message)s')
-f.setFormatter(frmt)
+    Args:
+        handlers (dict): file handler per channel name
+        batch_size (int): max no. of records taken off the queue at once, defaults to 4096
+    """
 
-latency_logger.addHandler(f)
+    def __init__(self, handlers, batch_size=4096):
+        threading.Thread.__init__(self, name="log-writer", daemon=True)
+        self.handlers = handlers
+        self.formats = {channel: CHANNELS[channel][1] + "\n" for channel in handlers}
+        self.batch_size = batch_size
+        self.records = queue.SimpleQueue()
 
+    def run(self):
+        while True:
+            batch = [self.records.get()]
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self.records.get_nowait())
+            except queue.Empty:
+                pass
+            for record in batch:
+                if record is None:
+                    for handler in self.handlers.values():
+                        handler.close()
+                    return
+                if record.exc_info or record.stack_info:
+                    self.handlers[record.name].handle(record)
+                else:
+                    self.write(record)
+            for handler in self.handlers.values():
+                handler.flush()
+
+    def write(self, record):
+        """ Format a plain record and write it to the file of its channel
+        """
+        handler = self.handlers[record.name]
+        if handler.stream is None:
+            handler.stream = handler._open()
+        handler.stream.write(self.formats[record.name] % {"levelname": record.levelname,
+                                                          "message": record.getMessage()})
+
+    def stop(self):
+        """ Write out every queued record, close the log files and end the thread
+        """
+        self.records.put(None)
+        self.join()
+
+logger = logging.getLogger('asa')
+latency_logger = logging.getLogger('latency')
 receive_logger = logging.getLogger('receive')
-receive_logger.setLevel(logging.INFO)
 
-fr = logging.FileHandler("results/" + prefix + "--Throughput.log")
-frmtr = logging.Formatter('%(message)s')
-fr.setFormatter(frmtr)
+# Name of the latency log of the current run, None while logging is off
+LogName = None
+# Background thread writing the records of all channels, if enabled
+_writer = None
+# Values of logging._srcfile, RECORD_FLAGS and the record factory to restore
+# once the background writer stops
+_record_settings = None
+
+def shutdown_logging():
+    """ Stop the background log writer, if one is running, after it has written
+    out every queued record.
+    """
+    global _writer, _record_settings
+    if _writer is not None:
+        for channel in CHANNELS:
+            log = logging.getLogger(channel)
+            for handler in list(log.handlers):
+                if isinstance(handler, QueueingHandler):
+                    log.removeHandler(handler)
+        _writer.stop()
+        _writer = None
+        logging._srcfile, flags, factory = _record_settings
+        for flag, value in flags.items():
+            setattr(logging, flag, value)
+        logging.setLogRecordFactory(factory)
+        _record_settings = None
+
+atexit.register(shutdown_logging)
+
+def disable_logging():
+    """ Turn all channels into a null sink. No handlers are installed, and
+    records are discarded at the level check, so no file I/O takes place.
+    """
+    global LogName
+    shutdown_logging()
+    for channel in CHANNELS:
+        log = logging.getLogger(channel)
+        for handler in list(log.handlers):
+            log.removeHandler(handler)
+            handler.close()
+        log.setLevel(SILENT)
+        log.propagate = False
+    LogName = None
+
+def configure_logging(output_dir="results", levels=None, prefix=None,
+                      background=False, compress=False):
+    """ Set up the log channels for a run. Each enabled channel writes to its own
+    file in output_dir, named with a common prefix.
+
+    With background set, the simulation thread only enqueues records, and a single
+    writer thread formats them and writes them out through buffered files. Records
+    then carry no source line, thread or process information.
+
+    Args:
+        output_dir (str): directory for the log files, created if missing. None
+            disables all logging, defaults to "results"
+        levels (dict): level per channel ("asa", "latency", "receive"), a level of
+            None disables that channel, defaults to DEFAULT_LEVELS
+        prefix (str): prefix of the log file names, defaults to the current timestamp
+        background (bool): write the logs from a background thread, defaults to False
+        compress (bool): gzip the log files, only used with background, defaults to False
+
+    Returns:
+        str : the name of the latency log file, or None if logging is off
+    """
+    global LogName, _writer, _record_settings
+    disable_logging()
+    if output_dir is None:
+        return None
+
+    if levels is None:
+        levels = DEFAULT_LEVELS
+    if prefix is None:
+        prefix = datetime.today().isoformat(sep=' ')
+    os.makedirs(output_dir, exist_ok=True)
+
+    if background:
+        channel_handlers = {}
+
+    for channel, (suffix, fmt) in CHANNELS.items():
+        level = levels.get(channel, DEFAULT_LEVELS[channel])
+        if level is None:
+            continue
+        log = logging.getLogger(channel)
+        log.setLevel(level)
+        filename = os.path.join(output_dir, prefix + suffix)
+        if background:
+            file_handler = BufferedFileHandler(filename, compress=compress)
+            channel_handlers[channel] = file_handler
+        else:
+            file_handler = logging.FileHandler(filename, delay=True)
+            log.addHandler(file_handler)
+        file_handler.setFormatter(logging.Formatter(fmt))
+
+    if background:
+        _record_settings = (logging._srcfile, {flag: getattr(logging, flag) for flag in RECORD_FLAGS},
+                            logging.getLogRecordFactory())
+        logging._srcfile = None
+        for flag in RECORD_FLAGS:
+            setattr(logging, flag, False)
+        logging.setLogRecordFactory(QueuedRecord)
+        _writer = BackgroundWriter(channel_handlers)
+        for channel in channel_handlers:
+            logging.getLogger(channel).addHandler(QueueingHandler(_writer))
+        _writer.start()
 
-receive_logger.addHandler(fr)
+    LogName = prefix + CHANNELS["latency"][0]
+    if background and compress:
+        LogName += ".gz"
+    return LogName
 
-LogName = prefix + "--Latency.log"
+disable_logging()
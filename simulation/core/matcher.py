@@ -11,21 +11,38 @@ Borrowed From:
 
 import numpy as np
 
+def isclose(a, b):
+    """Same test as np.isclose with its default tolerances, for two finite
+    float32 values held as Python floats, rounded as in float32 arithmetic
+    """
+    diff = abs(a - b)
+    if diff == 0:
+        return True
+    if diff > 2e-05 * abs(b) + 1e-08:
+        return False
+    return bool(np.float32(diff) <= np.float32(1e-08) + np.float32(1e-05) * np.float32(abs(b)))
+
 class Matcher:
+    """Hungarian algorithm for the assignment problem of an n x m weight
+    matrix, n <= m. The matrices of the Space Switches are small, so the
+    labels and slacks are kept in Python lists, which is much faster than
+    NumPy arrays of n elements. Weights are rounded to float32, and the
+    sums of integer weights, such as request counts, are exact.
+    """
 
     ## weights : nxm weight matrix (numpy , float), n <= m
     def __init__(self, weights):
         weights = np.array(weights).astype(np.float32)
-        self.weights = weights
         self.n, self.m = weights.shape
         assert self.n <= self.m
+        self.weights = weights.tolist()
         # init label
-        self.label_x = np.max(weights, axis=1)
-        self.label_y = np.zeros((self.m, ), dtype=np.float32)
+        self.label_x = [max(row) for row in self.weights]
+        self.label_y = [0.0] * self.m
 
         self.max_match = 0
-        self.xy = -np.ones((self.n,), dtype=np.int)
-        self.yx = -np.ones((self.m,), dtype=np.int)
+        self.xy = [-1] * self.n
+        self.yx = [-1] * self.m
 
     def do_augment(self, x, y):
         self.max_match += 1
@@ -36,55 +53,56 @@ class Matcher:
             x, y = self.prev[x], ty
 
     def find_augment_path(self):
-        self.S = np.zeros((self.n,), np.bool)
-        self.T = np.zeros((self.m,), np.bool)
-
-        self.slack = np.zeros((self.m,), dtype=np.float32)
-        self.slackyx = -np.ones((self.m,), dtype=np.int)  # l[slackyx[y]] + l[y] - w[slackx[y], y] == slack[y]
-
-        self.prev = -np.ones((self.n,), np.int)
+        n, m = self.n, self.m
+        weights, label_x, label_y, yx = self.weights, self.label_x, self.label_y, self.yx
+        self.S = S = [False] * n
+        self.T = T = [False] * m
+        self.prev = [-1] * n
 
         queue, st = [], 0
-        root = -1
-
-        for x in range(self.n):
-            if self.xy[x] == -1:
-                queue.append(x);
-                root = x
-                self.prev[x] = -2
-                self.S[x] = True
-                break
+        root = self.xy.index(-1)
+        queue.append(root)
+        self.prev[root] = -2
+        S[root] = True
 
-        self.slack = self.label_y + self.label_x[root] - self.weights[root]
-        self.slackyx[:] = root
+        # l[slackyx[y]] + l[y] - w[slackx[y], y] == slack[y]
+        row = weights[root]
+        self.slack = [label_y[y] + label_x[root] - row[y] for y in range(m)]
+        self.slackyx = [root] * m
 
         while True:
             while st < len(queue):
-                x = queue[st]; st+= 1
+                x = queue[st]; st += 1
 
-                is_in_graph = np.isclose(self.weights[x], self.label_x[x] + self.label_y)
-                nonzero_inds = np.nonzero(np.logical_and(is_in_graph, np.logical_not(self.T)))[0]
-
-                for y in nonzero_inds:
-                    if self.yx[y] == -1:
-                        return x, y
-                    self.T[y] = True
-                    queue.append(self.yx[y])
-                    self.add_to_tree(self.yx[y], x)
+                # Labels are fixed while the tree grows, so edges are tested as they are reached.
+                # Most weights are far from their labels and fail the cheap bound of isclose
+                row = weights[x]
+                label = label_x[x]
+                for y in range(m):
+                    if T[y]:
+                        continue
+                    bound = label + label_y[y]
+                    diff = abs(row[y] - bound)
+                    if diff == 0 or (diff <= 2e-05 * abs(bound) + 1e-08 and isclose(row[y], bound)):
+                        if yx[y] == -1:
+                            return x, y
+                        T[y] = True
+                        queue.append(yx[y])
+                        self.add_to_tree(yx[y], x)
 
             self.update_labels()
             queue, st = [], 0
-            is_in_graph = np.isclose(self.slack, 0)
-            nonzero_inds = np.nonzero(np.logical_and(is_in_graph, np.logical_not(self.T)))[0]
+            slack = self.slack
+            tight = [y for y in range(m) if not T[y] and abs(slack[y]) <= 2e-08 and isclose(slack[y], 0.)]
 
-            for y in nonzero_inds:
+            for y in tight:
                 x = self.slackyx[y]
-                if self.yx[y] == -1:
+                if yx[y] == -1:
                     return x, y
-                self.T[y] = True
-                if not self.S[self.yx[y]]:
+                T[y] = True
+                if not S[yx[y]]:
                     queue.append(x)
-                    self.add_to_tree(self.yx[y], x)
+                    self.add_to_tree(yx[y], x)
 
     def solve(self, verbose = False):
         while self.max_match < self.n:
@@ -95,9 +113,9 @@ class Matcher:
         matches = []
         for x in range(self.n):
             if verbose:
-                print('match {} to {}, weight {:.4f}'.format(x, self.xy[x], self.weights[x, self.xy[x]]))
+                print('match {} to {}, weight {:.4f}'.format(x, self.xy[x], self.weights[x][self.xy[x]]))
             matches.append(self.xy[x])
-            sum += self.weights[x, self.xy[x]]
+            sum += self.weights[x][self.xy[x]]
         self.best = sum
         if verbose:
             print('ans: {:.4f}'.format(sum))
@@ -108,15 +126,255 @@ class Matcher:
         self.S[x] = True
         self.prev[x] = prevx
 
-        better_slack_idx = self.label_x[x] + self.label_y - self.weights[x] < self.slack
-        self.slack[better_slack_idx] = self.label_x[x] + self.label_y[better_slack_idx] - self.weights[x, better_slack_idx]
-        self.slackyx[better_slack_idx] = x
+        row = self.weights[x]
+        label = self.label_x[x]
+        label_y, slack, slackyx = self.label_y, self.slack, self.slackyx
+        for y in range(self.m):
+            value = label + label_y[y] - row[y]
+            if value < slack[y]:
+                slack[y] = value
+                slackyx[y] = x
 
     def update_labels(self):
-        delta = self.slack[np.logical_not(self.T)].min()
-        self.label_x[self.S] -= delta
-        self.label_y[self.T] += delta
-        self.slack[np.logical_not(self.T)] -= delta
+        T, slack, label_y, label_x = self.T, self.slack, self.label_y, self.label_x
+        delta = min(slack[y] for y in range(self.m) if not T[y])
+        for x in range(self.n):
+            if self.S[x]:
+                label_x[x] -= delta
+        for y in range(self.m):
+            if T[y]:
+                label_y[y] += delta
+            else:
+                slack[y] -= delta
+
+class SparseMatcher:
+    """Solves the assignment problem for a sparse n x n weight matrix, given
+    as its non-zero entries. The non-zero entries are split into connected
+    components, which are matched independently: components made of a single
+    row or column are matched directly, and the rest are solved with
+    :class:`Matcher` over their own rows and columns only. The cost therefore
+    depends on the no. of non-zero entries rather than on n.
+
+    Args:
+        n (int): size of the weight matrix
+        weights (dict): non-zero weights, in the form "(row, column): weight"
+    """
+
+    def __init__(self, n, weights):
+        self.n = n
+        self.weights = weights
+
+    def components(self):
+        """Group the non-zero entries by connected component
+
+        Returns:
+            dict[] : the non-zero weights of each component
+        """
+        # Union find over rows (x) and columns (n + y)
+        parent = {}
+        def find(v):
+            root = v
+            while parent.setdefault(root, root) != root:
+                root = parent[root]
+            while parent[v] != root:
+                parent[v], v = root, parent[v]
+            return root
+        for x, y in self.weights:
+            rx, ry = find(x), find(self.n + y)
+            if rx != ry:
+                parent[rx] = ry
+
+        groups = {}
+        for (x, y), w in self.weights.items():
+            groups.setdefault(find(x), {})[(x, y)] = w
+        return list(groups.values())
+
+    def solve(self):
+        """Compute a maximum weight matching over the non-zero entries.
+
+        Returns:
+            float, int[] : the weight of the matching, and the matching where
+                matches[x] is the column matched to row x, or -1 if row x is
+                not connected
+        """
+        matches = [-1] * self.n
+        sum = 0.
+        for weights in self.components():
+            rows = sorted(set(x for x, y in weights))
+            cols = sorted(set(y for x, y in weights))
+            if len(rows) == 1 or len(cols) == 1:
+                (x, y), w = max(weights.items(), key=lambda e: e[1])
+                matches[x] = y
+                sum += w
+                continue
+
+            rowIdx = {x: i for i, x in enumerate(rows)}
+            colIdx = {y: j for j, y in enumerate(cols)}
+            size = max(len(rows), len(cols))
+            compact = np.zeros((size, size), dtype=np.float32)
+            for (x, y), w in weights.items():
+                compact[rowIdx[x], colIdx[y]] = w
+            val, compactMatches = Matcher(compact).solve()
+            sum += val
+            for i, x in enumerate(rows):
+                j = compactMatches[i]
+                if j < len(cols) and compact[i, j] > 0:
+                    matches[x] = cols[j]
+        return sum, matches
+
+class BatchMatcher:
+    """Solves the assignment problem for a whole stack of square weight
+    matrices at once, using an auction algorithm with epsilon scaling that
+    is vectorized over the entire stack. Every iteration handles the bids of
+    all unassigned rows of all matrices, so the Python overhead is paid once
+    per iteration rather than once per matrix.
+
+    For integer weights, the final epsilon is below 1/n and every matching
+    returned is a maximum weight matching, although ties may be broken
+    differently than with :class:`Matcher`.
+
+    Args:
+        weights (float[][][]): b x n x n stack of weight matrices
+    """
+
+    def __init__(self, weights):
+        weights = np.array(weights, dtype=np.float64)
+        self.weights = weights
+        self.b, self.n, m = weights.shape
+        assert self.n == m
+
+    def auction(self, prices, eps):
+        """Run one auction phase with a fixed epsilon, starting from an empty
+        assignment and the given prices.
+
+        Args:
+            prices (float[][]): b x n object prices, updated in place
+            eps (float): the bid increment
+
+        Returns:
+            int[][] : b x n array, where entry [k, x] is the column assigned to row x
+        """
+        b, n = self.b, self.n
+        owner = -np.ones((b, n), dtype=np.int64)
+        assigned = -np.ones((b, n), dtype=np.int64)
+
+        while True:
+            bk, bx = np.nonzero(assigned == -1)
+            if len(bk) == 0:
+                return assigned
+            ind = np.arange(len(bk))
+            values = self.weights[bk, bx] - prices[bk]
+            best = np.argmax(values, axis=1)
+            best_val = values[ind, best]
+            values[ind, best] = -np.inf
+            second_val = np.max(values, axis=1)
+            second_val = np.where(np.isinf(second_val), best_val, second_val)
+            bids = prices[bk, best] + best_val - second_val + eps
+
+            # For every contested object only the highest bid wins
+            keys = bk * n + best
+            order = np.lexsort((-bids, keys))
+            first = np.ones((len(order),), dtype=bool)
+            first[1:] = keys[order][1:] != keys[order][:-1]
+            win = order[first]
+            wk, wy, wx = bk[win], best[win], bx[win]
+
+            outbid = owner[wk, wy]
+            had_owner = outbid >= 0
+            assigned[wk[had_owner], outbid[had_owner]] = -1
+            owner[wk, wy] = wx
+            assigned[wk, wx] = wy
+            prices[wk, wy] = bids[win]
+
+    def solve(self):
+        """Compute a maximum weight matching for every matrix in the stack.
+
+        Returns:
+            float[], int[][] : the weight of each matching, and the matchings
+                where matchings[k][x] is the column matched to row x in matrix k
+        """
+        if self.b == 0 or self.n == 0:
+            return [], [[] for k in range(self.b)]
+        prices = np.zeros((self.b, self.n), dtype=np.float64)
+        final_eps = 1.0 / (self.n + 1)
+        eps = max(np.ptp(self.weights) / 2, final_eps)
+        while True:
+            assigned = self.auction(prices, eps)
+            if eps <= final_eps:
+                break
+            eps = max(eps / 4, final_eps)
+
+        rows = np.arange(self.n)
+        sums = [float(self.weights[k, rows, assigned[k]].sum()) for k in range(self.b)]
+        return sums, assigned.tolist()
+
+class ISLIPMatcher:
+    """Iterative round-robin matching (iSLIP) for an n x n request matrix,
+    computed with vectorized NumPy operations. In every iteration each free
+    output grants the requesting free input that comes next after its grant
+    pointer, and each input accepts the granting output that comes next after
+    its accept pointer. Pointers are only moved for matches made in the first
+    iteration, and are kept between calls to solve.
+
+    This does not find a maximum weight matching, but is far cheaper than
+    :class:`Matcher` and is closer to what a real controller can compute
+    within a time slot.
+
+    Args:
+        n (int): size of the request matrix
+        iterations (int): max no. of request-grant-accept iterations per slot
+    """
+
+    def __init__(self, n, iterations):
+        self.n = n
+        self.iterations = iterations
+        self.grant = np.zeros((n,), dtype=np.int64)
+        self.accept = np.zeros((n,), dtype=np.int64)
+
+    def solve(self, weights):
+        """Compute an iSLIP matching for the given request matrix.
+
+        Args:
+            weights (int[][]): n x n request matrix, a non-zero entry (i, j)
+                means input i requests output j
+
+        Returns:
+            float, int[] : the total weight of the matched requests, and the
+                matching where matches[x] is the output matched to input x, or
+                -1 if input x is not connected
+        """
+        weights = np.asarray(weights)
+        requests = weights > 0
+        n = self.n
+        idx = np.arange(n)
+        matchIn = -np.ones((n,), dtype=np.int64)
+        matchOut = -np.ones((n,), dtype=np.int64)
+
+        for it in range(self.iterations):
+            req = requests & (matchIn == -1)[:, None] & (matchOut == -1)[None, :]
+            if not req.any():
+                break
+            # Grant: each output picks the first requesting input from its pointer
+            dist = np.where(req, (idx[:, None] - self.grant[None, :]) % n, n)
+            grantIn = np.argmin(dist, axis=0)
+            granted = dist[grantIn, idx] < n
+            grants = np.zeros((n, n), dtype=bool)
+            grants[grantIn[granted], idx[granted]] = True
+            # Accept: each input picks the first granting output from its pointer
+            dist = np.where(grants, (idx[None, :] - self.accept[:, None]) % n, n)
+            acceptOut = np.argmin(dist, axis=1)
+            accepted = dist[idx, acceptOut] < n
+            ins = idx[accepted]
+            outs = acceptOut[accepted]
+            matchIn[ins] = outs
+            matchOut[outs] = ins
+            if it == 0:
+                self.grant[outs] = (ins + 1) % n
+                self.accept[ins] = (outs + 1) % n
+
+        matched = matchIn >= 0
+        sum = float(weights[idx[matched], matchIn[matched]].sum())
+        return sum, matchIn.tolist()
 
 
 if __name__ == "__main__":
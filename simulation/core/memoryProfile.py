@@ -0,0 +1,191 @@
+"""
+memoryProfile.py
+
+This file contains the MemoryProfiler, an opt-in instrumentation that
+records the memory used by each part of the simulator over a run.
+"""
+
+import os
+import sys
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then not reported
+    resource = None
+
+# Source files of each component, memory is attributed to the component
+# whose code allocated it
+COMPONENT_FILES = {
+    "switches": ("spaceSwitch.py", "awgr.py"),
+    "transmitters": ("transmitter.py", "receiver.py", "transceiverBank.py"),
+    "controller": ("controller.py", "matcher.py"),
+    "generator": ("event_generator.py", "slotEngine.py", "traceSource.py"),
+    "packets": ("packet.py",),
+}
+
+COMPONENTS = tuple(COMPONENT_FILES) + ("other",)
+
+# Structures that grow over a run, see structure_sizes
+STRUCTURES = ("switch_slot_states", "queued_packets", "pending_hellos", "alternate_routes")
+
+_COMPONENT_OF_FILE = {name: component for component, names in COMPONENT_FILES.items()
+                      for name in names}
+
+MB = 1024 * 1024
+
+def component_of(filename):
+    """ Returns the component a source file belongs to
+
+    Args:
+        filename (str): path of the source file
+
+    Returns:
+        str : the name of the component, "other" for files outside the simulator
+    """
+    return _COMPONENT_OF_FILE.get(os.path.basename(filename), "other")
+
+def peak_rss():
+    """ Returns the peak resident set size of the process in MB, or None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == "darwin":
+        return peak / MB
+    return peak / 1024
+
+def current_rss():
+    """ Returns the current resident set size of the process in MB, or None if unknown
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE") / MB
+
+def structure_sizes(network):
+    """ Returns the sizes of the structures of a network that grow over a run
+
+    Args:
+        network (ASA): the network
+
+    Returns:
+        dict : no. of entries of each structure
+    """
+    controller = network.controller
+    sizes = (sum(len(sSwitch.state) for sSwitch in network.spaceSwitches),
+             controller.backlog,
+             len(controller.pending_hello_pkts),
+             len(controller.alternate_routes))
+    return dict(zip(STRUCTURES, sizes))
+
+class MemoryProfiler:
+    """Records peak RSS and periodic tracemalloc snapshots of a run, with the
+    traced memory grouped by component, along with the sizes of the structures
+    that grow over a run.
+
+    Tracing slows the simulation down considerably, with trace set to False only
+    RSS and structure sizes are recorded.
+
+    Args:
+        interval_slots (int): no. of time slots between samples, defaults to 1000
+        trace (bool): take tracemalloc snapshots, defaults to True
+    """
+
+    def __init__(self, interval_slots=1000, trace=True):
+        self.interval_slots = interval_slots
+        self.trace = trace
+        self.started_tracing = False
+        self.reset()
+
+    def reset(self):
+        """ Discard all samples
+        """
+        self.samples = []
+        self.next_slot = 0
+
+    def start(self):
+        """ Start tracing allocations, called by the engine when a run starts
+        """
+        self.reset()
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+
+    def observe(self, slot, network):
+        """ Take a sample if the sampling interval has passed, called by the engine
+        at the end of every time slot
+
+        Args:
+            slot (int): the number of the time slot that has just ended
+            network (ASA): the network
+        """
+        if slot >= self.next_slot:
+            self.sample(slot, network)
+            self.next_slot = (int(slot) // self.interval_slots + 1) * self.interval_slots
+
+    def finish(self, network):
+        """ Take a last sample and stop tracing, called by the engine when a run ends
+
+        Args:
+            network (ASA): the network
+        """
+        self.sample(network.controller.current_slot, network)
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+
+    def sample(self, slot, network):
+        """ Record the memory use at a time slot
+
+        Args:
+            slot (int): the number of the time slot
+            network (ASA): the network
+        """
+        row = {"slot": slot, "rss_mb": current_rss()}
+        if tracemalloc.is_tracing():
+            traced = dict.fromkeys(COMPONENTS, 0)
+            for stat in tracemalloc.take_snapshot().statistics("filename"):
+                traced[component_of(stat.traceback[0].filename)] += stat.size
+            for component in COMPONENTS:
+                row[component + "_mb"] = traced[component] / MB
+        row.update(structure_sizes(network))
+        self.samples.append(row)
+
+    def summary(self):
+        """ Summarize the samples of the run
+
+        Returns:
+            dict : the peak RSS in MB, the no. of samples, and for every recorded
+                quantity its value in the last sample and its growth since the first
+        """
+        ret = {"peak_rss_mb": peak_rss(), "samples": len(self.samples)}
+        if len(self.samples) > 0:
+            first, last = self.samples[0], self.samples[-1]
+            for key, value in last.items():
+                if key == "slot" or value is None:
+                    continue
+                ret[key] = value
+                ret[key + "_growth"] = value - first[key]
+        return ret
+
+    def format_summary(self):
+        """ Returns the summary of the run as a compact, human readable string
+        """
+        summary = self.summary()
+        peak = summary["peak_rss_mb"]
+        peak = "unknown" if peak is None else f"{peak:.1f} MB"
+        lines = [f"Peak RSS = {peak} over {summary['samples']} samples"]
+        traced = [component for component in COMPONENTS if component + "_mb" in summary]
+        if traced:
+            lines.append("Traced MB (growth) : " + ", ".join(
+                f"{component} {summary[component + '_mb']:.2f} ({summary[component + '_mb_growth']:+.2f})"
+                for component in traced))
+        if STRUCTURES[0] in summary:
+            lines.append("Sizes (growth) : " + ", ".join(
+                f"{key} {summary[key]} ({summary[key + '_growth']:+d})" for key in STRUCTURES))
+        return "\n".join(lines)
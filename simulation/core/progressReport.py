@@ -0,0 +1,275 @@
+"""
+progressReport.py
+
+This file contains the ProgressReporter, which reports the progress of a
+long run while it executes, and the ProgressAggregator, which collects the
+reports of runs executing in worker processes.
+"""
+
+import os
+import queue as queues
+import sys
+import time
+
+try:
+    from progress.bar import Bar
+except ImportError:
+    # Without the progress package, reports are written as plain lines
+    Bar = None
+
+ARRIVALS = "arrivals"
+DRAIN = "drain"
+DONE = "done"
+
+def format_duration(seconds):
+    """ Returns a duration in seconds as h:mm:ss, or "?" if unknown
+    """
+    if seconds is None:
+        return "?"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+def format_report(report):
+    """ Returns a progress report as a single human readable line
+
+    Args:
+        report (dict): the report, as built by ProgressReporter.report
+
+    Returns:
+        str : the formatted report
+    """
+    return (f"[{report['label']}] {report['phase']} t = {report['sim_time'] / 1e6:.3f} ms"
+            f" ({100 * report['fraction']:.1f}%), slot {int(report['slot'])},"
+            f" {report['slots_per_sec']:.0f} slots/s, {report['events_per_sec']:.0f} events/s,"
+            f" backlog {report['backlog']}, drops {report['overflow_drops']}"
+            f" + {report['link_drops']}, ETA {format_duration(report['eta'])}")
+
+class ProgressReporter:
+    """Reports the progress of a run every interval seconds of wall clock time:
+    the simulated time, the rates of slots and events, the backlog, the drops
+    and the estimated time left.
+
+    The engines count their events and only call update once every check_every
+    events, the wall clock is then read, so the cost in the loop of the engine
+    is a counter increment and a comparison per event.
+
+    Reports are shown as a bar from the progress package if it is installed,
+    and otherwise written as lines to the stream. If a queue is given, such as
+    the queue of a multiprocessing Manager shared with the workers of a sweep,
+    reports are put on it instead, for a ProgressAggregator in the parent
+    process. A report that does not fit in the queue is dropped, the run is
+    never blocked.
+
+    Args:
+        interval (float): wall clock seconds between reports, defaults to 1.0
+        check_every (int): no. of events between reads of the wall clock, defaults to 4096
+        queue (Queue): queue to put the reports on, defaults to None
+        label (str): name of the run in the reports, defaults to the process ID
+        stream (file): stream the reports are written to, defaults to sys.stderr
+    """
+
+    def __init__(self, interval=1.0, check_every=4096, queue=None, label=None, stream=None):
+        self.interval = interval
+        self.check_every = check_every
+        self.queue = queue
+        self.label = str(os.getpid()) if label is None else label
+        self.stream = stream
+        self.bar = None
+        self.reset()
+
+    def reset(self):
+        """ Discard the state of the previous run
+        """
+        self.events = 0
+        self.slot = 0
+        self.reports = 0
+        self.started = time.monotonic()
+        self.deadline = self.started + self.interval
+        # Wall clock time, slot, no. of events and backlog at the last report
+        self.last = (self.started, 0, 0, 0)
+
+    def start(self, network):
+        """ Start timing a run, called by the engine when a run starts
+
+        Args:
+            network (ASA): the network
+        """
+        self.reset()
+        self.runtime = network.event_generator.runtime
+        self.time_slot = network.event_generator.time_slot
+        if self.queue is None and Bar is not None:
+            stream = sys.stderr if self.stream is None else self.stream
+            self.bar = Bar(self.label, max=1000, file=stream, suffix="")
+
+    def update(self, events, sim_time, slot, network):
+        """ Report if the reporting interval has passed, called by the engine
+        every check_every events of the arrival phase
+
+        Args:
+            events (int): no. of events handled since the start of the run
+            sim_time (float): the simulated time in nanoseconds
+            slot (int): the current time slot
+            network (ASA): the network
+        """
+        self.events = events
+        self.slot = slot
+        now = time.monotonic()
+        if now >= self.deadline:
+            self.deadline = now + self.interval
+            self.emit(self.report(ARRIVALS, now, sim_time, slot, network))
+
+    def drain(self, slot, network):
+        """ Report if the reporting interval has passed, called by the engine
+        after every slot of the drain, each of which counts as one event
+
+        Args:
+            slot (int): the time slot that has just been scheduled
+            network (ASA): the network
+        """
+        self.events += 1
+        self.slot = slot
+        now = time.monotonic()
+        if now >= self.deadline:
+            self.deadline = now + self.interval
+            self.emit(self.report(DRAIN, now, (slot + 1) * self.time_slot, slot, network))
+
+    def finish(self, network):
+        """ Send the final report, called by the engine when a run ends
+
+        Args:
+            network (ASA): the network
+        """
+        slot = self.slot
+        self.emit(self.report(DONE, time.monotonic(), (slot + 1) * self.time_slot, slot, network))
+        if self.bar is not None:
+            self.bar.finish()
+            self.bar = None
+
+    def report(self, phase, now, sim_time, slot, network):
+        """ Build a progress report
+
+        Args:
+            phase (str): ARRIVALS, DRAIN or DONE
+            now (float): the wall clock time
+            sim_time (float): the simulated time in nanoseconds
+            slot (int): the current time slot
+            network (ASA): the network
+
+        Returns:
+            dict : the report, with rates over the time since the last report and
+                the ETA in seconds, None if unknown
+        """
+        backlog = network.controller.backlog
+        lastTime, lastSlot, lastEvents, lastBacklog = self.last
+        wall = max(now - lastTime, 1e-9)
+        elapsed = now - self.started
+        fraction = min(sim_time / self.runtime, 1.0)
+        eta = None
+        if phase == ARRIVALS and sim_time > 0:
+            # Remaining arrivals at the average speed so far, the drain is not included
+            eta = elapsed * (self.runtime - sim_time) / sim_time
+        elif phase == DRAIN and lastBacklog > backlog:
+            eta = backlog * wall / (lastBacklog - backlog)
+        elif phase == DONE:
+            fraction = 1.0
+            eta = 0
+        self.last = (now, slot, self.events, backlog)
+        self.reports += 1
+        return {"label": self.label,
+                "pid": os.getpid(),
+                "phase": phase,
+                "sim_time": sim_time,
+                "fraction": fraction,
+                "slot": slot,
+                "events": self.events,
+                "elapsed": elapsed,
+                "slots_per_sec": (slot - lastSlot) / wall,
+                "events_per_sec": (self.events - lastEvents) / wall,
+                "backlog": backlog,
+                "overflow_drops": network.overflowDrop,
+                "link_drops": network.linkDrop,
+                "eta": eta}
+
+    def emit(self, report):
+        """ Show a report, or put it on the queue for the parent process
+        """
+        if self.queue is not None:
+            try:
+                self.queue.put_nowait(report)
+            except queues.Full:
+                pass
+            except (OSError, EOFError):
+                # The parent has gone away, stop reporting rather than fail the run
+                self.queue = None
+        elif self.bar is not None:
+            self.bar.suffix = format_report(report).replace("%", "%%")
+            self.bar.goto(int(1000 * report["fraction"]))
+        else:
+            stream = sys.stderr if self.stream is None else self.stream
+            stream.write(format_report(report) + "\n")
+            stream.flush()
+
+class ProgressAggregator:
+    """Collects the progress reports that the workers of a sweep put on a
+    shared queue, and shows the latest report of every run.
+
+    Args:
+        queue (Queue): the queue shared with the ProgressReporters of the workers
+        stream (file): stream the reports are written to, defaults to sys.stderr
+    """
+
+    def __init__(self, queue, stream=None):
+        self.queue = queue
+        self.stream = stream
+        # Latest report of every run, by label
+        self.latest = {}
+
+    def collect(self, timeout=None):
+        """ Take all reports waiting on the queue
+
+        Args:
+            timeout (float): seconds to wait for a first report, defaults to None
+                which does not wait
+
+        Returns:
+            int : no. of reports taken
+        """
+        count = 0
+        try:
+            report = self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait()
+            while True:
+                self.latest[report["label"]] = report
+                count += 1
+                report = self.queue.get_nowait()
+        except queues.Empty:
+            pass
+        return count
+
+    def done(self):
+        """ Returns the no. of runs that have sent their final report
+        """
+        return sum(report["phase"] == DONE for report in self.latest.values())
+
+    def summary(self):
+        """ Returns a line with the no. of runs and their total rates of events
+        and slots
+        """
+        running = [report for report in self.latest.values() if report["phase"] != DONE]
+        return (f"{len(self.latest)} runs, {self.done()} done :"
+                f" {sum(report['events_per_sec'] for report in running):.0f} events/s,"
+                f" {sum(report['slots_per_sec'] for report in running):.0f} slots/s")
+
+    def poll(self, timeout=1.0):
+        """ Wait for reports and show the runs that are still active
+
+        Args:
+            timeout (float): seconds to wait for a first report, defaults to 1.0
+        """
+        if self.collect(timeout) == 0:
+            return
+        stream = sys.stderr if self.stream is None else self.stream
+        lines = [self.summary()] + [format_report(report) for report in self.latest.values()
+                                    if report["phase"] != DONE]
+        stream.write("\n".join(lines) + "\n")
+        stream.flush()
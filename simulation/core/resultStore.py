@@ -0,0 +1,197 @@
+"""
+resultStore.py
+
+This file contains the ResultStore, a local SQLite store of the results of
+finished runs, keyed by a hash of their full configuration.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# Settings of a run that determine its results, with their defaults
+CONFIG_FIELDS = {
+    "n": None,
+    "rate": None,
+    "slot": 1200,
+    "hello_interval": 3,
+    "runtime": None,
+    "reroute_flag": 0,
+    "failures": (),
+    "seed": None,
+    "scheduler": "hungarian",
+    "engine": "event",
+    "queue_limit": None,
+    "queue_policy": "drop",
+}
+
+# Results recorded for every run, see main.run_simulation
+METRIC_FIELDS = ("generated", "received", "overflow_drops", "link_drops", "total_delay",
+                 "latency", "wall_time", "queue_drops", "max_queue_depth")
+
+SCHEMA = ("CREATE TABLE IF NOT EXISTS runs (key TEXT PRIMARY KEY, code_version TEXT, "
+          + ", ".join(CONFIG_FIELDS) + ", " + ", ".join(METRIC_FIELDS) + ", created REAL)")
+
+_code_version = None
+
+def code_version():
+    """ Returns a hash of the source files of the simulator, so that results are
+    never reused after the code that produced them has changed
+
+    Returns:
+        str : the hex digest
+    """
+    global _code_version
+    if _code_version is None:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        digest = hashlib.sha256()
+        files = [os.path.join(root, "main.py")]
+        for package in ("components", "core"):
+            files += sorted(glob.glob(os.path.join(root, package, "*.py")))
+        for path in files:
+            digest.update(os.path.relpath(path, root).encode())
+            with open(path, "rb") as source:
+                digest.update(source.read())
+        _code_version = digest.hexdigest()
+    return _code_version
+
+def normalize(config):
+    """ Complete a configuration with the defaults of the missing settings
+
+    Args:
+        config (dict): settings of a run, by the names in CONFIG_FIELDS
+
+    Returns:
+        dict : every setting in CONFIG_FIELDS, with the link failures as a sorted
+            list of [time, awgr_id, spaceSwitch_id] lists
+
+    Raises:
+        KeyError : for settings that are not in CONFIG_FIELDS
+    """
+    unknown = set(config) - set(CONFIG_FIELDS)
+    if unknown:
+        raise KeyError(f"Unknown settings {sorted(unknown)}")
+    ret = dict(CONFIG_FIELDS)
+    ret.update(config)
+    ret["failures"] = sorted([list(failure) for failure in ret["failures"] or ()])
+    return ret
+
+def config_key(config, version=None):
+    """ Returns the key of a configuration, the hash of its settings along with
+    the code version
+
+    Args:
+        config (dict): settings of a run
+        version (str): code version, defaults to None which uses code_version()
+
+    Returns:
+        str : the hex digest
+    """
+    if version is None:
+        version = code_version()
+    text = json.dumps([normalize(config), version], sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultStore:
+    """Stores the results of finished runs in a SQLite database, with one row
+    per run holding its settings and results, so that sweeps can skip runs
+    that have already been done and results can be aggregated with SQL.
+
+    Rows are keyed by config_key, and are therefore only found again by the
+    same code version. Runs without a seed are random, they are stored but
+    never found again.
+
+    Args:
+        path (str): path of the database file, defaults to "results/results.sqlite"
+    """
+
+    def __init__(self, path=os.path.join("results", "results.sqlite")):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Runs of parallel sweeps are stored by the parent, a timeout covers other writers
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute(SCHEMA)
+        # Stores created before a field was added gain its column, rows stored
+        # before hold NULL
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(runs)")]
+        for field in CONFIG_FIELDS.keys() | set(METRIC_FIELDS):
+            if field not in columns:
+                self.connection.execute(f"ALTER TABLE runs ADD COLUMN {field}")
+        self.connection.commit()
+
+    def close(self):
+        """ Close the database
+        """
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, config):
+        """ Returns the results of a run, or None if it has not been stored
+
+        Args:
+            config (dict): settings of the run
+        """
+        if config.get("seed") is None:
+            return None
+        cursor = self.connection.execute(
+            "SELECT " + ", ".join(METRIC_FIELDS) + " FROM runs WHERE key = ?", (config_key(config),))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        return dict(zip(METRIC_FIELDS, row))
+
+    def __contains__(self, config):
+        return self.get(config) is not None
+
+    def put(self, config, metrics):
+        """ Store the results of a run
+
+        Args:
+            config (dict): settings of the run
+            metrics (dict): results of the run, by the names in METRIC_FIELDS
+        """
+        settings = normalize(config)
+        settings["failures"] = json.dumps(settings["failures"])
+        key = config_key(config)
+        if config.get("seed") is None:
+            # Unseeded runs can not be reproduced, give every one of them its own row
+            key = hashlib.sha256(f"{key}{time.time()}{os.getpid()}".encode()).hexdigest()
+        row = ([key, code_version()] + [settings[field] for field in CONFIG_FIELDS]
+               + [metrics.get(field) for field in METRIC_FIELDS] + [time.time()])
+        columns = ["key", "code_version"] + list(CONFIG_FIELDS) + list(METRIC_FIELDS) + ["created"]
+        self.connection.execute(f"INSERT OR REPLACE INTO runs ({', '.join(columns)})"
+                                f" VALUES ({', '.join('?' * len(row))})", row)
+        self.connection.commit()
+
+    def query(self, sql, params=()):
+        """ Run a query over the stored runs, e.g.
+        "SELECT n, AVG(latency) FROM runs GROUP BY n"
+
+        Args:
+            sql (str): the query, over the table runs
+            params (tuple): parameters of the query, defaults to ()
+
+        Returns:
+            list : the rows of the result
+        """
+        return self.connection.execute(sql, params).fetchall()
+
+    def frame(self, sql="SELECT * FROM runs", params=()):
+        """ Returns the result of a query as a pandas DataFrame
+
+        Args:
+            sql (str): the query, defaults to all stored runs
+            params (tuple): parameters of the query, defaults to ()
+        """
+        import pandas as pd
+        return pd.read_sql_query(sql, self.connection, params=params)
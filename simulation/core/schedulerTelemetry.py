@@ -0,0 +1,170 @@
+"""
+schedulerTelemetry.py
+
+This file contains the SchedulerTelemetry, an opt-in instrumentation that
+records how well the matchings of every slot use each Space Switch.
+"""
+
+import os
+import numpy as np
+
+# Quantities recorded per slot and Space Switch
+FIELDS = ("demand", "matching", "scheduled", "blocked", "passed", "queued")
+
+PERCENTILES = (50, 90, 99)
+
+class SchedulerTelemetry:
+    """Records, for every scheduled slot and every Space Switch, the demand (the
+    sum of the request matrix), the size of the matching (the no. of matched
+    AWGR pairs with requests), the no. of packets scheduled, the no. of packets
+    on a matched AWGR pair held back by the limit of MAX_TRANSMISSION_COUNT
+    transmissions per wavelength, as counted by the engine, the no. of packets
+    on a matched AWGR pair passed over behind a scheduled packet without being
+    considered, and the queue length after scheduling.
+
+    Values are kept in int32 arrays with a row per slot and a column per
+    Space Switch, grown by doubling, so recording a switch costs a few array
+    writes. Switches without queued packets are not scheduled and keep zeros.
+
+    A matching much smaller than n while the demand is high points to
+    scheduling inefficiency, a full matching with a growing queue to overload.
+
+    Args:
+        n (int): the n parameter of the network
+        capacity (int): no. of slots allocated up front, defaults to 4096
+    """
+
+    def __init__(self, n, capacity=4096):
+        self.n = n
+        self.capacity = capacity
+        self.reset()
+
+    def reset(self):
+        """ Discard all records
+        """
+        self.rows = 0
+        self.slots = np.zeros((self.capacity,), dtype=np.int64)
+        for name in FIELDS:
+            setattr(self, name, np.zeros((self.capacity, self.n), dtype=np.int32))
+
+    def start_slot(self, slot):
+        """ Add a row for a slot, called by the engine before scheduling it
+
+        Args:
+            slot (int): the number of the time slot
+
+        Returns:
+            int : the row of the slot
+        """
+        if self.rows == len(self.slots):
+            size = 2 * len(self.slots)
+            self.slots = np.resize(self.slots, (size,))
+            for name in FIELDS:
+                grown = np.zeros((size, self.n), dtype=np.int32)
+                grown[:self.rows] = getattr(self, name)
+                setattr(self, name, grown)
+        row = self.rows
+        self.slots[row] = slot
+        self.rows += 1
+        return row
+
+    def record(self, row, sId, data, matching, scheduled, blocked, queued):
+        """ Record the scheduling of a Space Switch in a slot
+
+        Args:
+            row (int): the row of the slot, from start_slot
+            sId (int): ID of the Space Switch
+            data (StateData): the slot data of the switch, with its requests
+            matching (int[]): the matching of the switch
+            scheduled (int): no. of packets scheduled
+            blocked (int): no. of packets held back by MAX_TRANSMISSION_COUNT
+            queued (int): no. of packets left in the queue
+        """
+        requests = data.requests
+        matched = 0
+        candidates = 0
+        for a, b in enumerate(matching):
+            count = requests.get((a, b), 0)
+            if count > 0:
+                matched += 1
+                candidates += count
+        self.demand[row, sId] = sum(requests.values())
+        self.matching[row, sId] = matched
+        self.scheduled[row, sId] = scheduled
+        self.blocked[row, sId] = blocked
+        self.passed[row, sId] = candidates - scheduled - blocked
+        self.queued[row, sId] = queued
+
+    def arrays(self):
+        """ Returns the recorded slots and quantities, trimmed to the recorded rows
+        """
+        ret = {"slots": self.slots[:self.rows]}
+        for name in FIELDS:
+            ret[name] = getattr(self, name)[:self.rows]
+        return ret
+
+    def percentiles(self):
+        """ Returns the PERCENTILES of every quantity over the slots and Space
+        Switches with demand, with a row per quantity of FIELDS
+        """
+        arrays = self.arrays()
+        active = arrays["demand"] > 0
+        if not np.any(active):
+            return np.zeros((len(FIELDS), len(PERCENTILES)))
+        return np.array([np.percentile(arrays[name][active], PERCENTILES) for name in FIELDS])
+
+    def summary(self):
+        """ Summarize the records over every slot and Space Switch with demand
+
+        Returns:
+            dict : the no. of slots and scheduled switches, the mean and the
+                percentiles of every quantity, and the fractions of the demand
+                that was scheduled, blocked and passed over and of the matchings
+                that were full
+        """
+        arrays = self.arrays()
+        active = arrays["demand"] > 0
+        ret = {"slots": self.rows, "switch_slots": int(np.count_nonzero(active))}
+        if ret["switch_slots"] == 0:
+            return ret
+        for name, percentiles in zip(FIELDS, self.percentiles()):
+            values = arrays[name][active]
+            ret[name] = {"mean": float(values.mean()), "max": int(values.max())}
+            for p, value in zip(PERCENTILES, percentiles):
+                ret[name][f"p{p}"] = float(value)
+        demand = int(arrays["demand"].sum())
+        ret["scheduled_fraction"] = int(arrays["scheduled"].sum()) / demand
+        ret["blocked_fraction"] = int(arrays["blocked"].sum()) / demand
+        ret["passed_fraction"] = int(arrays["passed"].sum()) / demand
+        ret["full_matchings"] = float(np.mean(arrays["matching"][active] == self.n))
+        return ret
+
+    def format_summary(self):
+        """ Returns the summary of the run as a compact, human readable string
+        """
+        summary = self.summary()
+        lines = [f"{summary['slots']} slots, {summary['switch_slots']} scheduled switch slots"]
+        if summary["switch_slots"] > 0:
+            for name in FIELDS:
+                stats = summary[name]
+                lines.append(f"{name} : mean {stats['mean']:.2f}, "
+                             + ", ".join(f"p{p} {stats[f'p{p}']:.0f}" for p in PERCENTILES)
+                             + f", max {stats['max']}")
+            lines.append(f"Scheduled {100 * summary['scheduled_fraction']:.1f}%, blocked"
+                         f" {100 * summary['blocked_fraction']:.1f}% and passed over"
+                         f" {100 * summary['passed_fraction']:.1f}% of the demand,"
+                         f" {100 * summary['full_matchings']:.1f}% of the matchings full")
+        return "\n".join(lines)
+
+    def export(self, path):
+        """ Write the records to a single .npz file, read them back with np.load.
+        The percentiles of every quantity are included as "percentiles", see
+        percentiles
+
+        Args:
+            path (str): path of the file, created along with its directory
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, n=self.n, percentiles=self.percentiles(), **self.arrays())
@@ -0,0 +1,96 @@
+"""
+spillQueue.py
+
+This file contains the SpillQueue, a first-in first-out queue of compact
+packet records kept in a temporary file, which holds the packets that do
+not fit in the bounded queue of a Space Switch.
+"""
+
+import tempfile
+import numpy as np
+
+# Fields of a packet that are needed to schedule and deliver it
+RECORD_DTYPE = np.dtype([("pktId", np.int64), ("src", np.int64), ("dest", np.int64),
+                         ("arrivalTime", np.float64), ("miscDelay", np.float64),
+                         ("wavelength", np.float64)])
+
+class SpillQueue:
+    """Queue of packet records backed by a temporary file. Records are pushed
+    one at a time and gathered in memory until chunk of them are written to
+    the end of the file at once, and popped from a chunk read from the start
+    of the file, so at most two chunks are held in memory however long the
+    queue grows. The file is emptied whenever all its records have been read.
+
+    Args:
+        directory (str): directory of the temporary file, defaults to None which
+            uses the default temporary directory
+        chunk (int): no. of records written or read at a time, defaults to 4096
+    """
+
+    def __init__(self, directory=None, chunk=4096):
+        self.file = tempfile.TemporaryFile(dir=directory)
+        self.chunk = chunk
+        # Oldest records, read from the file
+        self.head = np.empty((0,), dtype=RECORD_DTYPE)
+        # Records between the head and the tail, in the file
+        self.read_pos = 0
+        self.write_pos = 0
+        # Newest records, not written yet
+        self.tail = []
+
+    def __len__(self):
+        return len(self.head) + self.write_pos - self.read_pos + len(self.tail)
+
+    def push(self, record):
+        """ Add a record at the end of the queue
+
+        Args:
+            record (tuple): the fields of the packet, in the order of RECORD_DTYPE
+        """
+        self.tail.append(record)
+        if len(self.tail) >= self.chunk:
+            records = np.array(self.tail, dtype=RECORD_DTYPE)
+            self.file.seek(self.write_pos * RECORD_DTYPE.itemsize)
+            self.file.write(records.tobytes())
+            self.write_pos += len(records)
+            self.tail = []
+
+    def load_head(self):
+        """ Refill the head from the file, or from the tail once the file has
+        been read, which empties the file
+        """
+        if self.read_pos < self.write_pos:
+            count = min(self.chunk, self.write_pos - self.read_pos)
+            self.file.seek(self.read_pos * RECORD_DTYPE.itemsize)
+            self.head = np.frombuffer(self.file.read(count * RECORD_DTYPE.itemsize), dtype=RECORD_DTYPE)
+            self.read_pos += count
+        else:
+            self.head = np.array(self.tail, dtype=RECORD_DTYPE)
+            self.tail = []
+            self.file.seek(0)
+            self.file.truncate()
+            self.read_pos = self.write_pos = 0
+
+    def pop(self, count):
+        """ Remove records from the front of the queue
+
+        Args:
+            count (int): no. of records to remove
+
+        Returns:
+            list : up to count records, oldest first, as tuples
+        """
+        ret = []
+        while count > 0 and len(self) > 0:
+            if len(self.head) == 0:
+                self.load_head()
+            taken = self.head[:count]
+            self.head = self.head[count:]
+            ret += taken.tolist()
+            count -= len(taken)
+        return ret
+
+    def close(self):
+        """ Close and delete the file
+        """
+        self.file.close()
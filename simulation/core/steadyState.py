@@ -0,0 +1,182 @@
+"""
+steadyState.py
+
+This file contains the SteadyStateMonitor, which decides when a run has
+measured throughput and latency precisely enough to end its arrivals.
+"""
+
+import math
+from statistics import NormalDist
+import numpy as np
+
+def t_quantile(p, dof):
+    """ Approximate quantile of the Student t distribution, from the normal
+    quantile with the Cornish-Fisher expansion
+
+    Args:
+        p (float): the probability
+        dof (int): the degrees of freedom
+
+    Returns:
+        float : the quantile
+    """
+    z = NormalDist().inv_cdf(p)
+    return (z + (z ** 3 + z) / (4 * dof)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * dof ** 2))
+
+def mser_truncation(series):
+    """ Warm-up truncation point by the MSER rule, the no. of leading values
+    whose removal minimizes the standard error of the mean of the rest. At most
+    half of the series is removed.
+
+    Args:
+        series (float[]): the series, in order of time
+
+    Returns:
+        int : the no. of values to discard
+    """
+    k = len(series)
+    if k < 2:
+        return 0
+    # Mean and sum of squares of every suffix of the series
+    tail = np.arange(k, 0, -1)
+    sums = np.cumsum(series[::-1])[::-1]
+    squares = np.cumsum((series ** 2)[::-1])[::-1]
+    mser = (squares - sums ** 2 / tail) / tail ** 2
+    return int(np.argmin(mser[:k // 2 + 1]))
+
+class SteadyStateMonitor:
+    """Tracks the throughput and latency of a run online, by the method of
+    batch means over consecutive batches of time slots, and tells the engine
+    when to end the arrival phase.
+
+    The warm-up batches are found with the MSER rule and discarded. If the
+    remaining batch means are still correlated, neighbouring batches are
+    merged. The run has converged once the confidence intervals of both
+    throughput and latency are within precision of their means. The runtime
+    of the engine stays the hard cap of the arrival phase.
+
+    Args:
+        precision (float): target half-width of the confidence intervals relative
+            to the mean, defaults to 0.05
+        confidence (float): confidence level of the intervals, defaults to 0.95
+        batch_slots (int): no. of time slots per batch, defaults to 100
+        min_batches (int): min. no. of batches after warm-up, defaults to 20
+        max_autocorrelation (float): max. lag 1 autocorrelation of the batch means,
+            defaults to 0.2
+    """
+
+    def __init__(self, precision=0.05, confidence=0.95, batch_slots=100, min_batches=20,
+                 max_autocorrelation=0.2):
+        self.precision = precision
+        self.confidence = confidence
+        self.batch_slots = batch_slots
+        self.min_batches = min_batches
+        self.max_autocorrelation = max_autocorrelation
+        self.reset()
+
+    def reset(self):
+        """ Discard all observations
+        """
+        # Packets received and their total delay in every completed batch
+        self.received = []
+        self.delay = []
+        self.batch = 0
+        self.batch_received = 0
+        self.batch_delay = 0.0
+        self.last_received = 0
+        self.last_delay = 0.0
+        # Slot at which convergence was reached, None while running
+        self.stop_slot = None
+        self.estimates = None
+
+    def observe(self, slot, network):
+        """ Record the packets received up to the end of a time slot. Slots without
+        arrivals are skipped by the engines, and count as slots without receptions.
+
+        Args:
+            slot (int): the number of the time slot that has just ended
+            network (ASA): the network, holding the received packet counters
+
+        Returns:
+            bool : True once the target precision has been reached
+        """
+        batch = int(slot) // self.batch_slots
+        completed = batch > self.batch
+        while self.batch < batch:
+            self.received.append(self.batch_received)
+            self.delay.append(self.batch_delay)
+            self.batch_received = 0
+            self.batch_delay = 0.0
+            self.batch += 1
+        self.batch_received += network.receivedPkts - self.last_received
+        self.batch_delay += network.totalDelay - self.last_delay
+        self.last_received = network.receivedPkts
+        self.last_delay = network.totalDelay
+        if completed and self.converged():
+            self.stop_slot = slot
+            return True
+        return False
+
+    def interval(self, series):
+        """ Mean and confidence interval half-width of a series of batch means
+        """
+        k = len(series)
+        half = t_quantile(0.5 + self.confidence / 2, k - 1) * np.std(series, ddof=1) / math.sqrt(k)
+        return float(np.mean(series)), float(half)
+
+    def compute_estimates(self):
+        """ Estimate throughput and latency from the completed batches
+
+        Returns:
+            dict : the warm-up and batch sizes in slots, the mean throughput in packets
+                per slot and the mean latency in nanoseconds, each with the half-width
+                of its confidence interval, or None with too few batches
+        """
+        received = np.array(self.received, dtype=np.float64)
+        delay = np.array(self.delay, dtype=np.float64)
+        # Latency is undefined for batches without receptions, such runs are left to the cap
+        if len(received) < self.min_batches or np.any(received == 0):
+            return None
+        warmup = max(mser_truncation(received), mser_truncation(delay / received))
+        received = received[warmup:]
+        delay = delay[warmup:]
+        size = 1
+        while True:
+            if len(received) < self.min_batches:
+                return None
+            throughput = received / (size * self.batch_slots)
+            latency = delay / received
+            correlated = [np.corrcoef(series[:-1], series[1:])[0, 1] > self.max_autocorrelation
+                          for series in (throughput, latency) if np.std(series) > 0]
+            if not any(correlated):
+                break
+            if len(received) < 2 * self.min_batches:
+                # Correlated batches would understate the intervals, wait for more of them
+                return None
+            # Merge neighbouring batches into batches of twice the size
+            k = len(received) // 2 * 2
+            received = received[:k].reshape(-1, 2).sum(axis=1)
+            delay = delay[:k].reshape(-1, 2).sum(axis=1)
+            size *= 2
+        mean_throughput, half_throughput = self.interval(throughput)
+        mean_latency, half_latency = self.interval(latency)
+        return {"warmup_slots": warmup * self.batch_slots,
+                "batch_slots": size * self.batch_slots,
+                "batches": len(received),
+                "throughput": mean_throughput,
+                "throughput_hw": half_throughput,
+                "latency": mean_latency,
+                "latency_hw": half_latency}
+
+    def converged(self):
+        """ Check if throughput and latency are estimated within the target precision
+
+        Returns:
+            bool : if the target precision has been reached
+        """
+        self.estimates = self.compute_estimates()
+        if self.estimates is None:
+            return False
+        return all(self.estimates[metric + "_hw"] <= self.precision * abs(self.estimates[metric])
+                   for metric in ("throughput", "latency"))
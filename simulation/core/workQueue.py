@@ -0,0 +1,309 @@
+"""
+workQueue.py
+
+This file contains the WorkQueue of a distributed sweep, served to workers
+on any number of machines through a multiprocessing manager, along with the
+coordinator and worker loops that use it.
+"""
+
+import collections
+import os
+import socket
+import threading
+import time
+import traceback
+from multiprocessing.managers import BaseManager
+
+import core.resultStore as results
+
+class WorkQueue:
+    """Holds the points of a sweep. Workers lease a point, renew the lease with
+    heartbeats while running it and complete it with its results. Points whose
+    lease has expired, because their worker died or lost its connection, are
+    queued again, as are points that failed, up to max_attempts times.
+
+    The queue lives in the manager process and is used through proxies, every
+    method is therefore called under a lock.
+
+    Args:
+        points ((str, dict)[]): the key and the settings of every point
+        version (str): code version of the coordinator, workers must match it
+        lease_timeout (float): seconds without a heartbeat after which a point is
+            queued again, defaults to 60
+        max_attempts (int): no. of times a point is tried, defaults to 3
+    """
+
+    def __init__(self, points, version, lease_timeout=60, max_attempts=3):
+        self.lock = threading.Lock()
+        self.version = version
+        self.lease_timeout = lease_timeout
+        self.max_attempts = max_attempts
+        self.points = dict(points)
+        self.pending = collections.deque(self.points)
+        # Leased points, by key, as (worker, expiry time)
+        self.leases = {}
+        self.attempts = collections.Counter()
+        self.done = set()
+        # Failed points, by key, with the last error
+        self.failed = {}
+        # Completed points not yet collected by the coordinator
+        self.completed = []
+
+    def code_version(self):
+        return self.version
+
+    def lease_time(self):
+        return self.lease_timeout
+
+    def _requeue_expired(self):
+        """ Queue the points with expired leases again, must hold the lock
+
+        Returns:
+            int : no. of points queued again
+        """
+        now = time.monotonic()
+        expired = [key for key, (worker, expiry) in self.leases.items() if expiry < now]
+        for key in expired:
+            del self.leases[key]
+            self.pending.appendleft(key)
+        return len(expired)
+
+    def take(self, worker):
+        """ Lease the next point
+
+        Args:
+            worker (str): name of the worker
+
+        Returns:
+            (str, dict) : the key and the settings of the point, or None if no
+                point is pending
+        """
+        with self.lock:
+            self._requeue_expired()
+            while len(self.pending) > 0:
+                key = self.pending.popleft()
+                if key in self.done or key in self.failed:
+                    continue
+                self.leases[key] = (worker, time.monotonic() + self.lease_timeout)
+                self.attempts[key] += 1
+                return key, self.points[key]
+            return None
+
+    def heartbeat(self, worker, key):
+        """ Renew the lease of a point
+
+        Returns:
+            bool : False if the lease was lost, the point may then be run by another worker
+        """
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is None or lease[0] != worker:
+                return False
+            self.leases[key] = (worker, time.monotonic() + self.lease_timeout)
+            return True
+
+    def complete(self, worker, key, metrics):
+        """ Hand in the results of a point, results of points that are already
+        done are ignored. Results are accepted from a worker that lost its lease,
+        and from one whose point has meanwhile failed elsewhere.
+        """
+        with self.lock:
+            if key in self.done:
+                return
+            self.leases.pop(key, None)
+            self.failed.pop(key, None)
+            self.done.add(key)
+            self.completed.append((key, metrics))
+
+    def fail(self, worker, key, error):
+        """ Report a point that raised an error, it is queued again unless it
+        has been tried max_attempts times. Reports of a worker that no longer
+        holds the lease of the point are ignored, another worker is running it.
+        """
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is None or lease[0] != worker:
+                return
+            del self.leases[key]
+            if self.attempts[key] >= self.max_attempts:
+                self.failed[key] = error
+            else:
+                self.pending.append(key)
+
+    def collect(self):
+        """ Take the results completed since the last call, and queue the points
+        with expired leases again
+
+        Returns:
+            (str, dict)[] : the key and the results of every completed point
+        """
+        with self.lock:
+            self._requeue_expired()
+            ret, self.completed = self.completed, []
+            return ret
+
+    def status(self):
+        """ Returns the no. of pending, leased, done and failed points
+        """
+        with self.lock:
+            return {"pending": len(self.pending), "leased": len(self.leases), "done": len(self.done),
+                    "failed": len(self.failed)}
+
+    def failures(self):
+        """ Returns the last error of every failed point, by key
+        """
+        with self.lock:
+            return dict(self.failed)
+
+    def finished(self):
+        """ Returns True once every point is done or has failed
+        """
+        with self.lock:
+            return len(self.done | self.failed.keys()) == len(self.points)
+
+class SweepManager(BaseManager):
+    """Manager serving the WorkQueue of a sweep, see Coordinator and work
+    """
+
+SweepManager.register("work_queue")
+
+def parse_address(address):
+    """ Returns a "host:port" string as a (host, port) tuple
+    """
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
+
+class Coordinator:
+    """Serves the points of a sweep to workers, from a manager listening on a
+    thread of the coordinator process, and stores the results they hand in.
+    Only the coordinator writes to the store.
+
+    The manager exchanges pickled objects, so anyone who knows the key can run
+    code in the coordinator. The key has to be secret, and the address should
+    only be reachable by the workers.
+
+    Args:
+        configs (dict[]): settings of every point
+        address ((str, int)): address to listen on, port 0 picks a free port
+        authkey (bytes): secret key the workers must present
+        lease_timeout (float): seconds without a heartbeat after which a point is
+            queued again, defaults to 60
+
+    Raises:
+        ValueError : if the key is empty
+    """
+
+    def __init__(self, configs, address, authkey, lease_timeout=60):
+        if not authkey:
+            raise ValueError("The coordinator needs a secret key")
+        points = [(results.config_key(config), config) for config in configs]
+        self.settings = dict(points)
+        self.queue = WorkQueue(points, results.code_version(), lease_timeout=lease_timeout)
+        queue = self.queue
+
+        class CoordinatorManager(SweepManager):
+            pass
+
+        CoordinatorManager.register("work_queue", callable=lambda: queue)
+        self.server = CoordinatorManager(address=address, authkey=authkey).get_server()
+        self.address = self.server.address
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def run(self, store, poll_interval=1.0, report=None):
+        """ Store the results handed in by the workers until every point is done
+        or has failed
+
+        Args:
+            store (ResultStore): store for the results
+            poll_interval (float): seconds between collections of results, defaults to 1.0
+            report (function): called with the status of the queue after every
+                collection that changed it, defaults to None
+
+        Returns:
+            dict : the last error of every point that failed, by key
+        """
+        last = None
+        while True:
+            finished = self.queue.finished()
+            for key, metrics in self.queue.collect():
+                store.put(self.settings[key], metrics)
+            status = self.queue.status()
+            if report is not None and status != last:
+                report(status)
+            last = status
+            if finished:
+                return self.queue.failures()
+            time.sleep(poll_interval)
+
+def work(address, authkey, name=None, idle_wait=1.0, run=None, connect_timeout=30):
+    """ Run points of a sweep for a coordinator until it has no more work
+
+    Args:
+        address ((str, int)): address of the coordinator
+        authkey (bytes): key of the coordinator
+        name (str): name of the worker, defaults to host and process ID
+        idle_wait (float): seconds to wait when no point is pending, defaults to 1.0
+        run (function): runs the settings of a point and returns its results,
+            defaults to main.run_simulation
+        connect_timeout (float): seconds to keep trying to reach the coordinator,
+            defaults to 30
+
+    Returns:
+        int : no. of points run
+
+    Raises:
+        RuntimeError : if the code version of the worker differs from the coordinator's
+    """
+    if run is None:
+        import main
+        run = main.run_simulation
+    if name is None:
+        name = f"{socket.gethostname()}:{os.getpid()}"
+    manager = SweepManager(address=address, authkey=authkey)
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            manager.connect()
+            break
+        except ConnectionError:
+            # The coordinator may not be listening yet
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(idle_wait)
+    queue = manager.work_queue()
+    if queue.code_version() != results.code_version():
+        raise RuntimeError("The simulator code of the worker differs from the coordinator's")
+    count = 0
+    try:
+        while True:
+            point = queue.take(name)
+            if point is None:
+                if queue.finished():
+                    return count
+                time.sleep(idle_wait)
+                continue
+            key, config = point
+            stop = threading.Event()
+            threading.Thread(target=keep_lease, args=(queue, name, key, stop), daemon=True).start()
+            try:
+                metrics = run(config)
+            except Exception:
+                queue.fail(name, key, traceback.format_exc())
+                continue
+            finally:
+                stop.set()
+            queue.complete(name, key, metrics)
+            count += 1
+    except (EOFError, ConnectionError):
+        # The coordinator has finished and shut down
+        return count
+
+def keep_lease(queue, name, key, stop):
+    """ Send heartbeats for a point until stop is set, run on a thread of the worker
+    """
+    interval = queue.lease_time() / 3
+    while not stop.wait(interval):
+        try:
+            queue.heartbeat(name, key)
+        except (EOFError, ConnectionError):
+            return
@@ -0,0 +1,29 @@
+"""
+ingest_logs.py
+
+Converts the text logs of finished runs into columnar files, see
+core/logIngest.py for the outputs.
+
+Usage: python ingest_logs.py "results/<timestamp>" [more prefixes] [--output parsed] [--workers 4]
+
+Each run is written to a directory of its own under the output directory,
+named after the timestamp of its logs. With --workers, the chunks of every
+uncompressed log are parsed in parallel.
+"""
+
+import argparse
+import os
+
+from core.logIngest import LogIngest, CHUNK_SIZE
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert ASA logs into columnar files")
+    parser.add_argument("prefixes", nargs="+", help="paths of the logs of each run, without their suffixes")
+    parser.add_argument("--output", default=os.path.join("results", "parsed"))
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_SIZE >> 20)
+    parser.add_argument("--workers", type=int, default=1, help="no. of processes parsing chunks")
+    args = parser.parse_args()
+    for prefix in args.prefixes:
+        output = os.path.join(args.output, os.path.basename(prefix))
+        summary = LogIngest(output, chunk_size=args.chunk_mb << 20, workers=args.workers).ingest(prefix)
+        print(f"{prefix} -> {output} : {summary}")
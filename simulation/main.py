@@ -8,8 +8,20 @@ import components.event_generator as ev_gen
 import components.spaceSwitch as spcSwtch
 import components.awgr as awgr
 import components.controller as cntrlr
+import components.traceSource as trace
+import components.slotEngine as slot_engine
+import components.pipelineSource as pipeline
+import core.steadyState as steady
+import core.memoryProfile as memprof
+import core.progressReport as progress
+import core.resultStore as results
+import core.counters as counters
+import core.schedulerTelemetry as telemetry
 import logging
-from core.logger import logger, LogName
+import random
+import numpy as np
+import time
+from core.logger import logger, configure_logging, shutdown_logging
 
 import sys
 
@@ -22,46 +34,143 @@ class ASA:
         slot (int): slot duration
         hello_int (int): Hello Interval
         runtime (int): duration for packet arrival
+        seed (int): seed for the random number generator, defaults to None
+        failures ((int, int, int)[]): link failures in the form of (time of fault,
+            awgr_id, spaceSwitch_id), defaults to None
     """
 
-    def __init__(self, n, rate, slot, hello_int, runtime):
+    def __init__(self, n, rate, slot, hello_int, runtime, seed=None, failures=None):
         self.n = n
         self.rate = rate
         self.slot = slot
         self.runtime= runtime
 
         self.event_generator = ev_gen.EventGenerator(self.n,
-                            self.rate, self.runtime, self.slot, network=self)
+                            self.rate, self.runtime, self.slot, network=self, failures=failures)
         self.controller = cntrlr.Controller(self.n, slot, hello_int, network=self)
 
-        self.transmitters = []
-        self.receivers = []
         self.stageOneAWGRs = []
         self.stageThreeAWGRs = []
         self.spaceSwitches = []
+        # Transceivers are held in banks, transceiver i is connected to port
+        # i % n of AWGR i // n
+        self.transmitters = trnsmt.TransmitterBank(self.n, self.stageOneAWGRs,
+                                cntrlr.PREV_EXAMINE_SLOTS + 1, network=self)
+        self.receivers = rcvr.ReceiverBank(self.n, self.stageThreeAWGRs, network=self)
 
+        # Counters of every component, the scalar counters below are their totals
+        self.counters = counters.CounterRegistry(self.n)
+        self.reset_counters()
+        if seed is not None:
+            random.seed(seed)
+
+        # Generate Space Switches and AWGRs, link them with the transceivers
+        for i in range(self.n):
+            self.spaceSwitches.append(spcSwtch.SpaceSwitch(self.n, i, 
+                self.slot, network=self))
+            self.stageOneAWGRs.append(awgr.AWGR(self.n, i, 1, self.spaceSwitches,
+                                      self.transmitters.group(i), network=self))
+            self.stageThreeAWGRs.append(awgr.AWGR(self.n, i, 3, self.spaceSwitches,
+                                        self.receivers.group(i), network=self))
+
+        # Time-stepped alternative to the event generator, see SlotEngine
+        self.slot_engine = slot_engine.SlotEngine(self, seed=seed)
+
+    def reset_counters(self):
+        """Zero the packet counters of the network
+        """
+        self.counters.reset()
         self.overflowDrop = 0
         self.linkDrop = 0
         self.generatedPkts = 0
         self.receivedPkts = 0
+        # Sum of the delays of all received packets
+        self.totalDelay = 0
 
-        # Generate Space Switches and Transcievers, link them with each other
-        for i in range(self.n):
-            self.spaceSwitches.append(spcSwtch.SpaceSwitch(self.n, i, 
-                self.slot, network=self))
-            self.stageOneAWGRs.append(awgr.AWGR(self.n, i, 1, self.spaceSwitches, network=self))
-            self.stageThreeAWGRs.append(awgr.AWGR(self.n, i, 3, self.spaceSwitches, network=self))
-            for j in range(self.n):
-                self.transmitters.append(trnsmt.Transmitter((i * self.n + j),
-                                        self.stageOneAWGRs[i], j, network=self))
-                self.receivers.append(rcvr.Receiver((i * self.n + j),
-                                    self.stageThreeAWGRs[i], j, network=self))
+    def reset(self, rate=None, seed=None, failures=None):
+        """Prepare the network for another run while keeping the topology that
+        has already been built. Queues, counters, slot state and the fault state
+        of the controller are all cleared in place.
 
-        for i in range(self.n):
-            t = [self.transmitters[j] for j in range(self.n * i, self.n * (i + 1))]
-            r = [self.receivers[j] for j in range(self.n * i, self.n * (i + 1))]
-            self.stageOneAWGRs[i].linkTransceivers(t)
-            self.stageThreeAWGRs[i].linkTransceivers(r)
+        Args:
+            rate (float): new packet arrival rate, defaults to None which keeps the current one
+            seed (int): seed for the random number generator, defaults to None
+            failures ((int, int, int)[]): new link failures, defaults to None which keeps
+                the current ones
+        """
+        if rate is not None:
+            self.rate = rate
+        self.event_generator.reset(rate=rate, failures=failures)
+        self.controller.reset()
+        for sSwitch in self.spaceSwitches:
+            sSwitch.reset()
+        for awgr in self.stageOneAWGRs + self.stageThreeAWGRs:
+            awgr.reset()
+        self.transmitters.reset()
+        self.slot_engine.reset()
+        self.reset_counters()
+        if seed is not None:
+            random.seed(seed)
+            self.slot_engine.seed = seed
+
+def build_network(config):
+    """Build a network with the given settings
+
+    Args:
+        config (dict): settings of the run, by the names of
+            core.resultStore.CONFIG_FIELDS, missing ones take their defaults
+
+    Returns:
+        ASA : the network
+
+    Raises:
+        ValueError : for a queue limit below 1 or an unknown queue policy
+    """
+    config = results.normalize(config)
+    if config["queue_limit"] is not None and config["queue_limit"] < 1:
+        raise ValueError(f"Queue limit {config['queue_limit']} is below 1")
+    if config["queue_policy"] not in ("drop", "spill"):
+        raise ValueError(f"Unknown queue policy {config['queue_policy']}")
+    failures = [tuple(failure) for failure in config["failures"]]
+    net = ASA(config["n"], config["rate"], config["slot"], config["hello_interval"],
+              config["runtime"], seed=config["seed"], failures=failures)
+    net.controller.reroute_flag = config["reroute_flag"]
+    net.controller.scheduler = config["scheduler"]
+    net.controller.queue_limit = config["queue_limit"]
+    net.controller.queue_policy = config["queue_policy"]
+    return net
+
+def run_simulation(config, progress=None):
+    """Build a network and run it to the end with the given settings
+
+    Args:
+        config (dict): settings of the run, by the names of
+            core.resultStore.CONFIG_FIELDS, missing ones take their defaults
+        progress (ProgressReporter): reports the progress of the run, defaults to None
+
+    Returns:
+        dict : the results of the run, by the names of core.resultStore.METRIC_FIELDS
+    """
+    config = results.normalize(config)
+    net = build_network(config)
+    net.event_generator.progress = progress
+    start = time.perf_counter()
+    try:
+        if config["engine"] == "slot":
+            net.slot_engine.run()
+        else:
+            net.event_generator.on_demand_dispatch()
+    finally:
+        net.controller.shutdown_matchers()
+    return {"generated": net.generatedPkts,
+            "received": net.receivedPkts,
+            "overflow_drops": net.overflowDrop,
+            "link_drops": net.linkDrop,
+            "total_delay": net.totalDelay,
+            "latency": net.totalDelay / net.receivedPkts if net.receivedPkts > 0 else None,
+            "wall_time": time.perf_counter() - start,
+            "queue_drops": int(net.counters.queue_drops.sum()),
+            "max_queue_depth": int(net.counters.queue_high_water.max())}
 
 if __name__ == "__main__":
     if len(sys.argv) > 1:
@@ -77,19 +186,93 @@ if __name__ == "__main__":
 
     if len(sys.argv) > 2:
         HELLO_INTERVAL = int(sys.argv[2])
+
+    # Log files are written to results/, pass None to run without any logging
+    # or a levels dict, e.g. {"asa": logging.INFO}, to control each channel.
+    # background=True moves formatting and writing to a separate thread
+    LogName = configure_logging("results")
+
     net = ASA(N, RATE, SLOT_DUR, HELLO_INTERVAL, RUNTIME)
 
+    # Drive the network with a captured packet trace instead of Poisson traffic
+    # net.event_generator.source = trace.TraceSource("trace.csv", N)
+
+    # Generate seeded Poisson traffic in a separate process, overlapping with the simulation
+    # net.event_generator.source = pipeline.PipelineSource(
+    #     slot_engine.PoissonBatchSource(N, RATE, np.random.default_rng(1)))
+
+    # End the arrivals once throughput and latency are known within 5% at 95% confidence,
+    # RUNTIME is then only the upper limit
+    # net.event_generator.monitor = steady.SteadyStateMonitor(precision=0.05)
+
+    # Record peak RSS and the memory of each component every 1000 slots
+    # net.event_generator.profiler = memprof.MemoryProfiler(interval_slots=1000)
+
+    # Report simulated time, speed, backlog, drops and ETA every 5 seconds while running
+    # net.event_generator.progress = progress.ProgressReporter(interval=5)
+
+    # Record the demand, matching size, scheduled, blocked and passed over packets and queue length of
+    # every Space Switch in every slot
+    # net.controller.telemetry = telemetry.SchedulerTelemetry(N)
+
+    # Hold at most 1000 packets in the queue of each Space Switch, refusing the packets
+    # beyond it, or with "spill" keeping them in a file until the queue has room
+    # net.controller.queue_limit = 1000
+    # net.controller.queue_policy = "spill"
+
     # Change this flag to use NNT Approach
     # net.controller.reroute_flag = 1
 
+    # Schedule with iterative round-robin matching (iSLIP) instead of maximum matching
+    # net.controller.scheduler = "islip"
+    # net.controller.islip_iterations = 4
+
+    # Match Space Switches with few requests over their requested AWGR pairs only
+    # net.controller.dense_threshold = 0.25
+
+    # Solve the matchings of all Space Switches of a slot in one vectorized pass
+    # net.controller.scheduler = "batched"
+
+    # Solve the Space Switch matchings of a slot in multiple worker processes
+    # net.controller.match_workers = 4
+
     logger.info("Intialized ASA Network with N = %s, Arrival Rate = %s, Slot Duration = %s, Runtime = %s",
                 N, RATE, SLOT_DUR, RUNTIME)
+    logger.info("Scheduler = %s", net.controller.scheduler)
 
     net.event_generator.on_demand_dispatch()
+    # Advance slot by slot with vectorized arrivals and dispatch instead, much faster
+    # for long runs, but without per packet log records. With pipeline set its traffic
+    # is generated in a separate process
+    # net.slot_engine.pipeline = True
+    # net.slot_engine.run()
 
     logger.info(f"Generated Packets {net.generatedPkts}")
     logger.info(f"Received Packets {net.receivedPkts}")
     logger.info(f"Overflow Drops {net.overflowDrop}")
     logger.info(f"Link Drops {net.linkDrop}")
+    if net.receivedPkts > 0:
+        logger.info(f"Average Latency {net.totalDelay / net.receivedPkts}")
+    monitor = net.event_generator.monitor
+    if monitor is not None:
+        estimates = monitor.compute_estimates()
+        if estimates is not None:
+            logger.info("Steady state (stopped at slot %s) : Warm-up = %s slots, Throughput = %.4f +- %.4f "
+                        "pkts/slot, Latency = %.1f +- %.1f", monitor.stop_slot, estimates["warmup_slots"],
+                        estimates["throughput"], estimates["throughput_hw"], estimates["latency"],
+                        estimates["latency_hw"])
+
+    if net.event_generator.profiler is not None:
+        logger.info("Memory profile :\n%s", net.event_generator.profiler.format_summary())
+
+    if net.controller.telemetry is not None:
+        logger.info("Scheduler telemetry :\n%s", net.controller.telemetry.format_summary())
+        # net.controller.telemetry.export("results/telemetry.npz")
+
+    # Save the counters of every transmitter, AWGR port, Space Switch and receiver
+    # net.counters.dump("results/counters.npz")
+
+    net.controller.shutdown_matchers()
+    shutdown_logging()
 
     print(LogName)
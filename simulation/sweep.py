@@ -0,0 +1,262 @@
+"""
+sweep.py
+
+Runs the sweep of test_script.sh, the networks of N = 3, 5, ..., 11 with
+ten seeded repetitions each, and keeps the results in a ResultStore. Runs
+that are already in the store, for the same settings and code version, are
+skipped, so re-running a sweep only runs what is missing.
+
+Usage: python sweep.py [--n 3 5 7] [--reps 10] [--workers 4] [--progress]
+
+Sweeps that outgrow one machine are run by a coordinator, which serves the
+missing points to workers on any machine running the same code:
+
+    python sweep.py --serve coordinator-host:50000 [--local-workers 4]
+    python sweep.py --connect coordinator-host:50000
+
+Both sides read the shared key from ASA_SWEEP_AUTHKEY, or take --authkey.
+The coordinator exchanges pickled objects, anyone holding the key can run
+code in it, so the key has to be kept secret. Workers refuse to start
+without a key, a coordinator without one generates a random key and prints
+it.
+
+With --prescreen, points that the analytical model of core.estimate places
+clearly below or above saturation are estimated instead of simulated. With
+--validate, the estimates of the simulated points are compared with their
+stored results.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import secrets
+import sys
+
+import main
+import core.estimate as estimate
+import core.progressReport as progress
+import core.resultStore as results
+import core.workQueue as work_queue
+from core.logger import configure_logging
+
+def sweep_configs(args):
+    """ Returns the settings of every run of a sweep
+
+    Args:
+        args (Namespace): the command line arguments
+    """
+    configs = []
+    for seed in range(1, args.reps + 1):
+        for n in args.n:
+            configs.append({"n": n,
+                            # 5Gbps per transmitter at a load of 1, as in main.py
+                            "rate": args.load * 0.003333333333 * n * n,
+                            "slot": args.slot,
+                            "hello_interval": args.hello,
+                            "runtime": args.runtime,
+                            "reroute_flag": args.reroute,
+                            "seed": seed,
+                            "scheduler": args.scheduler,
+                            "engine": args.engine,
+                            "queue_limit": args.queue_limit,
+                            "queue_policy": args.queue_policy})
+    return configs
+
+def estimate_point(config):
+    """ Returns the analytical estimate of a point of a sweep, see core.estimate.estimate
+    """
+    return estimate.estimate(main.build_network(config), config.get("failures") or ())
+
+def prescreen(pending):
+    """ Estimate the pending points of a sweep, and keep only the points whose
+    estimate is uncertain for simulation. Estimated points are not stored, they
+    are listed in the summary of the sweep instead, see format_screened
+
+    Args:
+        pending (dict[]): settings of the points to run
+
+    Returns:
+        dict[], dict : settings of the points to simulate, and the estimates of
+            the other points by network size
+    """
+    simulate = []
+    screened = {}
+    for config in pending:
+        estimates = estimate_point(config)
+        if estimates["confident"]:
+            screened.setdefault(config["n"], []).append(estimates)
+        else:
+            simulate.append(config)
+    return simulate, screened
+
+def format_screened(n, points):
+    """ Returns the summary line of the estimated points of a network size
+
+    Args:
+        n (int): the network size
+        points (dict[]): the estimates of its points, from estimate_point
+    """
+    first = points[0]
+    return ("N = %s : %s points estimated as %s, load factor %.3f, Average Latency %.1f, Delivered %.4f,"
+            " Overflow Drops %.0f" % (n, len(points), first["regime"], first["load_factor"], first["latency"],
+                                      first["delivered"], sum(point["overflow_drops"] for point in points)))
+
+def validate(configs, store):
+    """ Print the comparison of the estimates of the points of a sweep with
+    their simulated results in the store
+
+    Args:
+        configs (dict[]): settings of the points of the sweep
+        store (ResultStore): the store holding the results
+    """
+    rows = {}
+    for config in configs:
+        metrics = store.get(config)
+        if metrics is not None:
+            rows.setdefault(config["n"], []).append(estimate.compare(estimate_point(config), metrics))
+    print(estimate.format_validation([(f"N = {n}", comparisons) for n, comparisons in sorted(rows.items())]))
+
+def init_worker():
+    """ Runs of a sweep do not write any logs
+    """
+    configure_logging(None)
+
+def run_point(config, queue=None):
+    """ Run one point of a sweep, in a worker process
+
+    Args:
+        config (dict): settings of the run
+        queue (Queue): queue for progress reports, defaults to None
+
+    Returns:
+        dict, dict : the settings and the results of the run
+    """
+    reporter = None
+    if queue is not None:
+        reporter = progress.ProgressReporter(interval=5, queue=queue,
+                                             label=f"N={config['n']} seed={config['seed']}")
+    return config, main.run_simulation(config, progress=reporter)
+
+def run_worker(address, authkey):
+    """ Run points for a coordinator, in a worker process
+    """
+    init_worker()
+    count = work_queue.work(address, authkey)
+    print(f"Worker {os.getpid()} ran {count} points", file=sys.stderr)
+
+def coordinate(args, pending, store):
+    """ Serve the pending points of a sweep to workers and store their results
+
+    Args:
+        args (Namespace): the command line arguments
+        pending (dict[]): settings of the points to run
+        store (ResultStore): the store for the results
+    """
+    if args.authkey is None:
+        args.authkey = secrets.token_hex(16)
+        print(f"Generated the key {args.authkey}, start the workers with --authkey or"
+              " ASA_SWEEP_AUTHKEY set to it", file=sys.stderr)
+    authkey = args.authkey.encode()
+    coordinator = work_queue.Coordinator(pending, work_queue.parse_address(args.serve), authkey,
+                                         lease_timeout=args.lease)
+    host, port = coordinator.address
+    print(f"Serving {len(pending)} points on {host}:{port}", file=sys.stderr)
+    local = ("127.0.0.1" if host in ("", "0.0.0.0") else host, port)
+    workers = [mp.Process(target=run_worker, args=(local, authkey))
+               for i in range(args.local_workers)]
+    for worker in workers:
+        worker.start()
+    failures = coordinator.run(store, report=lambda status: print(status, file=sys.stderr))
+    for worker in workers:
+        worker.join()
+    for key, error in failures.items():
+        print(f"Point {key} failed :\n{error}", file=sys.stderr)
+
+def run_sweep(args):
+    """ Run the points of a sweep that are not in the store yet
+
+    Args:
+        args (Namespace): the command line arguments
+    """
+    with results.ResultStore(args.store) as store:
+        configs = sweep_configs(args)
+        pending = [config for config in configs if config not in store]
+        print(f"{len(configs) - len(pending)} of {len(configs)} runs found in {args.store}",
+              file=sys.stderr)
+        screened = {}
+        if args.prescreen:
+            pending, screened = prescreen(pending)
+
+        if args.serve is not None:
+            if len(pending) > 0:
+                coordinate(args, pending, store)
+        elif args.workers <= 1:
+            init_worker()
+            for config in pending:
+                reporter = progress.ProgressReporter(interval=5) if args.progress else None
+                store.put(config, main.run_simulation(config, progress=reporter))
+        elif len(pending) > 0:
+            # Only the parent writes to the store
+            manager = mp.Manager() if args.progress else None
+            queue = manager.Queue(1000) if args.progress else None
+            aggregator = progress.ProgressAggregator(queue) if args.progress else None
+            with mp.Pool(args.workers, initializer=init_worker) as pool:
+                runs = [pool.apply_async(run_point, (config, queue)) for config in pending]
+                for run in runs:
+                    while aggregator is not None and not run.ready():
+                        aggregator.poll(timeout=5)
+                    store.put(*run.get())
+            if manager is not None:
+                manager.shutdown()
+
+        summary = {n: [format_screened(n, points)] for n, points in screened.items()}
+        # Only the runs of the points of this sweep, the keys also cover the code version
+        keys = [results.config_key(config) for config in configs]
+        for row in store.query(
+                "SELECT n, COUNT(*), AVG(latency), AVG(1.0 * received / generated), SUM(overflow_drops),"
+                " SUM(link_drops) FROM runs WHERE key IN (%s) GROUP BY n ORDER BY n"
+                % ", ".join("?" * len(keys)), keys):
+            summary.setdefault(row[0], []).insert(
+                0, "N = %s : %s runs, Average Latency %.1f, Delivered %.4f, Overflow Drops %s, Link Drops %s"
+                % row)
+        for n in sorted(summary):
+            print("\n".join(summary[n]))
+        if args.validate:
+            validate(configs, store)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a sweep of simulations, skipping stored runs")
+    parser.add_argument("--n", type=int, nargs="+", default=[3, 5, 7, 9, 11])
+    parser.add_argument("--reps", type=int, default=10, help="no. of seeded repetitions")
+    parser.add_argument("--load", type=float, default=1.0, help="arrival rate relative to 5Gbps per transmitter")
+    parser.add_argument("--slot", type=int, default=1200)
+    parser.add_argument("--hello", type=int, default=3)
+    parser.add_argument("--runtime", type=int, default=10000000)
+    parser.add_argument("--reroute", type=int, default=0)
+    parser.add_argument("--scheduler", default="hungarian")
+    parser.add_argument("--engine", default="event", choices=["event", "slot"])
+    parser.add_argument("--queue-limit", type=int, default=None,
+                        help="max. no. of packets queued at each Space Switch, event engine only")
+    parser.add_argument("--queue-policy", default="drop", choices=["drop", "spill"],
+                        help="refuse the packets beyond the queue limit, or spill them to disk")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--store", default="results/results.sqlite")
+    parser.add_argument("--progress", action="store_true", help="report the progress of the runs")
+    parser.add_argument("--prescreen", action="store_true",
+                        help="estimate instead of simulating the points that are clearly light or saturated")
+    parser.add_argument("--validate", action="store_true",
+                        help="compare the estimates with the simulated results")
+    parser.add_argument("--serve", metavar="HOST:PORT", help="coordinate the sweep for remote workers")
+    parser.add_argument("--local-workers", type=int, default=0, help="workers started by the coordinator")
+    parser.add_argument("--connect", metavar="HOST:PORT", help="run points for a coordinator")
+    parser.add_argument("--authkey", default=os.environ.get("ASA_SWEEP_AUTHKEY") or None,
+                        help="secret key shared by the coordinator and its workers")
+    parser.add_argument("--lease", type=float, default=60,
+                        help="seconds without a heartbeat after which a point is run again")
+    args = parser.parse_args()
+    if args.connect is not None:
+        if args.authkey is None:
+            parser.error("--connect needs the key of the coordinator, set --authkey or ASA_SWEEP_AUTHKEY")
+        run_worker(work_queue.parse_address(args.connect), args.authkey.encode())
+    else:
+        run_sweep(args)
@@ -1,4 +1,5 @@
 #!/bin/sh -x
+# sweep.py runs the same sweep, storing the results and skipping the runs already done
 j=1
 while [ $j -lt 11 ]; do
     i=3
@@ -0,0 +1,11 @@
+"""
+conftest.py
+
+Makes the simulator packages importable from the tests, which import them the
+way main.py and sweep.py do, relative to the simulation directory.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
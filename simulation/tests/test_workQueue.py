@@ -0,0 +1,95 @@
+"""
+test_workQueue.py
+
+Tests of the WorkQueue leases, and of a Coordinator running a sweep with
+local workers, one of which is killed while running a point.
+"""
+
+import multiprocessing
+import threading
+import time
+
+import core.resultStore as results
+from core.workQueue import Coordinator, WorkQueue, work
+
+AUTHKEY = b"test-key"
+
+def fake_run(config):
+    """ Stands in for main.run_simulation, returns results derived from the settings
+    """
+    return {"generated": config["n"], "received": config["seed"]}
+
+def hang(config):
+    """ Stands in for a run that never ends
+    """
+    time.sleep(600)
+
+def test_stale_fail_is_ignored():
+    queue = WorkQueue([("k", {})], "v", lease_timeout=0.01, max_attempts=2)
+    assert queue.take("A")[0] == "k"
+    time.sleep(0.02)
+    # The lease of A has expired, B runs the point again
+    assert queue.take("B")[0] == "k"
+    queue.fail("A", "k", "error")
+    assert not queue.heartbeat("A", "k")
+    assert queue.status() == {"pending": 0, "leased": 1, "done": 0, "failed": 0}
+    assert queue.take("C") is None
+    queue.complete("B", "k", {"generated": 1})
+    assert queue.finished()
+    assert queue.status() == {"pending": 0, "leased": 0, "done": 1, "failed": 0}
+    assert queue.collect() == [("k", {"generated": 1})]
+
+def test_late_complete_of_failed_point():
+    queue = WorkQueue([("k", {})], "v", lease_timeout=0.01, max_attempts=2)
+    queue.take("A")
+    time.sleep(0.02)
+    queue.take("B")
+    queue.fail("B", "k", "error")
+    assert queue.failures() == {"k": "error"}
+    assert queue.finished()
+    # A was still running the point and completes it after all
+    queue.complete("A", "k", {"generated": 1})
+    assert queue.finished()
+    assert queue.failures() == {}
+    assert queue.status() == {"pending": 0, "leased": 0, "done": 1, "failed": 0}
+
+def test_sweep_survives_killed_worker(tmp_path):
+    configs = [{"n": n, "rate": 0.1, "runtime": 1000, "seed": seed}
+               for n in (3, 5) for seed in (1, 2, 3)]
+    coordinator = Coordinator(configs, ("127.0.0.1", 0), AUTHKEY, lease_timeout=0.5)
+    context = multiprocessing.get_context("spawn")
+    victim = context.Process(target=work, args=(coordinator.address, AUTHKEY),
+                             kwargs={"name": "victim", "idle_wait": 0.05, "run": hang})
+    victim.start()
+    deadline = time.monotonic() + 60
+    while coordinator.queue.status()["leased"] == 0:
+        assert time.monotonic() < deadline, "the worker never leased a point"
+        time.sleep(0.05)
+    victim.kill()
+    victim.join()
+
+    workers = [context.Process(target=work, args=(coordinator.address, AUTHKEY),
+                               kwargs={"name": f"worker{i}", "idle_wait": 0.05, "run": fake_run})
+               for i in range(2)]
+    for worker in workers:
+        worker.start()
+    path = str(tmp_path / "results.sqlite")
+    outcome = {}
+
+    def coordinate():
+        with results.ResultStore(path) as store:
+            outcome.update(coordinator.run(store, poll_interval=0.05))
+
+    runner = threading.Thread(target=coordinate)
+    runner.start()
+    runner.join(timeout=60)
+    assert not runner.is_alive(), "the coordinator did not finish"
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+    assert outcome == {}
+    with results.ResultStore(path) as store:
+        for config in configs:
+            metrics = store.get(config)
+            assert metrics["generated"] == config["n"]
+            assert metrics["received"] == config["seed"]